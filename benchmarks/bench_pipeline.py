@@ -0,0 +1,165 @@
+"""
+End-to-end benchmark of the meltyfat pipeline on synthetic HIKMICRO data.
+
+Stages: map_csv -> get_sampled_data -> detect_HoughCircles / detect_Thermal -> run_TempExtract (legacy / vectorized)
+Results are written as JSON so runs can be compared before upgrading.
+
+Example:
+    python benchmarks/bench_pipeline.py --duration 600 --fps 8 --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+
+from meltyfat import HikExcelExtractor, WellDetector, WellTempExtractor, SyntheticHikData, StageMetrics
+
+def time_stage(results, name, func, frames=0, nbytes=0, repeat=1):
+    """
+    Run func repeat times and record the best wall time of the stage.
+    """
+    best_sec = float("inf")
+    output = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = func()
+        best_sec = min(best_sec, time.perf_counter() - start)
+    results[name] = {
+        "seconds": best_sec,
+        "frames": frames,
+        "frames_per_sec": frames / best_sec if frames and best_sec > 0 else None,
+        "mb_per_sec": nbytes / 1e6 / best_sec if nbytes and best_sec > 0 else None
+    }
+    print(f"{name:<36} {best_sec:9.3f} s")
+    return output
+
+def match_wells(detected_wells, known_wells, max_dist):
+    """
+    Number of known wells with a detected centre within max_dist pixels.
+    """
+    matched = 0
+    for known in known_wells:
+        known_x, known_y = known["well_center"]
+        if any((well["well_center"][0] - known_x) ** 2 + (well["well_center"][1] - known_y) ** 2 <= max_dist ** 2 for well in detected_wells):
+            matched += 1
+    return matched
+
+def run_benchmark(args, work_dir):
+    generator = SyntheticHikData(seed=args.seed, layout=args.layout)
+    image_path = generator.write_plate_image(os.path.join(work_dir, "plate_reference.png"))
+    start = time.perf_counter()
+    vdo_csv = generator.write_vdo_csv(os.path.join(work_dir, "synthetic_video_Temperature Value.csv"),
+        duration_sec=args.duration, fps=args.fps, compression=args.compression)
+    generate_sec = time.perf_counter() - start
+    input_bytes = os.path.getsize(vdo_csv)
+
+    stages = {}
+    metrics = StageMetrics(trace_memory=args.trace_memory) # per stage records of the classes themselves
+
+    ## Mapping
+    extractor = HikExcelExtractor(vdo_csv, sample_sec=args.sample_sec, metrics=metrics)
+    time_stage(stages, "map_csv", extractor.map_csv, nbytes=input_bytes, repeat=args.repeat)
+    n_frames = len(extractor.sensor_frame_ls)
+    n_sampled = len(extractor.sampled_frames)
+    stages["map_csv"]["frames"] = n_frames
+    stages["map_csv"]["frames_per_sec"] = n_frames / stages["map_csv"]["seconds"]
+
+    ## Frame reading
+    frames = None
+    for engine in args.engines:
+        frames = time_stage(stages, f"get_sampled_data[{engine}]", lambda: extractor.get_sampled_data(engine=engine), frames=n_sampled, repeat=args.repeat)
+
+    ## Detection
+    detector = WellDetector(reference_img_path=image_path, metrics=metrics, layout=args.layout)
+    detected_wells = time_stage(stages, "detect_HoughCircles", lambda: detector.detect_HoughCircles(display=False), repeat=args.repeat) or []
+    known_wells = generator.get_detected_wells()
+    thermal_wells = time_stage(stages, "detect_Thermal", lambda: detector.detect_Thermal(frames[:5], display=False), repeat=args.repeat) or []
+    known_sensor_wells = [{"well_center": (int(x_coor * generator.sensor_width / generator.image_width), int(y_coor * generator.sensor_height / generator.image_height))}
+        for x_coor, y_coor in generator.well_centers]
+
+    ## Extraction, with the known wells so the stage does not depend on detection quality
+    def run_extract(engine):
+        temp_extractor = WellTempExtractor(image_path, known_wells, frames, work_dir, detect_window=args.detect_window, output_filename="bench_extracted.csv", metrics=metrics, layout=args.layout)
+        temp_extractor.run_TempExtract(engine=engine)
+        return temp_extractor
+    temp_extractor = None
+    for engine in args.extract_engines:
+        temp_extractor = time_stage(stages, f"run_TempExtract[{engine}]", lambda: run_extract(engine), frames=n_sampled, repeat=args.repeat)
+
+    ## Parsing and extraction straight from the recording, serial and with a process pool
+    def run_extract_vdo(workers=1, threads=0):
+        vdo_extractor = WellTempExtractor(image_path, known_wells, extractor, work_dir, detect_window=args.detect_window, output_filename="bench_extracted.csv", metrics=metrics, layout=args.layout)
+        vdo_extractor.run_TempExtract(workers=workers, threads=threads)
+        return vdo_extractor
+    for workers in sorted({1, args.workers}):
+        time_stage(stages, f"run_TempExtract[vdo, workers={workers}]", lambda: run_extract_vdo(workers=workers), frames=n_sampled, nbytes=input_bytes, repeat=args.repeat)
+    if args.threads > 0:
+        ## Threaded read -> compute -> write, with the queue stats of the last run
+        pipelined_extractor = time_stage(stages, f"run_TempExtract[vdo, threads={args.threads}]", lambda: run_extract_vdo(threads=args.threads), frames=n_sampled, nbytes=input_bytes, repeat=args.repeat)
+        stages[f"run_TempExtract[vdo, threads={args.threads}]"]["pipeline"] = pipelined_extractor.get_pipeline_stats()
+    time_stage(stages, "get_extractedCSV", temp_extractor.get_extractedCSV, frames=n_sampled)
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "input": {
+            "bytes": input_bytes,
+            "frames": n_frames,
+            "sampled_frames": n_sampled,
+            "generate_seconds": generate_sec
+        },
+        "detection": {
+            "known_wells": len(known_wells),
+            "detected_wells": len(detected_wells),
+            "matched_wells": match_wells(detected_wells, known_wells, max_dist=generator.well_radius_px / 2),
+            "thermal_detected_wells": len(thermal_wells),
+            "thermal_matched_wells": match_wells(thermal_wells, known_sensor_wells, max_dist=1.5)
+        },
+        "stages": stages,
+        "stage_metrics": metrics.summary()
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=120, help="Recording length in seconds")
+    parser.add_argument("--fps", type=float, default=8.0, help="Recording frame rate")
+    parser.add_argument("--sample-sec", type=int, default=1, help="HikExcelExtractor sample_sec")
+    parser.add_argument("--detect-window", type=int, default=3, help="WellTempExtractor detect_window")
+    parser.add_argument("--compression", choices=["gzip", "zstd"], default=None, help="Compress the synthetic recording")
+    parser.add_argument("--engines", nargs="+", default=["pandas", "stream"], help="get_sampled_data engines to time")
+    parser.add_argument("--extract-engines", nargs="+", default=["legacy", "vectorized"], help="run_TempExtract engines to time")
+    parser.add_argument("--workers", type=int, default=1, help="Also time run_TempExtract from the recording with this many processes")
+    parser.add_argument("--threads", type=int, default=0, help="Also time the threaded run_TempExtract pipeline with this many compute threads")
+    parser.add_argument("--layout", type=int, choices=[24, 48, 96, 384], default=96, help="Number of wells of the synthetic plate")
+    parser.add_argument("--repeat", type=int, default=1, help="Repeat each stage and keep the best time")
+    parser.add_argument("--trace-memory", action="store_true", help="Record tracemalloc peaks per stage (slower)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="Keep the generated data here instead of a temporary directory")
+    parser.add_argument("--output", default=None, help="JSON results file, printed to stdout when omitted")
+    args = parser.parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="meltyfat_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        results = run_benchmark(args, work_dir)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, mode="w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Success: Results saved to {args.output}")
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""
+Golden-output check of the meltyfat engines against a frozen copy of the baseline code (golden_reference.py).
+
+The reference shares no code with the package, so a regression in code used by every engine still shows.
+Every check runs the reference and each engine on the same input, compares the outputs
+(exact by default, see --rtol / --atol) and records the speedup and tracemalloc peak memory ratio:
+
+    sample_norm_tst    baseline linear scan      -> nearest_norm_idx on irregular timestamps (ties, repeats, gaps)
+    map_csv            baseline regex scan       -> header scan, compressed recording
+    get_sampled_data   baseline pd.read_csv      -> "pandas", "stream", compressed recording
+    iter_frame_arrays  baseline pd.read_csv      -> frames after a truncated frame, compressed recording
+    map_well_ids       baseline 96-well labels   -> PlateLayout labels
+    get_extractedDF    baseline run_TempExtract  -> legacy and vectorized frame list, recording, process pool,
+                                                    pipeline threads, compressed recording, ROI parsing,
+                                                    drift tracking of a plate moved by --drift-shift
+    get_sensor_temp    baseline get_sensor_temp  -> WellAnalyzer.get_sensor_temp, WellAnalyzer.get_sensor_temps
+    export             CSV round trip (timing)   -> compact file, must give back the baseline DataFrame
+Inputs are synthetic plates (--layouts) and recorded HIKMICRO CSVs (--recording, wells found with detect_Thermal).
+The exit code is 1 when any output differs from its reference or, with --baseline, a check got slower
+than --max-slowdown times its baseline time, so it can gate a merge.
+
+Example:
+    python benchmarks/golden_check.py --layouts 24 96 384 --recording 20240510_124546_thm.csv --output golden.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+import cv2
+import numpy as np
+import pandas as pd
+
+import golden_reference # Frozen baseline code
+from meltyfat import HikExcelExtractor, HikDataManager, WellAnalyzer, WellDetector, WellTempExtractor, SyntheticHikData
+
+def measure(func, repeat=1, trace_memory=True):
+    """
+    Best wall time of repeat runs, then the tracemalloc peak of one more run.
+    return
+        output, seconds, peak memory bytes (None without trace_memory)
+    """
+    best_sec = float("inf")
+    output = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = func()
+        best_sec = min(best_sec, time.perf_counter() - start)
+    peak_bytes = None
+    if trace_memory:
+        output = None # the kept output would count as a baseline, not as peak
+        tracemalloc.start()
+        try:
+            output = func()
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return output, best_sec, peak_bytes
+
+def compare_values(reference, output, rtol=0.0, atol=0.0):
+    """
+    Element-wise comparison of two numeric arrays, NaN equals NaN.
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    output = np.asarray(output, dtype=np.float64)
+    if reference.shape != output.shape:
+        return {"equal": False, "mismatches": None, "max_abs_diff": None, "note": f"shape {output.shape} != {reference.shape}"}
+    close = np.isclose(output, reference, rtol=rtol, atol=atol, equal_nan=True)
+    both = ~np.isnan(reference) & ~np.isnan(output)
+    max_abs_diff = float(np.max(np.abs(output[both] - reference[both]))) if both.any() else 0.0
+    return {"equal": bool(close.all()), "mismatches": int((~close).sum()), "max_abs_diff": max_abs_diff}
+
+def compare_frames(reference_frames, frames, rtol=0.0, atol=0.0):
+    """
+    get_sampled_data() lists: same timestamps and frame values.
+    """
+    if [(a_frame["date"], a_frame["time"]) for a_frame in frames] != [(a_frame["date"], a_frame["time"]) for a_frame in reference_frames]:
+        return {"equal": False, "mismatches": None, "max_abs_diff": None, "note": "timestamps differ"}
+    return compare_values([a_frame["data"] for a_frame in reference_frames], [a_frame["data"] for a_frame in frames], rtol, atol)
+
+def compare_dfs(reference_df, output_df, rtol=0.0, atol=0.0):
+    """
+    get_extractedDF() frames: same columns and Date / Time, well temperatures within tolerance.
+    """
+    if output_df is None or list(output_df.columns) != list(reference_df.columns):
+        return {"equal": False, "mismatches": None, "max_abs_diff": None, "note": "columns differ"}
+    if not (output_df[["Date", "Time"]].astype(str).to_numpy() == reference_df[["Date", "Time"]].astype(str).to_numpy()).all():
+        return {"equal": False, "mismatches": None, "max_abs_diff": None, "note": "timestamps differ"}
+    return compare_values(reference_df.iloc[:, 2:].to_numpy(dtype=np.float64), output_df.iloc[:, 2:].to_numpy(dtype=np.float64), rtol, atol)
+
+class GoldenCheck:
+    """
+    Collect check results of one input, each engine is compared against the reference of its check.
+    """
+    def __init__(self, input_name, args):
+        self.input_name = input_name
+        self.args = args
+        self.results = []
+
+    def run(self, check, engine, reference, func, compare):
+        """
+        reference -> {"engine": name, "output": ..., "seconds": ..., "peak_memory_bytes": ...}
+        """
+        output, seconds, peak_bytes = measure(func, repeat=self.args.repeat, trace_memory=not self.args.no_memory)
+        result = {
+            "input": self.input_name,
+            "check": check,
+            "engine": engine,
+            "reference": reference["engine"],
+            **compare(reference["output"], output, self.args.rtol, self.args.atol),
+            "seconds": seconds,
+            "reference_seconds": reference["seconds"],
+            "speedup": reference["seconds"] / seconds if seconds > 0 else None,
+            "peak_memory_bytes": peak_bytes,
+            "reference_peak_memory_bytes": reference["peak_memory_bytes"],
+            "memory_ratio": peak_bytes / reference["peak_memory_bytes"] if peak_bytes and reference["peak_memory_bytes"] else None
+        }
+        self.results.append(result)
+        speedup = f"{result['speedup']:8.2f}x" if result["speedup"] else f"{'-':>9}"
+        memory = f"{result['memory_ratio']:6.2f}x" if result["memory_ratio"] else f"{'-':>7}"
+        status = "ok" if result["equal"] else f"DIFF ({result['mismatches']} values, max {result['max_abs_diff']}) {result.get('note', '')}"
+        print(f"{self.input_name:<24} {check:<18} {engine:<22} {speedup} {memory}  {status}")
+        return output
+
+    def reference(self, engine, func):
+        output, seconds, peak_bytes = measure(func, repeat=self.args.repeat, trace_memory=not self.args.no_memory)
+        return {"engine": engine, "output": output, "seconds": seconds, "peak_memory_bytes": peak_bytes}
+
+def compare_keys(reference, output, rtol=0.0, atol=0.0):
+    """
+    Lists that must be identical, e.g. sampled frame indexes.
+    """
+    if len(output) != len(reference):
+        return {"equal": False, "mismatches": None, "max_abs_diff": None, "note": f"length {len(output)} != {len(reference)}"}
+    mismatches = sum(out_key != ref_key for out_key, ref_key in zip(output, reference))
+    return {"equal": mismatches == 0, "mismatches": mismatches, "max_abs_diff": None}
+
+def frame_keys(frames):
+    return [(a_frame["index"], a_frame["timestamp"].isoformat()) for a_frame in frames]
+
+def check_sampling(golden, args):
+    """
+    HikExcelExtractor.nearest_norm_idx() against the baseline linear scan on irregular timestamps:
+    jitter, dropped frames, repeated timestamps and frames exactly between two targets (ties).
+    """
+    rng = np.random.default_rng(args.seed)
+    intervals = rng.uniform(0.05, 0.25, 5000).round(3)
+    intervals[rng.choice(len(intervals), 50, replace=False)] = 0.0 # repeated timestamps
+    intervals[rng.choice(len(intervals), 20, replace=False)] = 7.5 # gaps
+    norm = np.concatenate([[0.0], np.cumsum(intervals)])
+    norm = np.sort(np.concatenate([norm, np.arange(0.5, norm[-1], 1.0)])) # ties at half seconds
+    tst_ls = [{"normalize": float(norm_sec), "index": idx} for idx, norm_sec in enumerate(norm)]
+    for sample_sec in (1, 2, 5, 30):
+        sampling_ref = golden.reference("linear scan", lambda: [a_frame["index"] for a_frame in golden_reference.sample_norm_tst(tst_ls, sample_sec)])
+        golden.run("sample_norm_tst", f"nearest_norm_idx, {sample_sec} s", sampling_ref, lambda: HikExcelExtractor.nearest_norm_idx(norm, sample_sec).tolist(), compare_keys)
+
+def check_truncated(golden, vdo_csv, work_dir, args, kept_rows=96):
+    """
+    Consecutive frames around a truncated frame (only kept_rows of its rows left) read from one
+    gzip chunk, so the stream runs straight from the damaged frame into the next ones.
+    The frames after it must match the baseline, the damaged frame itself is left out.
+    """
+    extractor = HikExcelExtractor(vdo_csv, sample_sec=args.sample_sec)
+    extractor.map_csv()
+    damaged = len(extractor.frame_index) // 2
+    cut_start = int(extractor.frame_index[damaged]) + 1 + kept_rows
+    cut_end = int(extractor.frame_index[damaged]) + 1 + extractor.sensor_pixel_nrows
+    truncated_csv = os.path.join(work_dir, "truncated_" + os.path.basename(vdo_csv))
+    with open(vdo_csv, mode="rb") as src, open(truncated_csv, mode="wb") as dst:
+        dst.writelines(line for idx, line in enumerate(src) if not cut_start <= idx < cut_end)
+    compressed_csv = HikDataManager.compress_vdo_csv(truncated_csv, output_path=truncated_csv + ".gz", frames_per_chunk=len(extractor.frame_index))
+
+    all_frames = golden_reference.map_csv(truncated_csv, args.sample_sec)[0]
+    window = [a_frame for a_frame in all_frames[max(damaged - 2, 0):damaged + 4] if a_frame["frame"] != damaged]
+    truncated_ref = golden.reference("baseline", lambda: [a_frame["data"] for a_frame in golden_reference.get_sampled_data(truncated_csv, window)])
+    compressed_extractor = HikExcelExtractor(compressed_csv, sample_sec=args.sample_sec)
+    compressed_extractor.map_csv()
+    def read_window():
+        frames = compressed_extractor.sensor_frame_ls[max(damaged - 2, 0):damaged + 4]
+        return [data for a_frame, data in compressed_extractor.iter_frame_arrays(frames) if a_frame["frame"] != damaged]
+    golden.run("iter_frame_arrays", "truncated frame, gzip", truncated_ref, read_window, compare_values)
+
+def check_input(golden, vdo_csv, image_path, wells, layout, work_dir, args):
+    """
+    Run every check on one recording against the frozen baseline (golden_reference.py).
+    image_path None -> wells are in sensor coordinates.
+    """
+    compressed_csv = HikDataManager.compress_vdo_csv(vdo_csv, output_path=os.path.join(work_dir, os.path.basename(vdo_csv) + ".gz"))
+    extractor = HikExcelExtractor(vdo_csv, sample_sec=args.sample_sec)
+    compressed_extractor = HikExcelExtractor(compressed_csv, sample_sec=args.sample_sec)
+
+    ## Frame index and sampling
+    def map_frames(vdo_extractor):
+        vdo_extractor.map_csv()
+        return frame_keys(vdo_extractor.sampled_frames)
+    map_ref = golden.reference("baseline", lambda: golden_reference.map_csv(vdo_csv, args.sample_sec))
+    sampled_frames = map_ref["output"][1]
+    map_ref["output"] = frame_keys(sampled_frames)
+    golden.run("map_csv", "header scan", map_ref, lambda: map_frames(extractor), compare_keys)
+    golden.run("map_csv", "header scan, gzip", map_ref, lambda: map_frames(compressed_extractor), compare_keys)
+
+    ## Frame reading
+    sampled_ref = golden.reference("baseline", lambda: golden_reference.get_sampled_data(vdo_csv, sampled_frames))
+    golden.run("get_sampled_data", "pandas", sampled_ref, lambda: extractor.get_sampled_data(engine="pandas"), compare_frames)
+    golden.run("get_sampled_data", "stream", sampled_ref, lambda: extractor.get_sampled_data(engine="stream"), compare_frames)
+    golden.run("get_sampled_data", "stream, gzip", sampled_ref, lambda: compressed_extractor.get_sampled_data(engine="stream"), compare_frames)
+    check_truncated(golden, vdo_csv, work_dir, args)
+    frames = sampled_ref["output"]
+
+    ## Well labelling (the baseline only knows 96-well plates)
+    temp_extractor = WellTempExtractor(image_path, wells, frames, work_dir, detect_window=args.detect_window, layout=layout)
+    labelled_wells = temp_extractor.get_labelled_wells()
+    if temp_extractor.get_layout().n_wells == 96:
+        labels_ref = golden.reference("baseline", lambda: [(a_well["well_id"], tuple(a_well["well_center"])) for a_well in golden_reference.map_well_ids(wells)])
+        golden.run("map_well_ids", "layout", labels_ref, lambda: [(a_well["well_id"], tuple(a_well["well_center"])) for a_well in temp_extractor.get_labelled_wells()], compare_keys)
+        labelled_wells = golden_reference.map_well_ids(wells)
+
+    ## Extraction
+    def extract(frame_data, engine="vectorized", workers=1, threads=0, drift=False):
+        temp_extractor = WellTempExtractor(image_path, wells, frame_data, work_dir, detect_window=args.detect_window, output_filename="golden_extracted.csv", layout=layout)
+        if drift:
+            temp_extractor.set_drift_tracking(update_every=1)
+        temp_extractor.run_TempExtract(engine=engine, workers=workers, threads=threads)
+        return temp_extractor
+    extract_ref = golden.reference("baseline", lambda: pd.DataFrame(golden_reference.run_TempExtract(image_path, labelled_wells, frames, detect_window=args.detect_window)))
+    golden.run("get_extractedDF", "legacy", extract_ref, lambda: extract(frames, engine="legacy").get_extractedDF(), compare_dfs)
+    golden.run("get_extractedDF", "vectorized", extract_ref, lambda: extract(frames).get_extractedDF(), compare_dfs)
+    golden.run("get_extractedDF", "recording", extract_ref, lambda: extract(extractor).get_extractedDF(), compare_dfs)
+    if args.workers > 1:
+        golden.run("get_extractedDF", f"recording, workers={args.workers}", extract_ref, lambda: extract(extractor, workers=args.workers).get_extractedDF(), compare_dfs)
+    for threads in sorted({1, args.threads}):
+        golden.run("get_extractedDF", f"recording, threads={threads}", extract_ref, lambda: extract(extractor, threads=threads).get_extractedDF(), compare_dfs)
+    golden.run("get_extractedDF", "recording, gzip", extract_ref, lambda: extract(compressed_extractor).get_extractedDF(), compare_dfs)
+
+    ## Sensor coordinates of the wells as the baseline maps them
+    image = cv2.imread(image_path) if image_path else None
+    sensor_coordinates = [golden_reference.map_sensor_coordinate(image, pd.DataFrame(frames[0]["data"]), *a_well["well_center"]) for a_well in labelled_wells]
+    sensor_xs, sensor_ys = np.array(sensor_coordinates).T
+    roi_extractor = HikExcelExtractor(vdo_csv, sample_sec=args.sample_sec)
+    roi_extractor.map_csv()
+    roi_extractor.set_roi(list(zip(sensor_xs, sensor_ys)), detect_window=args.detect_window)
+    golden.run("get_extractedDF", "recording, ROI", extract_ref, lambda: extract(roi_extractor).get_extractedDF(), compare_dfs)
+
+    ## Drift tracking: the plate moves by --drift-shift pixels halfway, tracked wells must read the unmoved plate
+    shift_x, shift_y = args.drift_shift
+    shifted_frames = [a_frame if idx < len(frames) // 2 else {**a_frame, "data": np.roll(np.asarray(a_frame["data"]), (shift_y, shift_x), axis=(0, 1)).tolist()}
+        for idx, a_frame in enumerate(frames)]
+    golden.run("get_extractedDF", "moved plate, drift", extract_ref, lambda: extract(shifted_frames, drift=True).get_extractedDF(), compare_dfs)
+    golden.run("get_extractedDF", "moved plate, drift, threads=1", extract_ref, lambda: extract(shifted_frames, threads=1, drift=True).get_extractedDF(), compare_dfs)
+
+    ## Export: CSV round trip against the compact file
+    vectorized_extractor = extract(frames)
+    csv_path = os.path.join(work_dir, "golden_extracted.csv")
+    def csv_round_trip():
+        vectorized_extractor.get_extractedCSV()
+        return pd.read_csv(csv_path)
+    export_ref = golden.reference("csv", csv_round_trip)
+    export_ref["output"] = extract_ref["output"] # the compact file must give back the extracted DataFrame
+    golden.run("export", "compact", export_ref, lambda: HikDataManager.read_compact(vectorized_extractor.get_extractedCompact()), compare_dfs)
+
+    ## Well statistics of single frames
+    stat_frames = [np.asarray(a_frame["data"], dtype=np.float64) for a_frame in frames[:args.stat_frames]]
+    def baseline_stats():
+        results = []
+        for data in stat_frames:
+            sensor_df = pd.DataFrame(data)
+            results.append([golden_reference.get_sensor_temp(sensor_df, int(x_coor), int(y_coor), detect_window=args.detect_window, precision=2)
+                for x_coor, y_coor in zip(sensor_xs, sensor_ys)])
+        return np.array(results, dtype=np.float64) # frames, wells, (mean, sd)
+    def legacy_stats():
+        return np.array([[WellAnalyzer.get_sensor_temp(pd.DataFrame(data), int(x_coor), int(y_coor), detect_window=args.detect_window, precision=2)
+            for x_coor, y_coor in zip(sensor_xs, sensor_ys)] for data in stat_frames], dtype=np.float64)
+    def vectorized_stats():
+        return np.array([np.stack(WellAnalyzer.get_sensor_temps(data, sensor_xs, sensor_ys, detect_window=args.detect_window, precision=2), axis=-1)
+            for data in stat_frames], dtype=np.float64)
+    stats_ref = golden.reference("baseline", baseline_stats)
+    golden.run("get_sensor_temp", "get_sensor_temp", stats_ref, legacy_stats, compare_values)
+    golden.run("get_sensor_temp", "get_sensor_temps", stats_ref, vectorized_stats, compare_values)
+
+def check_regressions(results, baseline_path, max_slowdown):
+    """
+    Checks slower than max_slowdown times the same check of a previous run.
+    """
+    with open(baseline_path, mode="r") as file:
+        baseline = {(result["input"], result["check"], result["engine"]): result for result in json.load(file)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["input"], result["check"], result["engine"]))
+        if previous is not None and result["seconds"] > previous["seconds"] * max_slowdown:
+            regressions.append({**{key: result[key] for key in ("input", "check", "engine", "seconds")}, "baseline_seconds": previous["seconds"]})
+            print(f"Slower: {result['input']} {result['check']} {result['engine']} {result['seconds']:.3f} s (baseline {previous['seconds']:.3f} s)")
+    return regressions
+
+def run_checks(args, work_dir):
+    results = []
+    errors = []
+    golden = GoldenCheck("sampling", args)
+    check_sampling(golden, args)
+    results.extend(golden.results)
+
+    for n_wells in args.layouts:
+        golden = GoldenCheck(f"synthetic-{n_wells}", args)
+        generator = SyntheticHikData(seed=args.seed, layout=n_wells)
+        input_dir = os.path.join(work_dir, golden.input_name)
+        os.makedirs(input_dir, exist_ok=True)
+        image_path = generator.write_plate_image(os.path.join(input_dir, "plate_reference.png"))
+        vdo_csv = generator.write_vdo_csv(os.path.join(input_dir, "20240510_124546_thm.csv"), duration_sec=args.duration, fps=args.fps)
+        check_input(golden, vdo_csv, image_path, generator.get_detected_wells(), n_wells, input_dir, args)
+        results.extend(golden.results)
+
+    for vdo_csv in args.recording:
+        golden = GoldenCheck(os.path.basename(vdo_csv), args)
+        input_dir = os.path.join(work_dir, golden.input_name)
+        os.makedirs(input_dir, exist_ok=True)
+        extractor = HikExcelExtractor(vdo_csv, sample_sec=args.sample_sec)
+        extractor.map_csv()
+        detector = WellDetector(layout=args.recording_layout)
+        wells = detector.detect_Thermal(extractor.get_sampled_data(engine="stream")[:5], display=False)
+        if not wells:
+            errors.append({"input": golden.input_name, "error": "no wells detected"})
+            print(f"{golden.input_name:<24} skipped: no wells detected")
+            continue
+        check_input(golden, vdo_csv, None, wells, args.recording_layout, input_dir, args)
+        results.extend(golden.results)
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "results": results,
+        "errors": errors
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--layouts", type=int, nargs="*", choices=[24, 48, 96, 384], default=[96], help="Synthetic plates to check")
+    parser.add_argument("--recording", nargs="*", default=[], help="Recorded HIKMICRO video CSVs to check")
+    parser.add_argument("--recording-layout", type=int, choices=[24, 48, 96, 384], default=96, help="Plate of the recordings")
+    parser.add_argument("--duration", type=float, default=60, help="Synthetic recording length in seconds")
+    parser.add_argument("--fps", type=float, default=8.0, help="Synthetic recording frame rate")
+    parser.add_argument("--sample-sec", type=int, default=1, help="HikExcelExtractor sample_sec")
+    parser.add_argument("--detect-window", type=int, default=3, help="WellTempExtractor detect_window")
+    parser.add_argument("--stat-frames", type=int, default=10, help="Frames for the single well statistics check")
+    parser.add_argument("--workers", type=int, default=2, help="Processes of the parallel extraction check, 1 skips it")
+    parser.add_argument("--threads", type=int, default=2, help="Compute threads of the pipeline check (threads=1 is always checked)")
+    parser.add_argument("--drift-shift", type=int, nargs=2, default=[3, 2], metavar=("DX", "DY"), help="Plate movement of the drift tracking check in sensor pixels")
+    parser.add_argument("--rtol", type=float, default=0.0, help="Relative tolerance, 0 -> exact")
+    parser.add_argument("--atol", type=float, default=0.0, help="Absolute tolerance, 0 -> exact")
+    parser.add_argument("--repeat", type=int, default=1, help="Repeat each run and keep the best time")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc runs (worker processes are never traced)")
+    parser.add_argument("--baseline", default=None, help="Previous JSON results, checks slower than --max-slowdown fail")
+    parser.add_argument("--max-slowdown", type=float, default=1.5, help="Allowed time factor against --baseline")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="Keep the generated data here instead of a temporary directory")
+    parser.add_argument("--output", default=None, help="JSON results file")
+    args = parser.parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="meltyfat_golden_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        report = run_checks(args, work_dir)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    report["regressions"] = check_regressions(report["results"], args.baseline, args.max_slowdown) if args.baseline else []
+
+    if args.output:
+        with open(args.output, mode="w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Success: Results saved to {args.output}")
+
+    failed = [result for result in report["results"] if not result["equal"]]
+    if failed or report["regressions"] or report["errors"]:
+        print(f"Failed: {len(failed)} outputs differ from the reference, {len(report['regressions'])} slower than the baseline, {len(report['errors'])} errors")
+        return 1
+    print(f"Success: {len(report['results'])} outputs match the reference")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""
+Frozen copy of the meltyfat baseline code paths, the golden reference of golden_check.py.
+
+These functions are the first release of HikExcelExtractor.map_csv() / get_sampled_data(),
+WellAnalyzer.map_well_ids() / map_sensor_coordinate() / get_sensor_temp() and
+WellTempExtractor.run_TempExtract(), with the class state passed as arguments.
+They share no code with the package, so a regression in code used by all package engines
+cannot also change the reference. Do not update them to follow the package.
+
+Like the baseline: plain VDO CSVs only, 96-well labelling only.
+"""
+import re
+import cv2
+import string
+import pandas as pd
+from datetime import datetime, timedelta
+
+SENSOR_PIXEL_NROWS = 192
+ENCODING = "utf-8-sig"
+
+### HikExcelExtractor
+def get_timestamp(vdo_tst):
+    tst_pattern = r"time:(\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}\.\d{3})"
+    match = re.search(tst_pattern, vdo_tst)
+    if match:
+        tst_part = match.group(1)
+        timestamp = datetime.strptime(tst_part, "%Y/%m/%d %H:%M:%S.%f")
+        return timestamp
+    else:
+        return None
+
+def tst_delta_seconds(tst, ref_tst):
+    delta = tst - ref_tst
+    return delta.total_seconds()
+
+def nearest_norm_tst(tst_ls, target_sec):
+    nearest_tst = None
+    smallest_diff = float("inf")
+    for frame in tst_ls:
+        diff = abs(frame["normalize"] - target_sec)
+        if diff < smallest_diff:
+            smallest_diff = diff
+            nearest_tst = frame # Dict
+    return nearest_tst
+
+def sample_norm_tst(tst_ls, sample_sec):
+    sampled_frames = []
+    norm_start = 0.0 # Starter
+    target_norm_sec = norm_start # Starter from 0.0 + sample_sec
+    while target_norm_sec <= tst_ls[-1]["normalize"]: # Boundary is the last normalized seconds
+        nearest_frame = nearest_norm_tst(tst_ls, target_norm_sec)
+        if nearest_frame:
+            sampled_frames.append(nearest_frame)
+        target_norm_sec += sample_sec
+    return sampled_frames
+
+def extract_dt(dt):
+    date_part = dt.date()
+    if dt.microsecond >= 500000:
+        dt += timedelta(seconds=1)
+    time_part = dt.time().replace(microsecond=0)
+    return date_part, time_part
+
+def map_csv(vdo_csv, sample_sec):
+    """
+    return
+        (every frame, sampled frames) as lists of {"timestamp", "normalize", "index", "frame"}
+    """
+    sensor_frame_ls = []
+    ref_tst = None
+    with open(vdo_csv, mode="r", encoding=ENCODING) as file:
+        counter = 0
+        tst_pattern = r"time:\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}\.\d{3}\s*"
+
+        ## Loop to map location of timestamp and row
+        for idx, line in enumerate(file):
+            first_col = line.strip().split(",")[0].strip()
+
+            ## If match with timestamp
+            if re.match(tst_pattern, first_col):
+                if counter == 0:
+                    ref_tst = get_timestamp(first_col)
+                sensor_frame_ls.append({
+                    "timestamp": get_timestamp(first_col),
+                    "normalize": tst_delta_seconds(get_timestamp(first_col), ref_tst),
+                    "index": idx, # csv index
+                    "frame": counter # frame count
+                })
+                counter += 1
+    return sensor_frame_ls, sample_norm_tst(sensor_frame_ls, sample_sec)
+
+def get_sampled_data(vdo_csv, sampled_frames):
+    extracted_frames_ls = []
+    for a_frame in sampled_frames:
+        temp_df = pd.read_csv(
+            vdo_csv,
+            skiprows=a_frame["index"] + 1,
+            nrows=SENSOR_PIXEL_NROWS,
+            delimiter=",",
+            header=None
+        )
+        temp_df = temp_df.iloc[:, :-1] # Remove the last column
+        date_part, time_part = extract_dt(a_frame["timestamp"])
+        extracted_frames_ls.append({
+            "date": date_part.strftime("%Y-%m-%d"), # 2024-08-18
+            "time": time_part.strftime("%H:%M:%S"), # 15:07:59
+            "data": temp_df.values.tolist()
+        })
+    return extracted_frames_ls
+
+### WellAnalyzer
+def map_well_ids(detected_wells_dict, invert_image=False):
+    mapped_wells = []
+    row_names = list(string.ascii_uppercase[:8]) # 'A -> H'
+    if invert_image:
+        row_names = row_names[::-1] # Invert to 'H -> A'
+    sorted_by_coordinates = sorted(detected_wells_dict, key=lambda k: k["well_center"]) # Sorted by coordinates
+    for well_column_idx in range(12): # From column '1 -> 12'
+        start_idx = 8 * well_column_idx
+        end_idx = 8 * (well_column_idx + 1)
+        sorted_by_row = sorted(sorted_by_coordinates[start_idx:end_idx], key=lambda k: k["well_center"][1]) # Sort wells by row
+
+        for well_row_idx, current_well in enumerate(sorted_by_row): # Loop 8 rows
+            if invert_image:
+                well_id = row_names[well_row_idx] + f"{12 - well_column_idx:02d}" # Well id from H12 to A1
+                well_column = 12 - well_column_idx
+            else:
+                well_id = row_names[well_row_idx] + f"{well_column_idx + 1:02d}" # Well id from A1 to H12
+                well_column = well_column_idx + 1
+            mapped_wells.append({
+                "well_id": well_id,
+                "well_row": row_names[well_row_idx],
+                "well_column": well_column,
+                "well_center": current_well["well_center"],
+                "well_radius": current_well["well_radius"],
+                "confidence": current_well["confidence"]
+            })
+    return mapped_wells
+
+def map_sensor_coordinate(image, sensor_temp_df, x_coor, y_coor):
+    """
+    image None -> wells in sensor coordinates (WellDetector.detect_Thermal(), added after the baseline)
+    """
+    if image is None:
+        return int(x_coor), int(y_coor)
+    img_height, img_width, color_channels = image.shape # Reference Image
+    sensor_height, sensor_width = sensor_temp_df.shape # Data frame
+    x_scale = sensor_width / img_width
+    y_scale = sensor_height / img_height
+    return int(x_coor * x_scale), int(y_coor * y_scale)
+
+def get_sensor_temp(sensor_temp_df, x_coor, y_coor, detect_window=0, precision=2):
+    detect_window_limit = 5
+    detect_window = min(max(detect_window, 0), detect_window_limit) # set boundary
+
+    if (x_coor or y_coor) < 0 or (x_coor >= sensor_temp_df.shape[1] or y_coor >= sensor_temp_df.shape[0]):
+        raise ValueError("Error: Provided coordinates are out of bounds.")
+
+    ## Define Slice Boundaries
+    start_x = max(0, x_coor - detect_window)
+    end_x = min(sensor_temp_df.shape[1], x_coor + detect_window + 1)
+    start_y = max(0, y_coor - detect_window)
+    end_y = min(sensor_temp_df.shape[0], y_coor + detect_window + 1)
+
+    sensor_window = sensor_temp_df.iloc[start_y:end_y, start_x:end_x]
+
+    ## Remove Outliers base on IQR
+    Q1 = sensor_window.quantile(0.25) # Q1 Lower
+    Q3 = sensor_window.quantile(0.75) # Q2 Upper
+    IQR = Q3 - Q1
+    lower_bound = Q1 - (1.5 * IQR)
+    upper_bound = Q3 + (1.5 * IQR)
+
+    filtered_sensor_window = sensor_window[(sensor_window >= lower_bound) & (sensor_window <= upper_bound)].dropna()
+
+    ## Apply stack() as it is a matrix
+    avg_well_temp = round(filtered_sensor_window.stack().mean(), precision)
+    sd_well_temp = round(filtered_sensor_window.stack().std(), precision)
+    return avg_well_temp, sd_well_temp
+
+### WellTempExtractor
+def run_TempExtract(ref_image_path, labelled_wells, frames_data_list, detect_window=3):
+    """
+    labelled_wells -> {"well_id": "A01", "well_center": (x, y)} of every well
+    return
+        extracted rows {"Date", "Time", "A1", ...} (WellTempExtractor.extracted_well_data)
+    """
+    image = cv2.imread(ref_image_path) if ref_image_path else None
+    extracted_well_data = []
+    for a_frame in frames_data_list:
+        data_df = pd.DataFrame(a_frame["data"]) # Convert into dataframe
+        frame_detected_wells = dict() # for this frame
+
+        for a_well in labelled_wells:
+            ## Format name from A01 to A1
+            well_id = f"{a_well['well_id'][0]}{int(a_well['well_id'][1:])}"
+            well_coordinate = a_well["well_center"]
+            sensor_x, sensor_y = map_sensor_coordinate(image, data_df, well_coordinate[0], well_coordinate[1])
+            avg_well_temp, sd_well_temp = get_sensor_temp(data_df, sensor_x, sensor_y, detect_window=detect_window, precision=2)
+            frame_detected_wells[well_id] = avg_well_temp
+
+        sorted_wells = dict(sorted(frame_detected_wells.items(), key=lambda item: (item[0][0], int(item[0][1:])))) # A1
+        extracted_well_data.append({
+            "Date": a_frame["date"],
+            "Time": a_frame["time"],
+            **sorted_wells
+        })
+    return extracted_well_data
@@ -29,5 +29,8 @@ setup(
         "opencv-python",
         "matplotlib"
     ],
+    extras_require={
+        "zstd": ["zstandard"], # .csv.zst input
+    },
     python_requires=">=3.11",
 )
\ No newline at end of file
@@ -4,6 +4,14 @@ from .welldetector import WellDetector
 from .wellanalyzer import WellAnalyzer 
 from .datamanager import HikDataManager 
 from .welltempextractor import WellTempExtractor
+from .synthetic import SyntheticHikData
+from .metrics import StageMetrics, enable_logging
+from .platelayout import PlateLayout, get_plate_layout
+from .resultstore import WellResultStore
+from .timepyramid import WellTimePyramid
+from .resultserver import WellResultServer
+from .checkpoint import ExtractionCheckpoint
+from .pipeline import FramePipeline
 
 ## define when import *
 __all__ = [
@@ -11,5 +19,15 @@ __all__ = [
     "WellDetector", 
     "WellAnalyzer", 
     "HikDataManager", 
-    "WellTempExtractor"
+    "WellTempExtractor",
+    "SyntheticHikData",
+    "StageMetrics",
+    "enable_logging",
+    "PlateLayout",
+    "get_plate_layout",
+    "WellResultStore",
+    "WellTimePyramid",
+    "WellResultServer",
+    "ExtractionCheckpoint",
+    "FramePipeline"
     ]
\ No newline at end of file
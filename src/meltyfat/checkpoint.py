@@ -0,0 +1,221 @@
+import os
+import io
+import json
+import time
+import hashlib
+import logging
+import numpy as np
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class ExtractionCheckpoint:
+    """
+    Class to make long map_csv() + run_TempExtract() jobs resumable after a crash or restart.
+
+    A checkpoint directory holds:
+        map.npz     -> frame index of the VDO CSV (line, byte offset, timestamp of every frame) built so far
+        rows.jsonl  -> extracted rows (frame, date, time, mean and sd of every well), append only
+        state.json  -> committed rows, last processed frame / byte offset and the job key
+
+    Every file is replaced atomically (write, fsync, rename) and rows past the last commit are
+    dropped on resume, so a job killed at any point restarts from its last commit. The input file
+    is verified by size and hashes of its first and last MiB before anything is reused.
+
+    Usage:
+        checkpoint = ExtractionCheckpoint("job.ckpt")
+        vdo_extractor.map_csv(checkpoint=checkpoint) # reuses / continues the frame index
+        extractor = WellTempExtractor(image_path, detected_wells, vdo_extractor, output_dir)
+        extractor.set_checkpoint(checkpoint)
+        extractor.run_TempExtract() # continues after the last committed row
+    """
+    map_fname = "map.npz"
+    rows_fname = "rows.jsonl"
+    state_fname = "state.json"
+
+    def __init__(self, checkpoint_dir, every_frames=200, every_sec=30.0):
+        if not (isinstance(every_frames, int) and every_frames > 0):
+            raise ValueError("Error: Checkpoint every frames must be a positive integer.")
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.checkpoint_dir = checkpoint_dir
+        self.every_frames = every_frames # commit at least every N rows
+        self.every_sec = every_sec # and at least every N seconds (also used for the frame index)
+
+        self.rows_file = None
+        self.state = None # committed state of the running extraction
+        self.uncommitted_rows = 0
+        self.last_commit = time.monotonic()
+        self.last_map_save = time.monotonic()
+
+    def get_path(self, fname):
+        return os.path.join(self.checkpoint_dir, fname)
+
+    @staticmethod
+    def fingerprint_file(a_path, block_size=1 << 20):
+        """
+        Identity of an input file that survives copying: name, size and SHA-1 of the first and last block.
+        """
+        size = os.path.getsize(a_path)
+        digest = hashlib.sha1()
+        with open(a_path, mode="rb") as file:
+            digest.update(file.read(block_size))
+            if size > block_size:
+                file.seek(max(size - block_size, block_size))
+                digest.update(file.read(block_size))
+        return {"name": os.path.basename(a_path), "size": size, "sha1": digest.hexdigest()}
+
+    @staticmethod
+    def atomic_write(a_path, data):
+        """
+        Replace a_path with data (bytes) so that readers only ever see the old or the new content.
+        """
+        tmp_path = f"{a_path}.tmp"
+        with open(tmp_path, mode="wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, a_path)
+
+    ### Frame index
+    def save_map(self, fingerprint, frame_index, frame_offset, frame_fields, next_line, next_offset, complete=False):
+        """
+        Save the frame index scanned so far, partial saves are throttled to every_sec.
+        next_line / next_offset -> where the scan continues
+        """
+        if not complete and not self.map_save_due():
+            return
+        buffer = io.BytesIO()
+        np.savez(buffer,
+            fingerprint=np.array(json.dumps(fingerprint)),
+            frame_index=np.asarray(frame_index, dtype=np.int64),
+            frame_offset=np.asarray(frame_offset, dtype=np.int64),
+            frame_fields=np.asarray(frame_fields, dtype=np.int64).reshape(-1, 7),
+            next_position=np.array([next_line, next_offset], dtype=np.int64),
+            complete=np.array(complete)
+            )
+        self.atomic_write(self.get_path(self.map_fname), buffer.getvalue())
+        self.last_map_save = time.monotonic()
+        logger.debug(f"Checkpoint: frame index of {len(frame_index)} frames saved (complete={complete})")
+
+    def map_save_due(self):
+        """
+        True when a partial save_map() would not be throttled, so callers can skip building its arguments.
+        """
+        return time.monotonic() - self.last_map_save >= self.every_sec
+
+    def load_map(self, fingerprint):
+        """
+        Saved frame index of the same input file, None when there is none or the file changed.
+        return
+            {"frame_index": list, "frame_offset": list, "frame_fields": list, "next_line": int, "next_offset": int, "complete": bool}
+        """
+        map_path = self.get_path(self.map_fname)
+        if not os.path.exists(map_path):
+            return None
+        with np.load(map_path) as saved:
+            if json.loads(str(saved["fingerprint"])) != fingerprint:
+                logger.warning("Checkpoint: input file changed, the frame index is rebuilt.")
+                return None
+            next_line, next_offset = saved["next_position"].tolist()
+            return {
+                "frame_index": saved["frame_index"].tolist(),
+                "frame_offset": saved["frame_offset"].tolist(),
+                "frame_fields": [tuple(fields) for fields in saved["frame_fields"].tolist()],
+                "next_line": next_line,
+                "next_offset": next_offset,
+                "complete": bool(saved["complete"])
+            }
+
+    ### Extraction rows
+    @staticmethod
+    def create_job_key(job):
+        """
+        Short hash of everything the rows depend on (input, sampled frames, wells, parameters).
+        """
+        return hashlib.sha1(json.dumps(job, sort_keys=True, default=str).encode()).hexdigest()
+
+    def load_rows(self, job_key):
+        """
+        Committed rows of the same job, in frame order. Rows of another job are discarded.
+        return
+            [{"frame_idx": 0, "date": ..., "time": ..., "mean": [...], "sd": [...], "shift": [dx, dy] or None}, ...]
+        """
+        state_path = self.get_path(self.state_fname)
+        rows_path = self.get_path(self.rows_fname)
+        state = None
+        if os.path.exists(state_path):
+            with open(state_path, mode="r") as file:
+                state = json.load(file)
+        if state is None or state["job_key"] != job_key or not os.path.exists(rows_path):
+            if state is not None:
+                logger.warning("Checkpoint: input or parameters changed, extraction starts over.")
+            self.state = {"job_key": job_key, "rows": 0, "rows_bytes": 0, "last_frame_idx": None, "last_offset": None, "complete": False}
+            self.atomic_write(rows_path, b"")
+            self.commit_state()
+            return []
+
+        ## Rows after the last commit may be incomplete
+        with open(rows_path, mode="r+b") as file:
+            file.truncate(state["rows_bytes"])
+            file.seek(0)
+            rows = [json.loads(line) for line in file]
+        self.state = state
+        logger.info(f"Checkpoint: resuming after {len(rows)} extracted frames.")
+        return rows
+
+    def append_row(self, frame_idx, date_str, time_str, avg_well_temps, sd_well_temps, shift=None, offset=None):
+        """
+        Append one extracted frame, committed every every_frames rows or every_sec seconds.
+        """
+        if self.state is None:
+            raise ValueError("Error: No checkpoint job. Please load_rows() first.")
+        if self.rows_file is None:
+            self.rows_file = open(self.get_path(self.rows_fname), mode="ab")
+        row = {"frame_idx": frame_idx, "date": date_str, "time": time_str, "mean": list(avg_well_temps), "sd": list(sd_well_temps), "shift": shift}
+        self.rows_file.write(json.dumps(row, separators=(",", ":")).encode() + b"\n")
+        self.state["last_frame_idx"] = frame_idx
+        self.state["last_offset"] = offset
+        self.uncommitted_rows += 1
+        if self.uncommitted_rows >= self.every_frames or time.monotonic() - self.last_commit >= self.every_sec:
+            self.commit()
+
+    def commit(self, complete=False):
+        """
+        Make the appended rows durable, then record them in the state.
+        """
+        if self.state is None:
+            return
+        if self.rows_file is not None:
+            self.rows_file.flush()
+            os.fsync(self.rows_file.fileno())
+            self.state["rows_bytes"] = self.rows_file.tell()
+        self.state["rows"] += self.uncommitted_rows
+        self.state["complete"] = complete
+        self.commit_state()
+        self.uncommitted_rows = 0
+        self.last_commit = time.monotonic()
+
+    def commit_state(self):
+        self.state["updated"] = datetime.now().isoformat(timespec="seconds")
+        self.atomic_write(self.get_path(self.state_fname), json.dumps(self.state, indent=2).encode())
+
+    def close(self, complete=False):
+        self.commit(complete=complete)
+        if self.rows_file is not None:
+            self.rows_file.close()
+            self.rows_file = None
+
+    def get_state(self):
+        return self.state
+
+    def clear(self):
+        """
+        Remove the checkpoint files, e.g. after the results were exported.
+        """
+        if self.rows_file is not None:
+            self.rows_file.close()
+            self.rows_file = None
+        for fname in (self.map_fname, self.rows_fname, self.state_fname):
+            if os.path.exists(self.get_path(fname)):
+                os.remove(self.get_path(fname))
+        self.state = None
@@ -3,31 +3,90 @@ from itertools import islice
 import re
 import os
 import shutil
+import logging
+import warnings
+import numpy as np
 import pandas as pd
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
+from .datamanager import HikDataManager # Plain / compressed CSV streams
+from .metrics import StageMetrics # Stage timers
+
+logger = logging.getLogger(__name__)
+
 class HikExcelExtractor:
     """
     Class of HikExcelExtractor to intereact with HIKMICRO VDO CSV file format.
 
     Usage:
         Create object -> apply map_csv() -> get_sampled_data() / save_sampled_data()
+
+    The VDO CSV may be plain (.csv) or compressed (.csv.gz, .csv.zst), compressed files are
+    decompressed on the fly. A chunk index from HikDataManager.compress_vdo_csv() is picked up
+    automatically and lets frames be read without decompressing from the start.
+
+    Sampling modes:
+        "fixed"    -> one frame every sample_sec (default)
+        "adaptive" -> frames are kept densely while the plate changes and sparsely
+                      when stable, at most max_gap_sec apart (see set_adaptive_params())
+
+    Frames are screened while they are read (see set_quality_checks()): short or unparsable rows,
+    NaN and saturated pixels are flagged, or the frame is dropped, and timestamp gaps are
+    reported from the frame index. See get_quality_report().
     """
-    def __init__(self, vdo_csv, sample_sec=30):
+    sample_modes = ("fixed", "adaptive")
+    quality_modes = ("flag", "drop", None)
+
+    def __init__(self, vdo_csv, sample_sec=30, sample_mode="fixed", metrics=None):
         ## Default Parameters
         self.encoding = "utf-8-sig"
         self.sensor_pixel_nrows = 192
+        self.sensor_pixel_ncols = 256
+
+        ## Stage timers, see meltyfat.metrics
+        self.metrics = metrics if metrics is not None else StageMetrics()
 
         ## User Input
         self.vdo_csv = vdo_csv
         if not self.check_vdo_csv():
             raise ValueError("Error: Uable to load or Invalid format.")
+        self.compression = HikDataManager.get_compression(self.vdo_csv)
+        self.chunk_index = HikDataManager.get_chunk_index(self.vdo_csv)
         self.sample_sec = self.check_sample_sec(sample_sec)
+        self.sample_mode = self.check_sample_mode(sample_mode)
+
+        ## Adaptive sampling parameters
+        self.change_threshold = 0.5 # Celsius
+        self.min_gap_sec = 0.0
+        self.max_gap_sec = None # None -> sample_sec
+        self.well_pixels = None # [(sensor_x, sensor_y), ...] or None for plate-wide
+        self.signature_block = 16 # plate-wide signature: every 16th row, 16 pixel segments
+
+        ## Region of interest parsing, see set_roi()
+        self.roi_spans = None # {sensor_row: [(start_col, end_col), ...]}
+        self.roi_pixels = None # number of pixels inside the ROI
+        self.roi_mask = None # (192, 256) bool, True inside the ROI
+
+        ## Frame quality screening, see set_quality_checks()
+        self.quality_checks = None
+        self.set_quality_checks()
+        self.flagged_frames = {} # frame count -> issues of the frame
+        self.dropped_frames = set()
+        self.timestamp_gaps = []
+        self.frame_interval_sec = None
 
         ## Extract
         self.ref_tst = None
         self.sensor_frame_ls = []
         self.sampled_frames = []
+
+        ## Frame index arrays, filled by map_csv()
+        self.frame_index = np.zeros(0, dtype=np.int64)
+        self.frame_offset = np.zeros(0, dtype=np.int64)
+        self.frame_tst = np.zeros(0, dtype="datetime64[ms]")
+        self.frame_norm = np.zeros(0, dtype=np.float64)
     
     @staticmethod
     def check_sample_sec(sample_sec, default_sample_sec = 30):
@@ -38,9 +97,60 @@ class HikExcelExtractor:
             else:
                 raise ValueError("Sample seconds must be greater than zero.")
         except ValueError:
-            print("Error: Invalid sampling seconds provided. Using {default_sample_sec} seconds")
+            logger.error(f"Error: Invalid sampling seconds provided. Using {default_sample_sec} seconds")
             return default_sample_sec
 
+    @staticmethod
+    def check_sample_mode(sample_mode):
+        if sample_mode not in HikExcelExtractor.sample_modes:
+            raise ValueError(f"Error: Sample mode must be one of {HikExcelExtractor.sample_modes}.")
+        return sample_mode
+
+    def set_adaptive_params(self, change_threshold=0.5, min_gap_sec=0.0, max_gap_sec=None, well_pixels=None):
+        """
+        Parameters of the "adaptive" sampling mode.
+            change_threshold -> keep a frame once it differs from the last kept frame by this many degrees
+            min_gap_sec      -> never keep frames closer than this, even during change
+            max_gap_sec      -> always keep a frame after this many seconds (None -> sample_sec)
+            well_pixels      -> sensor (x, y) pixels to watch, None watches the whole plate
+        """
+        if change_threshold <= 0:
+            raise ValueError("Error: Change threshold must be greater than zero.")
+        if min_gap_sec < 0:
+            raise ValueError("Error: Minimum gap must not be negative.")
+        if max_gap_sec is not None and max_gap_sec < min_gap_sec:
+            raise ValueError("Error: Maximum gap must not be smaller than the minimum gap.")
+        self.change_threshold = change_threshold
+        self.min_gap_sec = min_gap_sec
+        self.max_gap_sec = max_gap_sec
+        self.well_pixels = None if well_pixels is None else np.asarray(well_pixels, dtype=int).reshape(-1, 2)
+
+    def set_quality_checks(self, mode="flag", saturation_min=-20.0, saturation_max=400.0, max_nan_fraction=0.0, max_saturated_fraction=0.001, gap_factor=1.5):
+        """
+        Screen every frame that is read with cheap vectorized checks.
+            mode                   -> "flag": keep bad frames and report them, "drop": skip them, None: no checks
+            saturation_min / max  -> Celsius limits of the sensor (Pocket 2: -20 -> 400), pixels at or past them are saturated
+            max_nan_fraction       -> more missing pixels (inside the ROI) than this flags the frame
+            max_saturated_fraction -> more saturated pixels than this flags the frame
+            gap_factor             -> frame intervals longer than gap_factor x the median interval are gaps
+        Short rows (truncated frames) and unparsable values are always flagged, missing values become NaN.
+        """
+        if mode not in self.quality_modes:
+            raise ValueError(f"Error: Quality mode must be one of {self.quality_modes}.")
+        if not saturation_min < saturation_max:
+            raise ValueError("Error: Saturation min must be lower than saturation max.")
+        if not gap_factor > 1:
+            raise ValueError("Error: Gap factor must be greater than 1.")
+        self.quality_checks = {
+            "mode": mode,
+            "saturation_min": saturation_min,
+            "saturation_max": saturation_max,
+            "max_nan_fraction": max_nan_fraction,
+            "max_saturated_fraction": max_saturated_fraction,
+            "gap_factor": gap_factor
+        }
+        return self.quality_checks
+
     def check_vdo_csv(self):
         """
         Check: exist -> CSV -> Structure -> True
@@ -57,12 +167,12 @@ class HikExcelExtractor:
         """
         ## Check Exist
         if not os.path.isfile(self.vdo_csv):
-            print("Error: File does not exist.")
+            logger.error("Error: File does not exist.")
             return False
         
         ## Check If CSV
-        if not self.vdo_csv.endswith(".csv"):
-            print("Error: File must be in CSV fomat.")
+        if not self.vdo_csv.endswith(HikDataManager.csv_suffixes):
+            logger.error("Error: File must be in CSV fomat (.csv, .csv.gz or .csv.zst).")
             return False
 
         ## Check File Format
@@ -70,7 +180,7 @@ class HikExcelExtractor:
         sample_lines = []
 
         try:
-            with open(self.vdo_csv, mode="r", encoding=self.encoding) as file:
+            with HikDataManager.open_csv(self.vdo_csv, mode="r", encoding=self.encoding) as file:
                 extracted_lines = list(islice(file, num_sample_lines))
                 for line in extracted_lines:
                     if line.startswith("\ufeff"): # Remove Byte Order Mark
@@ -78,7 +188,10 @@ class HikExcelExtractor:
                     sample_lines.append(line.strip())
         
         except FileNotFoundError:
-            print("Error: File Not Found.")
+            logger.error("Error: File Not Found.")
+            return False
+        except (OSError, EOFError, UnicodeDecodeError):
+            logger.error("Error: Unable to decompress or decode the file.")
             return False
         
         ## Check Structure
@@ -88,7 +201,7 @@ class HikExcelExtractor:
         check_timestamp = bool(re.match(tst_pattern, "time:2024/06/19 15:53:42.550"))
 
         if not (check_temp and check_image and check_timestamp):
-            print("Error: Invalid File Format")
+            logger.error("Error: Invalid File Format")
             return False
         return True
 
@@ -104,7 +217,7 @@ class HikExcelExtractor:
             timestamp = datetime.strptime(tst_part, "%Y/%m/%d %H:%M:%S.%f")
             return timestamp
         else:
-            print("Error: No timestamp found")
+            logger.error("Error: No timestamp found")
             return None
 
     def tst_delta_seconds(self, tst, ref_tst):
@@ -132,6 +245,14 @@ class HikExcelExtractor:
         return nearest_tst
 
     def sample_norm_tst(self, tst_ls):
+        """
+        Sample the frame nearest to every sample_sec.
+        Uses a binary search when timestamps are increasing, the linear scan otherwise.
+        """
+        norm = np.fromiter((frame["normalize"] for frame in tst_ls), dtype=np.float64, count=len(tst_ls))
+        if len(norm) and np.all(norm[1:] >= norm[:-1]):
+            return [tst_ls[i] for i in self.nearest_norm_idx(norm, self.sample_sec)]
+
         sampled_frames = []
         norm_start = 0.0 # Starter
         target_norm_sec = norm_start # Starter from 0.0 + sample_sec
@@ -143,6 +264,73 @@ class HikExcelExtractor:
             target_norm_sec += self.sample_sec
         return sampled_frames
 
+    @staticmethod
+    def nearest_norm_idx(norm, sample_sec):
+        """
+        Vectorized nearest_norm_tst() for increasing normalized seconds.
+        Ties go to the earlier frame like the linear scan.
+        """
+        targets = np.arange(int(norm[-1] // sample_sec) + 1, dtype=np.float64) * sample_sec
+        right = np.searchsorted(norm, targets, side="left")
+        left = np.searchsorted(norm, norm[np.maximum(right - 1, 0)], side="left") # first of equal values
+        right_clip = np.minimum(right, len(norm) - 1)
+        use_left = (right == len(norm)) | ((right > 0) & (targets - norm[left] <= norm[right_clip] - targets))
+        return np.where(use_left, left, right_clip)
+
+    def get_signature_spans(self):
+        """
+        Sensor row / column spans read for the adaptive sampling signature, so that frames
+        are only partly parsed while sampling (see parse_frame_rows()).
+            well_pixels set -> the watched pixels only
+            otherwise       -> every signature_block-th sensor row at full width (1/16 of the frame)
+        """
+        if self.well_pixels is not None:
+            return self.build_roi_spans(self.well_pixels, 0)
+        rows = range(self.signature_block // 2, self.sensor_pixel_nrows, self.signature_block)
+        return {row: [(0, self.sensor_pixel_ncols)] for row in rows}
+
+    def frame_signature(self, data):
+        """
+        Cheap per-frame change signal used by adaptive sampling.
+        Either the values at the watched well pixels, or the means of signature_block wide
+        segments along every signature_block-th row of the plate.
+        """
+        if self.well_pixels is not None:
+            return data[self.well_pixels[:, 1], self.well_pixels[:, 0]]
+        block = self.signature_block
+        rows = data[block // 2::block, :self.sensor_pixel_ncols - self.sensor_pixel_ncols % block]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning) # Damaged segments
+            return np.nanmean(rows.reshape(rows.shape[0], -1, block), axis=2).ravel()
+
+    def sample_adaptive_tst(self, tst_ls):
+        """
+        Keep a frame when it has changed by change_threshold since the last kept frame
+        (and min_gap_sec has passed), or when max_gap_sec has passed without a kept frame.
+        Every frame is read, but only the signature rows / pixels are parsed (see get_signature_spans()).
+        Without well_pixels this still costs about 1/16 of a full parse of every frame.
+        """
+        max_gap_sec = self.sample_sec if self.max_gap_sec is None else self.max_gap_sec
+        sampled_frames = []
+        last_signature = None
+        last_norm = None
+        with self.use_roi_spans(self.get_signature_spans()):
+            for a_frame, data in self.iter_frame_arrays(tst_ls):
+                signature = self.frame_signature(data)
+                if last_signature is not None:
+                    gap = a_frame["normalize"] - last_norm
+                    if gap < max_gap_sec:
+                        if gap < self.min_gap_sec:
+                            continue
+                        with np.errstate(invalid="ignore"):
+                            change = np.nanmax(np.abs(signature - last_signature)) if signature.size else 0.0
+                        if not change >= self.change_threshold:
+                            continue
+                sampled_frames.append(a_frame)
+                last_signature = signature
+                last_norm = a_frame["normalize"]
+        return sampled_frames
+
     def extract_dt(self, dt):
         """
         This function extracts datetime into date part and time part and round up microseconds part.
@@ -155,113 +343,540 @@ class HikExcelExtractor:
         time_part = dt.time().replace(microsecond=0)
         return date_part, time_part
 
-    def map_csv(self, sample_sec=None):
+    def format_frame_dt(self, a_frame):
+        """
+        Date and time text of a mapped frame: ("2024-08-18", "15:07:59")
+        """
+        date_part, time_part = self.extract_dt(a_frame["timestamp"])
+        return date_part.strftime("%Y-%m-%d"), time_part.strftime("%H:%M:%S")
+
+    def map_csv(self, sample_sec=None, sample_mode=None, checkpoint=None):
         """
         Map the location of timestamp and row to be extracted.
+        checkpoint -> ExtractionCheckpoint, the frame index is saved while scanning and reused
+                      (or continued, plain files only) when the same file is mapped again
         """
         ## let users to update sample seconds without calling the class again
         if sample_sec != None:
             self.sample_sec = self.check_sample_sec(sample_sec)
+        if sample_mode != None:
+            self.sample_mode = self.check_sample_mode(sample_mode)
+        self.sensor_frame_ls = []
 
-        with open(self.vdo_csv, mode="r", encoding=self.encoding) as file:
-            counter = 0
-            tst_pattern = r"time:\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}\.\d{3}\s*"
-
-            ## Loop to map location of timestamp and row
-            for idx, line in enumerate(file):
-                ## Data is a "csv", we want to get the location of tst.
-                first_col = line.strip().split(",")[0].strip()
-
-                ## If match with timestamp
-                if re.match(tst_pattern, first_col):
-                    if counter == 0:
-                        self.ref_tst = self.get_timestamp(first_col)
-                    sensor_frame_dct = {
-                        "timestamp": self.get_timestamp(first_col),
-                        "normalize": self.tst_delta_seconds(self.get_timestamp(first_col), self.ref_tst),
-                        "index": idx, # csv index
-                        "frame": counter # frame count
-                    }
-                    # print(sensor_frame_dct)
-                    self.sensor_frame_ls.append(sensor_frame_dct)
-                    counter += 1
+        ## Frame header scan: no regex, no full line split, timestamps parsed once
+        with self.metrics.stage("map_csv", file=self.vdo_csv) as record:
+            saved_map = None
+            if checkpoint is not None:
+                fingerprint = checkpoint.fingerprint_file(self.vdo_csv)
+                saved_map = checkpoint.load_map(fingerprint)
+                if saved_map is not None and not saved_map["complete"] and self.compression is not None:
+                    saved_map = None # a decompressed stream cannot seek, scan again
+
+            if saved_map is not None and saved_map["complete"]:
+                header_idx, header_offset, header_fields = saved_map["frame_index"], saved_map["frame_offset"], saved_map["frame_fields"]
+            else:
+                start_idx, start_offset = 0, 0
+                header_idx, header_offset, header_fields = [], [], []
+                if saved_map is not None:
+                    header_idx, header_offset, header_fields = saved_map["frame_index"], saved_map["frame_offset"], saved_map["frame_fields"]
+                    start_idx, start_offset = saved_map["next_line"], saved_map["next_offset"]
+                    logger.info(f"Checkpoint: continuing the frame scan after {len(header_idx)} frames.")
+
+                def save_progress(new_idx, new_offset, new_fields, next_idx, next_offset):
+                    if checkpoint.map_save_due(): # join the lists only for a save that is not throttled
+                        checkpoint.save_map(fingerprint, header_idx + new_idx, header_offset + new_offset, header_fields + new_fields, next_idx, next_offset)
+
+                progress = save_progress if checkpoint is not None else None
+                with HikDataManager.open_csv(self.vdo_csv, mode="rb") as file:
+                    if start_offset:
+                        file.seek(start_offset)
+                    new_idx, new_offset, new_fields = self.scan_frame_headers(file, start_idx=start_idx, start_offset=start_offset, progress=progress)
+                header_idx, header_offset, header_fields = header_idx + new_idx, header_offset + new_offset, header_fields + new_fields
+                if checkpoint is not None:
+                    checkpoint.save_map(fingerprint, header_idx, header_offset, header_fields, start_idx, start_offset, complete=True)
+            record["frames"] = len(header_idx)
+            record["bytes"] = os.path.getsize(self.vdo_csv)
+
+        self.frame_index = np.array(header_idx, dtype=np.int64) # csv line of each timestamp
+        self.frame_offset = np.array(header_offset, dtype=np.int64) # byte offset (decompressed) of each timestamp
+        self.frame_tst = self.fields_to_datetime64(header_fields)
+        if len(self.frame_tst):
+            self.frame_norm = (self.frame_tst - self.frame_tst[0]) / np.timedelta64(1, "ms") / 1000
+            self.ref_tst = self.frame_tst[0].astype(object)
+        else:
+            self.frame_norm = np.zeros(0, dtype=np.float64)
+        self.flagged_frames = {}
+        self.dropped_frames = set()
+        self.screen_frame_index()
+
+        ## Frame list of dicts
+        for counter, (idx, offset, timestamp, norm) in enumerate(zip(header_idx, header_offset, self.frame_tst.astype(object), self.frame_norm.tolist())):
+            self.sensor_frame_ls.append({
+                "timestamp": timestamp,
+                "normalize": norm,
+                "index": idx, # csv index
+                "frame": counter, # frame count
+                "offset": offset # byte offset of the timestamp line
+            })
 
         ## Extract Data from specific frames using normalized data.
-        self.sampled_frames = self.sample_norm_tst(self.sensor_frame_ls)
+        if not self.sensor_frame_ls:
+            logger.error("Error: No frames found in the file.")
+            self.sampled_frames = []
+            return None
+        with self.metrics.stage("sample_frames", sample_mode=self.sample_mode) as record:
+            if self.sample_mode == "adaptive":
+                self.sampled_frames = self.sample_adaptive_tst(self.sensor_frame_ls)
+            else:
+                self.sampled_frames = self.sample_norm_tst(self.sensor_frame_ls)
+            record["frames"] = len(self.sensor_frame_ls)
+            record["sampled_frames"] = len(self.sampled_frames)
 
-    def get_sampled_data(self):
+    def screen_frame_index(self):
+        """
+        Find dropped frames (timestamp gaps), timestamps running backwards and frames with fewer
+        rows than the sensor before the next timestamp, from the frame index alone before any frame is read.
+        """
+        self.timestamp_gaps = []
+        self.frame_interval_sec = None
+        if self.quality_checks["mode"] is None or len(self.frame_norm) < 2:
+            return
+        intervals = np.diff(self.frame_norm)
+        self.frame_interval_sec = float(np.median(intervals))
+        gap_idx = np.flatnonzero((intervals > self.frame_interval_sec * self.quality_checks["gap_factor"]) | (intervals < 0))
+        for idx in gap_idx.tolist():
+            self.timestamp_gaps.append({
+                "after_frame": idx,
+                "start": str(self.frame_tst[idx]),
+                "end": str(self.frame_tst[idx + 1]),
+                "gap_sec": float(intervals[idx]),
+                "missing_frames": max(int(round(intervals[idx] / self.frame_interval_sec)) - 1, 0) if self.frame_interval_sec > 0 else None
+            })
+        short_frames = np.flatnonzero(np.diff(self.frame_index) <= self.sensor_pixel_nrows).tolist()
+        if self.timestamp_gaps or short_frames:
+            logger.warning(f"Quality: {len(self.timestamp_gaps)} timestamp gaps ({sum(gap['missing_frames'] or 0 for gap in self.timestamp_gaps)} missing frames) "
+                f"and {len(short_frames)} truncated frames in {os.path.basename(self.vdo_csv)}.")
+        for frame in short_frames:
+            self.flagged_frames[frame] = {"frame": frame, "issues": ["short_rows"]}
+
+    def screen_frame(self, a_frame, data, issues):
+        """
+        Vectorized checks of one parsed frame (NaN and saturated pixels), issues found while parsing are kept.
+        return
+            True -> the frame may be used
+        """
+        checks = self.quality_checks
+        if self.roi_mask is not None and data.shape == self.roi_mask.shape:
+            data = data[self.roi_mask] # only ROI pixels count, whether or not the engine parsed the others
+        n_pixels = data.size
+        n_nan = int(np.count_nonzero(np.isnan(data)))
+        n_saturated = int(np.count_nonzero(data >= checks["saturation_max"]) + np.count_nonzero(data <= checks["saturation_min"]))
+        if n_nan > checks["max_nan_fraction"] * n_pixels:
+            issues.append("nan")
+        if n_saturated > checks["max_saturated_fraction"] * n_pixels:
+            issues.append("saturated")
+        if not issues:
+            return True
+
+        frame = a_frame.get("frame", a_frame["index"])
+        self.flagged_frames[frame] = {"frame": frame, "issues": sorted(set(issues + self.flagged_frames.get(frame, {}).get("issues", []))), "nan_pixels": n_nan, "saturated_pixels": n_saturated}
+        if checks["mode"] == "drop":
+            self.dropped_frames.add(frame)
+            return False
+        return True
+
+    def get_quality_report(self):
+        """
+        Screening results of the frames read so far and of the frame index:
+            {"mode": ..., "frames": n, "frame_interval_sec": median, "timestamp_gaps": [...],
+             "flagged_frames": [{"frame": n, "timestamp": ..., "issues": ["short_rows", "unparsable", "nan", "saturated"], ...}],
+             "dropped_frames": [frame, ...]}
+        """
+        flagged = []
+        for frame in sorted(self.flagged_frames):
+            entry = dict(self.flagged_frames[frame])
+            if frame < len(self.sensor_frame_ls):
+                entry["timestamp"] = str(self.sensor_frame_ls[frame]["timestamp"])
+            flagged.append(entry)
+        return {
+            "mode": self.quality_checks["mode"],
+            "frames": len(self.sensor_frame_ls),
+            "frame_interval_sec": self.frame_interval_sec,
+            "timestamp_gaps": self.timestamp_gaps,
+            "flagged_frames": flagged,
+            "dropped_frames": sorted(self.dropped_frames)
+        }
+
+    @staticmethod
+    def parse_tst_fields(line):
+        """
+        Parse a fixed width timestamp line without regex or strptime.
+        TST FORMAT: b'time:2024/05/10 12:45:46.205'
+        return
+            (year, month, day, hour, minute, second, millisecond) or None
+        """
+        if len(line) < 28 or line[9:10] != b"/" or line[15:16] != b" " or line[24:25] != b".":
+            return None
+        try:
+            return (int(line[5:9]), int(line[10:12]), int(line[13:15]),
+                int(line[16:18]), int(line[19:21]), int(line[22:24]), int(line[25:28]))
+        except ValueError:
+            return None
+
+    def scan_frame_headers(self, file, start_idx=0, start_offset=0, progress=None, progress_every=1000):
+        """
+        Scan a binary stream for 'time:' lines by prefix, data lines are never split.
+        start_idx / start_offset -> line number and byte offset of the current stream position
+        progress -> callable(header_idx, header_offset, header_fields, next_idx, next_offset) every progress_every frames,
+                    where the scan would continue from a frame header
+        return
+            line indexes, byte offsets and timestamp fields of every frame
+        """
+        header_idx = []
+        header_offset = []
+        header_fields = []
+        offset = start_offset
+        for idx, line in enumerate(file, start_idx):
+            if line.startswith(b"time:"):
+                fields = self.parse_tst_fields(line)
+                if fields is not None:
+                    if progress is not None and header_idx and len(header_idx) % progress_every == 0:
+                        progress(header_idx, header_offset, header_fields, idx, offset)
+                    header_idx.append(idx)
+                    header_offset.append(offset)
+                    header_fields.append(fields)
+            offset += len(line)
+        return header_idx, header_offset, header_fields
+
+    @staticmethod
+    def fields_to_datetime64(header_fields):
+        """
+        Convert timestamp fields into a datetime64[ms] array arithmetically.
+        """
+        if not header_fields:
+            return np.zeros(0, dtype="datetime64[ms]")
+        fields = np.array(header_fields, dtype=np.int64)
+        dates = ((fields[:, 0] - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (fields[:, 1] - 1)).astype("datetime64[D]") + (fields[:, 2] - 1)
+        millis = ((fields[:, 3] * 60 + fields[:, 4]) * 60 + fields[:, 5]) * 1000 + fields[:, 6]
+        return dates.astype("datetime64[ms]") + millis
+
+    def set_roi(self, well_pixels=None, detect_window=0):
+        """
+        Region of interest parsing: only the sensor rows containing wells are tokenized
+        and only the column spans around each well are converted to floats.
+        Pixels outside the ROI are returned as NaN. Call with None to parse full frames again.
+
+            well_pixels   -> sensor (x, y) well centres, e.g. from WellAnalyzer.map_sensor_coordinate()
+            detect_window -> half width of the window kept around each well
+        """
+        if well_pixels is None:
+            return self.set_roi_spans(None)
+        return self.set_roi_spans(self.build_roi_spans(well_pixels, detect_window))
+
+    def set_roi_spans(self, roi_spans):
+        """
+        Region of interest as {sensor_row: [(start_col, end_col), ...]}, None parses full frames.
+        """
+        self.roi_spans = roi_spans
+        self.roi_pixels = None if roi_spans is None else sum(end_x - start_x for spans in roi_spans.values() for start_x, end_x in spans)
+        self.roi_mask = None
+        if roi_spans is not None:
+            self.roi_mask = np.zeros((self.sensor_pixel_nrows, self.sensor_pixel_ncols), dtype=bool)
+            for row, spans in roi_spans.items():
+                for start_x, end_x in spans:
+                    self.roi_mask[row, start_x:end_x] = True
+        return self.roi_spans
+
+    @contextmanager
+    def use_roi_spans(self, roi_spans):
+        """
+        Parse with other ROI spans within the block, the current ROI is restored afterwards.
+        """
+        previous_spans = self.roi_spans
+        self.set_roi_spans(roi_spans)
+        try:
+            yield self.roi_spans
+        finally:
+            self.set_roi_spans(previous_spans)
+
+    def build_roi_spans(self, well_pixels, detect_window):
+        """
+        Merged column spans per sensor row of the windows around well_pixels.
+        return
+            {sensor_row: [(start_col, end_col), ...]}
+        """
+        well_pixels = np.asarray(well_pixels, dtype=int).reshape(-1, 2)
+        detect_window = max(int(detect_window), 0)
+
+        ## Column span per row
+        row_spans = {}
+        for x_coor, y_coor in well_pixels:
+            start_x = max(0, x_coor - detect_window)
+            end_x = min(self.sensor_pixel_ncols, x_coor + detect_window + 1)
+            for row in range(max(0, y_coor - detect_window), min(self.sensor_pixel_nrows, y_coor + detect_window + 1)):
+                row_spans.setdefault(row, []).append((start_x, end_x))
+        return self.merge_row_spans(row_spans)
+
+    def widen_roi_spans(self, margin):
+        """
+        Current ROI spans grown by margin pixels in every direction, e.g. for wells moving with the plate.
+        """
+        if self.roi_spans is None:
+            return None
+        row_spans = {}
+        for row, spans in self.roi_spans.items():
+            for start_x, end_x in spans:
+                widened = (max(0, start_x - margin), min(self.sensor_pixel_ncols, end_x + margin))
+                for new_row in range(max(0, row - margin), min(self.sensor_pixel_nrows, row + margin + 1)):
+                    row_spans.setdefault(new_row, []).append(widened)
+        return self.merge_row_spans(row_spans)
+
+    @staticmethod
+    def merge_row_spans(row_spans):
+        """
+        Merge overlapping column spans of every row: {row: [(0, 5), (3, 9)]} -> {row: [(0, 9)]}
+        """
+        roi_spans = {}
+        for row in sorted(row_spans):
+            merged = []
+            for start_x, end_x in sorted(row_spans[row]):
+                if merged and start_x <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], end_x))
+                else:
+                    merged.append((start_x, end_x))
+            roi_spans[row] = merged
+        return roi_spans
+
+    def parse_frame_rows(self, rows, issues=None):
+        """
+        Convert the raw (bytes) rows of one frame into a (192, 256) float array.
+        issues -> list to collect parsing problems in, broken frames are then parsed
+                  value by value with NaN for whatever is missing instead of raising
+        """
+        try:
+            if len(rows) < self.sensor_pixel_nrows:
+                raise IndexError("short frame")
+            if self.roi_spans is None:
+                data = np.array([row.rstrip(b"\r\n").split(b",")[:-1] for row in rows], dtype=np.float64)
+                if data.shape != (self.sensor_pixel_nrows, self.sensor_pixel_ncols):
+                    raise ValueError("short rows")
+                return data
+
+            data = np.full((self.sensor_pixel_nrows, self.sensor_pixel_ncols), np.nan)
+            for row, spans in self.roi_spans.items():
+                ## Only split as far as the last needed column
+                parts = rows[row].split(b",", spans[-1][1])
+                for start_x, end_x in spans:
+                    data[row, start_x:end_x] = parts[start_x:end_x]
+            return data
+        except (ValueError, IndexError):
+            if issues is None:
+                raise
+        return self.parse_broken_rows(rows, issues)
+
+    def parse_broken_rows(self, rows, issues):
+        """
+        Slow path of parse_frame_rows() for a damaged frame: rows end at the next timestamp line,
+        short rows and unparsable values become NaN.
+        """
+        data = np.full((self.sensor_pixel_nrows, self.sensor_pixel_ncols), np.nan)
+        n_rows = 0
+        for row_idx, row in enumerate(rows):
+            if row.startswith(b"time:"): # the frame was cut off, the next one starts here
+                break
+            n_rows += 1
+            values = row.rstrip(b"\r\n").split(b",")[:-1][:self.sensor_pixel_ncols]
+            for col_idx, value in enumerate(values):
+                try:
+                    data[row_idx, col_idx] = float(value)
+                except ValueError:
+                    if "unparsable" not in issues:
+                        issues.append("unparsable")
+            if len(values) < self.sensor_pixel_ncols and "short_rows" not in issues:
+                issues.append("short_rows")
+        if n_rows < self.sensor_pixel_nrows and "short_rows" not in issues:
+            issues.append("short_rows")
+        if self.roi_spans is not None:
+            roi_data = np.full_like(data, np.nan)
+            for row, spans in self.roi_spans.items():
+                for start_x, end_x in spans:
+                    roi_data[row, start_x:end_x] = data[row, start_x:end_x]
+            data = roi_data
+        return data
+
+    def open_vdo_at(self, line_idx):
+        """
+        Open the VDO CSV (binary) as close as possible before line_idx.
+        return
+            (file, first line number of the file object)
+        """
+        if self.chunk_index is None:
+            return HikDataManager.open_csv(self.vdo_csv, mode="rb"), 0
+        a_chunk = HikDataManager.find_chunk(self.chunk_index, line_idx)
+        return HikDataManager.open_csv(self.vdo_csv, mode="rb", offset=a_chunk["offset"]), a_chunk["line"]
+
+    def iter_frame_arrays(self, frames=None):
+        """
+        Read the requested frames (default: sampled frames) in a single pass over the file.
+        Yield (frame, data) with data as a (192, 256) float array, the last empty column removed.
+        Frames failing the quality checks are skipped in "drop" mode.
+        Plain files seek to the byte offset of each frame, compressed files with a chunk index
+        skip chunks without requested frames instead of decompressing them.
+        """
+        if frames is None:
+            frames = self.sampled_frames
+        pending = sorted(frames, key=lambda a_frame: a_frame["index"])
+        if not pending:
+            return
+
+        file = None
+        line_idx = 0 # line number of the next line read from file
+        try:
+            pos = 0
+            while pos < len(pending):
+                frame_index = pending[pos]["index"]
+
+                ## Plain file: jump straight to the timestamp line
+                if self.compression is None and "offset" in pending[pos]:
+                    if file is None:
+                        file = open(self.vdo_csv, mode="rb")
+                    file.seek(pending[pos]["offset"])
+                    file.readline()
+                    line_idx = frame_index + 1
+
+                ## (Re)open when there is no stream yet or a later chunk is closer
+                elif file is None or (self.chunk_index is not None and HikDataManager.find_chunk(self.chunk_index, frame_index)["line"] > line_idx):
+                    if file is not None:
+                        file.close()
+                    file, line_idx = self.open_vdo_at(frame_index)
+
+                ## Skip to the line after the timestamp, binary mode: skipped rows are never decoded
+                deque(islice(file, max(frame_index + 1 - line_idx, 0)), maxlen=0)
+                ## A truncated frame ends at the next timestamp, which must stay in the stream
+                n_rows = self.sensor_pixel_nrows
+                next_pos = np.searchsorted(self.frame_index, frame_index, side="right")
+                if next_pos < len(self.frame_index):
+                    n_rows = min(n_rows, int(self.frame_index[next_pos]) - frame_index - 1)
+                rows = list(islice(file, n_rows))
+                line_idx = frame_index + 1 + len(rows)
+                if self.quality_checks["mode"] is None:
+                    data, usable = self.parse_frame_rows(rows), True
+                else:
+                    issues = []
+                    data = self.parse_frame_rows(rows, issues)
+                    usable = self.screen_frame(pending[pos], data, issues)
+
+                ## The same frame may be sampled more than once
+                while pos < len(pending) and pending[pos]["index"] == frame_index:
+                    if usable:
+                        yield pending[pos], data
+                    pos += 1
+        finally:
+            if file is not None:
+                file.close()
+
+    def get_sampled_data(self, engine="auto"):
         """
         Get the map sample data points into a list of dictionaries.
+
+        engine:
+            "pandas" -> read each frame with pd.read_csv
+            "stream" -> read all frames in one pass, honours set_roi()
+            "auto"   -> "stream" when a ROI is set or the file is compressed, otherwise "pandas"
         """
         ## User must map CSV first
         
         if not self.sampled_frames:
-            print("Error: No Sampled Data Available. Please run map_csv first.")
+            logger.error("Error: No Sampled Data Available. Please run map_csv first.")
             return None
 
         extracted_frames_ls = []
 
-        for a_frame in self.sampled_frames:
-            # print(a_frame)
-            temp_df = pd.read_csv(
-                self.vdo_csv,
-                skiprows=a_frame["index"] + 1,
-                nrows=self.sensor_pixel_nrows,
-                delimiter=",",
-                header=None
-            )
-            temp_df = temp_df.iloc[:, :-1] # Remove the last column
-            date_part, time_part = self.extract_dt(a_frame["timestamp"])
-            date_str = date_part.strftime("%Y-%m-%d")
-            time_str = time_part.strftime("%H:%M:%S")
-
-            frame_dict = {
-                "date": date_str, # 2024-08-18
-                "time": time_str, # 15:07:59
-                "data": temp_df.values.tolist()
-            }
-            extracted_frames_ls.append(frame_dict)
+        with self.metrics.stage("get_sampled_data", engine=engine) as record:
+            for a_frame, temp_df in self.iter_sampled_dfs(engine):
+                # print(a_frame)
+                date_str, time_str = self.format_frame_dt(a_frame)
+
+                frame_dict = {
+                    "date": date_str, # 2024-08-18
+                    "time": time_str, # 15:07:59
+                    "data": temp_df.values.tolist()
+                }
+                extracted_frames_ls.append(frame_dict)
+            record["frames"] = len(extracted_frames_ls)
 
         return extracted_frames_ls
+
+    def iter_sampled_dfs(self, engine="auto"):
+        """
+        Yield (frame, dataframe) of every sampled frame with the selected engine.
+        """
+        if engine == "auto":
+            engine = "pandas" if (self.roi_spans is None and self.compression is None) else "stream"
+        if engine == "stream":
+            for a_frame, data in self.iter_frame_arrays():
+                yield a_frame, pd.DataFrame(data)
+            return
+        if engine != "pandas":
+            raise ValueError("Error: Engine must be 'auto', 'pandas' or 'stream'.")
+
+        for a_frame in self.sampled_frames:
+            try:
+                temp_df = pd.read_csv(
+                    self.vdo_csv,
+                    skiprows=a_frame["index"] + 1,
+                    nrows=self.sensor_pixel_nrows,
+                    delimiter=",",
+                    header=None
+                )
+                temp_df = temp_df.iloc[:, :-1] # Remove the last column
+                if self.quality_checks["mode"] is not None:
+                    if temp_df.shape != (self.sensor_pixel_nrows, self.sensor_pixel_ncols):
+                        raise ValueError("Error: Short frame.")
+                    if not self.screen_frame(a_frame, temp_df.to_numpy(dtype=np.float64), []):
+                        continue
+            except (ValueError, pd.errors.ParserError):
+                if self.quality_checks["mode"] is None:
+                    raise
+                ## Damaged frame, parse it value by value
+                for a_frame, data in self.iter_frame_arrays([a_frame]):
+                    yield a_frame, pd.DataFrame(data)
+                continue
+            yield a_frame, temp_df
     
-    def save_sampled_data(self, save_dir):
+    def save_sampled_data(self, save_dir, engine="auto"):
         """
         Save the mapped data into a directory
         """
         ## User must map CSV first
         if not self.sampled_frames:
-            print("Error: No Sampled Data Available. Please run map_csv() first.")
+            logger.error("Error: No Sampled Data Available. Please run map_csv() first.")
             return None
         ## Create save directory
         try:
             if not os.path.exists(save_dir):
                 os.makedirs(save_dir, exist_ok=True)
 
-            for a_frame in self.sampled_frames:
-                # print(a_frame)
-                temp_df = pd.read_csv(
-                    self.vdo_csv,
-                    skiprows=a_frame["index"] + 1,
-                    nrows=self.sensor_pixel_nrows,
-                    delimiter=",",
-                    header=None
-                )
-                temp_df = temp_df.iloc[:, :-1] # Remove the last column
-                date_part, time_part = self.extract_dt(a_frame["timestamp"])
-                date_str = date_part.strftime("%Y%m%d")
-                time_str = time_part.strftime("%H%M%S")
+            with self.metrics.stage("save_sampled_data", engine=engine) as record:
+                for a_frame, temp_df in self.iter_sampled_dfs(engine):
+                    # print(a_frame)
+                    date_part, time_part = self.extract_dt(a_frame["timestamp"])
+                    date_str = date_part.strftime("%Y%m%d")
+                    time_str = time_part.strftime("%H%M%S")
 
-                filename = f"{date_str}_{time_str}_thm.csv"
-                file_save_path = os.path.join(save_dir, filename)
-                if os.path.exists(file_save_path): # check if already exist
-                    os.remove(file_save_path)  # Remove the existing file before save new
+                    filename = f"{date_str}_{time_str}_thm.csv"
+                    file_save_path = os.path.join(save_dir, filename)
+                    if os.path.exists(file_save_path): # check if already exist
+                        os.remove(file_save_path)  # Remove the existing file before save new
 
-                temp_df.to_csv(file_save_path, index=False)
+                    temp_df.to_csv(file_save_path, index=False)
+                    record["frames"] += 1
+                    record["bytes"] += os.path.getsize(file_save_path)
         except:
-            print("Error: Error while saving data")
+            logger.error("Error: Error while saving data")
         
         ## If everything passes
-        print(f"Success: Saved to {save_dir}")
+        logger.info(f"Success: Saved to {save_dir}")
 
 ## Debugging
 # if __name__ =="__main__":
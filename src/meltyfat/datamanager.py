@@ -1,13 +1,50 @@
 import os
 import re
+import io
 import csv
+import gzip
+import json
+import zlib
+import hashlib
+import struct
+import bisect
+import logging
+import numpy as np
 import pandas as pd
 
+## Optional: zstandard is only needed for .zst files
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+class _SeekedGzipFile(gzip.GzipFile):
+    """
+    GzipFile reading from an already positioned raw file, which it closes on close().
+    """
+    def __init__(self, raw):
+        super().__init__(fileobj=raw, mode="rb")
+        self.raw = raw
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.raw.close()
+
 class HikDataManager:
     """
     This class contains static methods to manage and read thermal sensor data.
     It supports HIKMICRO Pocket 2 model.
+    CSV files may be plain (.csv) or compressed (.csv.gz, .csv.zst).
     """
+    csv_suffixes = (".csv", ".csv.gz", ".csv.zst")
+    chunk_index_suffix = ".idx.json"
+    compact_suffix = ".mfz"
+    compact_magic = b"MFZ1"
+
     @staticmethod
     def check_path_exist(a_path):
         return os.path.exists(a_path)
@@ -20,7 +57,7 @@ class HikDataManager:
             True -> follow Hik naming format
             False -> does not follow
         """
-        hik_fname_format = r"\d{8}_\d{6}_thm\.csv"
+        hik_fname_format = r"\d{8}_\d{6}_thm\.csv(\.gz|\.zst)?$"
         return re.match(hik_fname_format, fname) is not None
 
     @staticmethod
@@ -32,7 +69,287 @@ class HikDataManager:
             False -> others
         """
         path_fname = os.path.basename(a_path) # get filename
-        return os.path.isfile(a_path) and a_path.endswith(".csv") and HikDataManager.check_fname(a_path)
+        return os.path.isfile(a_path) and a_path.endswith(HikDataManager.csv_suffixes) and HikDataManager.check_fname(path_fname)
+
+    @staticmethod
+    def get_compression(a_path):
+        """
+        return
+            "gzip" / "zstd" -> compressed file
+            None -> plain file
+        """
+        if a_path.endswith(".gz"):
+            return "gzip"
+        if a_path.endswith(".zst"):
+            return "zstd"
+        return None
+
+    @staticmethod
+    def open_csv(a_path, mode="rb", encoding="utf-8-sig", offset=0):
+        """
+        Open a plain or compressed CSV as a single-pass stream, decompressing on the fly.
+        offset -> byte position in the (compressed) file to start from, e.g. a chunk from get_chunk_index().
+        mode "rb" returns bytes lines, mode "r" returns decoded text lines.
+        """
+        compression = HikDataManager.get_compression(a_path)
+        raw = open(a_path, mode="rb")
+        raw.seek(offset)
+        if compression == "gzip":
+            stream = _SeekedGzipFile(raw)
+        elif compression == "zstd":
+            if zstandard is None:
+                raw.close()
+                raise ImportError("Error: Reading .zst files requires the 'zstandard' package.")
+            stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True))
+        else:
+            stream = raw
+
+        if mode == "r":
+            return io.TextIOWrapper(stream, encoding=encoding)
+        return stream
+
+    @staticmethod
+    def compress_vdo_csv(vdo_csv, output_path=None, compression="gzip", frames_per_chunk=100):
+        """
+        Compress a HIKMICRO VDO CSV into independently compressed chunks of frames
+        and write a seekable chunk index next to it (<output_path>.idx.json).
+        The output is still a regular .gz / .zst file for any other reader.
+
+        Index: {"compression": ..., "file": get_file_signature(), "chunks": [{"offset": byte offset, "line": first line, "frame": first frame}, ...]}
+        """
+        if compression == "gzip":
+            suffix = ".gz"
+            compress = lambda data: gzip.compress(data, mtime=0)
+        elif compression == "zstd":
+            if zstandard is None:
+                raise ImportError("Error: Writing .zst files requires the 'zstandard' package.")
+            suffix = ".zst"
+            compress = zstandard.ZstdCompressor().compress
+        else:
+            raise ValueError("Error: Compression must be 'gzip' or 'zstd'.")
+        if not frames_per_chunk > 0:
+            raise ValueError("Error: Frames per chunk must be greater than zero.")
+        if output_path is None:
+            output_path = vdo_csv + suffix
+
+        chunks = []
+        with open(vdo_csv, mode="rb") as src, open(output_path, mode="wb") as dst:
+            chunk_lines = []
+            chunk_line = 0 # first line of the current chunk
+            chunk_frame = 0 # first frame of the current chunk
+            frame_count = 0
+            for idx, line in enumerate(src):
+                if line.startswith(b"time:") or line.startswith(b"\xef\xbb\xbftime:"):
+                    if frame_count - chunk_frame == frames_per_chunk:
+                        chunks.append({"offset": dst.tell(), "line": chunk_line, "frame": chunk_frame})
+                        dst.write(compress(b"".join(chunk_lines)))
+                        chunk_lines = []
+                        chunk_line = idx
+                        chunk_frame = frame_count
+                    frame_count += 1
+                chunk_lines.append(line)
+            chunks.append({"offset": dst.tell(), "line": chunk_line, "frame": chunk_frame})
+            dst.write(compress(b"".join(chunk_lines)))
+
+        with open(output_path + HikDataManager.chunk_index_suffix, mode="w") as file:
+            json.dump({"compression": compression, "file": HikDataManager.get_file_signature(output_path), "chunks": chunks}, file)
+        return output_path
+
+    @staticmethod
+    def get_file_signature(a_path, block_size=1 << 20):
+        """
+        Size and SHA-1 of the first and last block of a file, to tell whether a chunk index still belongs to it.
+        """
+        size = os.path.getsize(a_path)
+        digest = hashlib.sha1()
+        with open(a_path, mode="rb") as file:
+            digest.update(file.read(block_size))
+            if size > block_size:
+                file.seek(max(size - block_size, block_size))
+                digest.update(file.read(block_size))
+        return {"size": size, "sha1": digest.hexdigest()}
+
+    @staticmethod
+    def get_chunk_index(a_path):
+        """
+        Load the seekable chunk index of a compressed CSV, None if there is no index
+        or the file was replaced or recompressed after the index was written.
+        """
+        index_path = a_path + HikDataManager.chunk_index_suffix
+        if not os.path.isfile(index_path):
+            return None
+        with open(index_path, mode="r") as file:
+            chunk_index = json.load(file)
+        if chunk_index.get("compression") != HikDataManager.get_compression(a_path):
+            return None
+        if chunk_index.get("file") != HikDataManager.get_file_signature(a_path):
+            logger.warning(f"Chunk index {os.path.basename(index_path)} does not match the file, it is read from the start.")
+            return None
+        chunk_index["chunk_lines"] = [a_chunk["line"] for a_chunk in chunk_index["chunks"]] # for find_chunk(), built once
+        return chunk_index
+
+    @staticmethod
+    def find_chunk(chunk_index, line_idx):
+        """
+        Get the chunk of a chunk index that contains line_idx.
+        """
+        chunk_lines = chunk_index.get("chunk_lines")
+        if chunk_lines is None:
+            chunk_lines = [a_chunk["line"] for a_chunk in chunk_index["chunks"]]
+        return chunk_index["chunks"][max(bisect.bisect_right(chunk_lines, line_idx) - 1, 0)]
+
+    ### Compact well temperature files
+    @staticmethod
+    def get_compressor(compression):
+        """
+        (compress, decompress) functions of a block compression: "zlib" or "zstd".
+        """
+        if compression == "zlib":
+            return (lambda data: zlib.compress(data, 6)), zlib.decompress
+        if compression == "zstd":
+            if zstandard is None:
+                raise ImportError("Error: zstd compression requires the 'zstandard' package.")
+            return zstandard.ZstdCompressor(level=9).compress, zstandard.ZstdDecompressor().decompress
+        raise ValueError("Error: Compression must be 'zlib' or 'zstd'.")
+
+    @staticmethod
+    def narrow_ints(values):
+        """
+        Smallest signed integer dtype that holds all values.
+        """
+        low, high = (int(values.min()), int(values.max())) if values.size else (0, 0)
+        for dtype in (np.int8, np.int16, np.int32):
+            if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                return values.astype(dtype)
+        return values.astype(np.int64)
+
+    @staticmethod
+    def shuffle_bytes(values):
+        """
+        Group the n-th byte of every value together, so the mostly constant high bytes compress to almost nothing.
+        """
+        return values.view(np.uint8).reshape(-1, values.itemsize).T.tobytes()
+
+    @staticmethod
+    def unshuffle_bytes(data, dtype, count):
+        dtype = np.dtype(dtype)
+        return np.frombuffer(data, dtype=np.uint8, count=count * dtype.itemsize).reshape(dtype.itemsize, count).T.copy().view(dtype).ravel()
+
+    @staticmethod
+    def write_compact(output_path, extracted_df, decimals=2, block_frames=4096, compression="zlib"):
+        """
+        Write extracted well temperatures (Date, Time, A1, A2, ... as WellTempExtractor.get_extractedDF()) to a compact file.
+
+        Layout: b"MFZ1", header length (uint32), JSON header, then independently compressed blocks of frames.
+        A block holds, byte shuffled in the narrowest integer type:
+            time    -> seconds since the first frame, delta encoded
+            nan     -> bitmap of missing temperatures (only when there are any)
+            temps   -> fixed point (value * 10**decimals) per well, delta encoded along time, one well after another
+        Temperatures round-trip exactly at the given decimals (WellAnalyzer rounds to 2).
+        """
+        if not (isinstance(block_frames, int) and block_frames > 0):
+            raise ValueError("Error: Block frames must be a positive integer.")
+        compress = HikDataManager.get_compressor(compression)[0]
+        well_ids = [str(column) for column in extracted_df.columns[2:]]
+        temps = extracted_df.iloc[:, 2:].to_numpy(dtype=np.float64)
+        if np.isinf(temps).any():
+            raise ValueError("Error: Temperatures must be finite or NaN.")
+        tst = pd.to_datetime(extracted_df["Date"].astype(str) + " " + extracted_df["Time"].astype(str), format="%Y-%m-%d %H:%M:%S")
+        seconds = tst.to_numpy(dtype="datetime64[s]").astype(np.int64)
+        start = int(seconds[0]) if len(seconds) else 0
+        scale = 10 ** decimals
+
+        ## Fixed point, missing values repeat the previous value of the well so they cost no delta
+        missing = np.isnan(temps)
+        fixed = np.rint(np.where(missing, 0.0, temps) * scale).astype(np.int64)
+        if missing.any():
+            last_valid = np.maximum.accumulate(np.where(missing, 0, np.arange(len(temps))[:, None]), axis=0)
+            fixed = np.take_along_axis(fixed, last_valid, axis=0) # leading gaps stay 0
+
+        blocks = []
+        payloads = []
+        for first in range(0, len(temps), block_frames):
+            block_seconds = seconds[first:first + block_frames] - start
+            block_fixed = fixed[first:first + block_frames].T # well-major, each well is contiguous
+            block_missing = missing[first:first + block_frames]
+            time_deltas = HikDataManager.narrow_ints(np.diff(block_seconds, prepend=0))
+            temp_deltas = HikDataManager.narrow_ints(np.diff(block_fixed, axis=1, prepend=0).ravel())
+            parts = [HikDataManager.shuffle_bytes(time_deltas)]
+            if block_missing.any():
+                parts.append(np.packbits(block_missing.T).tobytes())
+            parts.append(HikDataManager.shuffle_bytes(temp_deltas))
+            payload = compress(b"".join(parts))
+            blocks.append({
+                "frames": len(block_seconds),
+                "bytes": len(payload),
+                "time_dtype": time_deltas.dtype.name,
+                "temp_dtype": temp_deltas.dtype.name,
+                "nan": bool(block_missing.any())
+                })
+            payloads.append(payload)
+
+        header = json.dumps({
+            "version": 1,
+            "start": str(np.datetime64(start, "s")).replace("T", " "),
+            "decimals": decimals,
+            "compression": compression,
+            "well_ids": well_ids,
+            "frames": len(temps),
+            "blocks": blocks
+            }, separators=(",", ":")).encode()
+        with open(output_path, mode="wb") as file:
+            file.write(HikDataManager.compact_magic)
+            file.write(struct.pack("<I", len(header)))
+            file.write(header)
+            for payload in payloads:
+                file.write(payload)
+        return output_path
+
+    @staticmethod
+    def read_compact(a_path):
+        """
+        Read a compact file (write_compact()) back into the DataFrame it was written from.
+        """
+        with open(a_path, mode="rb") as file:
+            if file.read(4) != HikDataManager.compact_magic:
+                raise ValueError("Error: Not a meltyfat compact file.")
+            header_len = struct.unpack("<I", file.read(4))[0]
+            header = json.loads(file.read(header_len))
+            data = memoryview(file.read())
+        decompress = HikDataManager.get_compressor(header["compression"])[1]
+        well_ids = header["well_ids"]
+        n_frames, n_wells = header["frames"], len(well_ids)
+
+        seconds = np.empty(n_frames, dtype=np.int64)
+        temps = np.empty((n_frames, n_wells), dtype=np.float64)
+        first = 0
+        position = 0
+        for block in header["blocks"]:
+            payload = memoryview(decompress(data[position:position + block["bytes"]])) # slices without copies
+            position += block["bytes"]
+            frames = block["frames"]
+            time_deltas = HikDataManager.unshuffle_bytes(payload, block["time_dtype"], frames)
+            payload = payload[time_deltas.nbytes:]
+            block_missing = None
+            if block["nan"]:
+                n_mask_bytes = (frames * n_wells + 7) // 8
+                block_missing = np.unpackbits(np.frombuffer(payload[:n_mask_bytes], dtype=np.uint8), count=frames * n_wells).reshape(n_wells, frames).T.astype(bool)
+                payload = payload[n_mask_bytes:]
+            temp_deltas = HikDataManager.unshuffle_bytes(payload, block["temp_dtype"], frames * n_wells)
+
+            seconds[first:first + frames] = np.cumsum(time_deltas, dtype=np.int64)
+            block_temps = np.cumsum(temp_deltas.reshape(n_wells, frames), axis=1, dtype=np.int64).T / 10 ** header["decimals"]
+            if block_missing is not None:
+                block_temps[block_missing] = np.nan
+            temps[first:first + frames] = block_temps
+            first += frames
+
+        ## 2024-08-18T15:07:59 -> Date / Time text without a Python loop
+        tst_chars = np.datetime_as_string(np.datetime64(header["start"].replace(" ", "T"), "s") + seconds, unit="s").astype("U19").view("U1").reshape(n_frames, 19)
+        extracted_df = pd.DataFrame(temps, columns=well_ids)
+        extracted_df.insert(0, "Time", np.ascontiguousarray(tst_chars[:, 11:]).view("U8").ravel().astype(object))
+        extracted_df.insert(0, "Date", np.ascontiguousarray(tst_chars[:, :10]).view("U10").ravel().astype(object))
+        return extracted_df
 
     @staticmethod
     def get_listOfCSVs(folder_of_frames):
@@ -43,7 +360,7 @@ class HikDataManager:
         Folder Naming:
             YYYYMMDD_hhmmss_thm.csv
         """
-        print(folder_of_frames)
+        logger.debug(folder_of_frames)
         csv_files = [os.path.join(folder_of_frames, f) for f in os.listdir(folder_of_frames) if HikDataManager.check_fname(f)]
         return sorted(csv_files) if csv_files else None
     
@@ -0,0 +1,113 @@
+import cv2
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class PlateDriftTracker:
+    """
+    Class to track a slow translation of the plate across frames from the thermal data itself,
+    using phase correlation of downsampled frames against a reference frame (NumPy FFT).
+    Much cheaper than re-running detection, so well coordinates can follow the plate during long runs.
+
+    Usage:
+        tracker = PlateDriftTracker(update_every=10)
+        for frame_idx, frame in enumerate(frames):
+            dx, dy = tracker.update(frame_idx, frame) # sensor pixels, relative to the reference frame
+    """
+    def __init__(self, reference_frame=None, downsample=2, update_every=1, min_response=0.05, max_shift=8):
+        if not (isinstance(downsample, int) and downsample >= 1):
+            raise ValueError("Error: Downsample must be an integer of at least 1.")
+        if not (isinstance(update_every, int) and update_every >= 1):
+            raise ValueError("Error: Update every must be an integer of at least 1.")
+        self.downsample = downsample # reduce each axis by this factor before correlation
+        self.update_every = update_every # estimate every N frames, reuse the shift in between
+        self.min_response = min_response # lower phase correlation peaks are ignored
+        self.max_shift = max_shift # the correlation peak is searched within this many sensor pixels
+
+        self.reference = None
+        self.reference_fft = None
+        self.window = None
+        self.shift = (0.0, 0.0) # (dx, dy) sensor pixels
+        self.response = None
+        if reference_frame is not None:
+            self.set_reference(reference_frame)
+
+    def prepare_frame(self, frame):
+        """
+        Downsample, fill missing pixels (ROI parsing) and remove the mean temperature.
+        """
+        frame = np.asarray(frame, dtype=np.float64)
+        if np.isnan(frame).any():
+            frame = np.where(np.isnan(frame), np.nanmean(frame), frame)
+        if self.downsample > 1:
+            height, width = frame.shape
+            frame = cv2.resize(frame, (width // self.downsample, height // self.downsample), interpolation=cv2.INTER_AREA)
+        return frame - frame.mean()
+
+    def set_reference(self, frame):
+        self.reference = self.prepare_frame(frame)
+        height, width = self.reference.shape
+        self.window = cv2.createHanningWindow((width, height), cv2.CV_64F)
+        self.reference_fft = np.fft.rfft2(self.reference * self.window)
+        self.shift = (0.0, 0.0)
+        self.response = None
+
+    def estimate_shift(self, frame):
+        """
+        Translation of frame relative to the reference.
+        The correlation peak is only searched within max_shift, a well plate is a periodic
+        pattern and shifts of a whole well pitch would otherwise be ambiguous.
+        return
+            (dx, dy) in sensor pixels, phase correlation response
+        """
+        if self.reference is None:
+            raise ValueError("Error: No reference frame. Please set_reference() first.")
+        height, width = self.reference.shape
+        cross_power = np.fft.rfft2(self.prepare_frame(frame) * self.window) * np.conj(self.reference_fft)
+        cross_power /= np.maximum(np.abs(cross_power), 1e-12)
+        correlation = np.fft.irfft2(cross_power, s=(height, width))
+
+        ## Peak search around zero shift, correlation wraps around the borders
+        radius = max(int(np.ceil(self.max_shift / self.downsample)), 1)
+        offsets_y = np.arange(-min(radius, height // 2 - 1), min(radius, height // 2 - 1) + 1)
+        offsets_x = np.arange(-min(radius, width // 2 - 1), min(radius, width // 2 - 1) + 1)
+        search = correlation[np.ix_(offsets_y % height, offsets_x % width)]
+        peak_y, peak_x = np.unravel_index(np.argmax(search), search.shape)
+        response = search[peak_y, peak_x]
+
+        ## Sub-pixel: centroid of the 3x3 neighbourhood
+        neighbourhood = correlation[np.ix_((offsets_y[peak_y] + np.arange(-1, 2)) % height, (offsets_x[peak_x] + np.arange(-1, 2)) % width)]
+        weights = np.maximum(neighbourhood, 0)
+        total = weights.sum()
+        dy = offsets_y[peak_y] + (weights.sum(axis=1) @ np.arange(-1, 2) / total if total > 0 else 0.0)
+        dx = offsets_x[peak_x] + (weights.sum(axis=0) @ np.arange(-1, 2) / total if total > 0 else 0.0)
+        return (float(dx) * self.downsample, float(dy) * self.downsample), float(response)
+
+    def update(self, frame_idx, frame):
+        """
+        Shift of the plate at frame_idx. The first frame becomes the reference,
+        afterwards the shift is re-estimated every update_every frames.
+        return
+            (dx, dy) rounded to whole sensor pixels
+        """
+        if self.reference is None:
+            self.set_reference(frame)
+        elif frame_idx % self.update_every == 0:
+            (dx, dy), response = self.estimate_shift(frame)
+            if response >= self.min_response and max(abs(dx), abs(dy)) <= self.max_shift:
+                self.shift = (dx, dy)
+                self.response = response
+            else:
+                logger.debug(f"Ignored drift estimate ({dx:.2f}, {dy:.2f}) with response {response:.3f}")
+        return int(round(self.shift[0])), int(round(self.shift[1]))
+
+    @staticmethod
+    def shift_coordinates(sensor_xs, sensor_ys, shift, sensor_shape):
+        """
+        Apply a (dx, dy) shift to well index tables, clipped to the sensor.
+        """
+        sensor_height, sensor_width = sensor_shape
+        shifted_xs = np.clip(np.asarray(sensor_xs) + shift[0], 0, sensor_width - 1)
+        shifted_ys = np.clip(np.asarray(sensor_ys) + shift[1], 0, sensor_height - 1)
+        return shifted_xs, shifted_ys
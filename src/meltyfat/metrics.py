@@ -0,0 +1,156 @@
+import io
+import sys
+import time
+import pstats
+import logging
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+## Optional: resource is not available on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger("meltyfat")
+
+def enable_logging(level=logging.INFO, fmt="%(asctime)s %(name)s %(levelname)s: %(message)s"):
+    """
+    Show meltyfat messages (including the "Success: ..." info messages) on the console.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(fmt))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    return handler
+
+class StageMetrics:
+    """
+    Class to time pipeline stages and report them through logging and an optional callback.
+
+    Every finished stage produces a record:
+        {
+        "stage": "map_csv",
+        "seconds": 1.52,
+        "frames": 9600, "frames_per_sec": 6315.8,
+        "bytes": 2.4e9, "bytes_per_sec": 1.6e9,
+        "peak_memory_bytes": ..., # tracemalloc peak with trace_memory=True, else process max RSS
+        "profile": "...", # cProfile top functions with profile=True, outermost stages only
+        ... # extra labels of the stage
+        }
+
+    Usage:
+        metrics = StageMetrics(callback=my_exporter)
+        extractor = HikExcelExtractor(vdo_csv, metrics=metrics)
+        ...
+        metrics.summary()
+    """
+    def __init__(self, callback=None, profile=False, trace_memory=False, profile_limit=20, log_level=logging.INFO):
+        self.callback = callback # callable(record)
+        self.profile = profile # cProfile each stage
+        self.trace_memory = trace_memory # tracemalloc peak of each stage
+        self.profile_limit = profile_limit
+        self.log_level = log_level
+        self.records = []
+        self.active_stages = [] # running stages, outermost first
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """
+        Time a stage. The yielded record can be updated with "frames", "bytes" or labels while it runs.
+        Stages may be nested (e.g. store_flush inside run_TempExtract): the outermost stage holds the
+        profile of everything below it and every stage gets its own memory peak.
+        """
+        record = {"stage": name, "frames": 0, "bytes": 0, **labels}
+        outermost = not self.active_stages
+        active = {"record": record, "peak": 0} # peak of the stage before its nested stages reset it
+        self.active_stages.append(active)
+
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            if not outermost:
+                parent = self.active_stages[-2]
+                parent["peak"] = max(parent["peak"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        profiler = None
+        if self.profile and outermost:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError: # another profiler is already running (Python 3.12+)
+                logger.warning(f"Stage {name}: another profiler is active, the stage is not profiled.")
+                profiler = None
+
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            self.active_stages.pop()
+            if profiler is not None:
+                profiler.disable()
+                stats_text = io.StringIO()
+                pstats.Stats(profiler, stream=stats_text).sort_stats("cumulative").print_stats(self.profile_limit)
+                record["profile"] = stats_text.getvalue()
+            if self.trace_memory:
+                record["peak_memory_bytes"] = max(active["peak"], tracemalloc.get_traced_memory()[1])
+                if self.active_stages:
+                    parent = self.active_stages[-1]
+                    parent["peak"] = max(parent["peak"], record["peak_memory_bytes"])
+                if started_tracing:
+                    tracemalloc.stop()
+            else:
+                record["peak_memory_bytes"] = self.get_max_rss()
+
+            record["seconds"] = seconds
+            record["frames_per_sec"] = record["frames"] / seconds if record["frames"] and seconds > 0 else None
+            record["bytes_per_sec"] = record["bytes"] / seconds if record["bytes"] and seconds > 0 else None
+            self.report(record)
+
+    def report(self, record):
+        self.records.append(record)
+        message = f"Stage {record['stage']}: {record['seconds']:.3f} s"
+        if record["frames_per_sec"]:
+            message += f", {record['frames']} frames ({record['frames_per_sec']:.1f} frames/s)"
+        if record["bytes_per_sec"]:
+            message += f", {record['bytes'] / 1e6:.1f} MB ({record['bytes_per_sec'] / 1e6:.1f} MB/s)"
+        if record["peak_memory_bytes"]:
+            message += f", peak memory {record['peak_memory_bytes'] / 1e6:.1f} MB"
+        logger.log(self.log_level, message)
+
+        ## A broken exporter must not stop an extraction job
+        if self.callback is not None:
+            try:
+                self.callback(record)
+            except Exception:
+                logger.exception("Error: Metrics callback failed.")
+
+    @staticmethod
+    def get_max_rss():
+        """
+        Peak resident memory of the process in bytes, None when unavailable.
+        """
+        if resource is None:
+            return None
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024 # bytes on macOS, kB elsewhere
+
+    def summary(self):
+        """
+        Totals per stage name: {"map_csv": {"calls": 1, "seconds": ..., "frames": ..., "bytes": ...}}
+        """
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record["stage"], {"calls": 0, "seconds": 0.0, "frames": 0, "bytes": 0})
+            total["calls"] += 1
+            total["seconds"] += record["seconds"]
+            total["frames"] += record["frames"]
+            total["bytes"] += record["bytes"]
+        return totals
+
+    def reset(self):
+        self.records = []
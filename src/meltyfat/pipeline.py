@@ -0,0 +1,214 @@
+import time
+import heapq
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_DONE = object() # end of stream marker
+
+class _StageQueue:
+    """
+    Bounded queue that measures how long producers wait for space (back-pressure)
+    and consumers wait for items (starvation), and how full it runs.
+    """
+    def __init__(self, name, maxsize, stop_event, poll_sec=0.1):
+        self.name = name
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.stop_event = stop_event
+        self.poll_sec = poll_sec
+        self.lock = threading.Lock()
+        self.puts = 0
+        self.depth_sum = 0
+        self.max_depth = 0
+        self.put_wait_sec = 0.0
+        self.get_wait_sec = 0.0
+
+    def put(self, item):
+        """
+        False when the pipeline stopped before there was space.
+        """
+        start = time.perf_counter()
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=self.poll_sec)
+            except queue.Full:
+                continue
+            depth = self.queue.qsize()
+            with self.lock:
+                self.put_wait_sec += time.perf_counter() - start
+                self.puts += 1
+                self.depth_sum += depth
+                self.max_depth = max(self.max_depth, depth)
+            return True
+        return False
+
+    def get(self):
+        """
+        _DONE when the pipeline stopped before an item arrived.
+        """
+        start = time.perf_counter()
+        while not self.stop_event.is_set():
+            try:
+                item = self.queue.get(timeout=self.poll_sec)
+            except queue.Empty:
+                continue
+            with self.lock:
+                self.get_wait_sec += time.perf_counter() - start
+            return item
+        return _DONE
+
+    def get_stats(self):
+        return {
+            "maxsize": self.queue.maxsize,
+            "items": self.puts,
+            "mean_depth": self.depth_sum / self.puts if self.puts else 0.0,
+            "max_depth": self.max_depth,
+            "put_wait_sec": self.put_wait_sec, # producer stalled, the consumer is the bottleneck
+            "get_wait_sec": self.get_wait_sec # consumer starved, the producer is the bottleneck
+        }
+
+class FramePipeline:
+    """
+    Class to overlap reading, computing and writing of frames on threads linked by bounded queues.
+
+        reader thread        -> iterates source (e.g. parsing the VDO CSV)
+        compute threads      -> compute(item) (e.g. WellAnalyzer.get_sensor_temps, NumPy releases the GIL)
+        caller (writer)      -> consumes run() in source order (e.g. result store, checkpoint)
+
+    Full queues block the stage before them. The reader also waits while queue_size frames are between
+    reading and writing (queued, computing or waiting to be reordered), so memory stays bounded by
+    queue_size frames even when one compute thread stalls. An error in any stage stops the pipeline and
+    is raised from run().
+
+    get_stats() after a run:
+        {
+        "seconds": ..., "items": ...,
+        "queues": {"read": {"maxsize", "items", "mean_depth", "max_depth", "put_wait_sec", "get_wait_sec"}, "write": {...}},
+        "reorder": {"window": queue_size, "max_pending": ..., "wait_sec": ...}, # frames held back for source order, reader waits on the window
+        "busy_sec": {"read": ..., "compute": ..., "write": ...} # time spent working, compute summed over threads
+        }
+    A stage whose input queue is mostly full (put_wait_sec high upstream) is the bottleneck.
+
+    Usage:
+        pipeline = FramePipeline(queue_size=16, compute_threads=2)
+        for result in pipeline.run(frames, compute):
+            write(result)
+        pipeline.get_stats()
+    """
+    def __init__(self, queue_size=16, compute_threads=1):
+        if not (isinstance(queue_size, int) and queue_size > 0):
+            raise ValueError("Error: Queue size must be a positive integer.")
+        if not (isinstance(compute_threads, int) and compute_threads > 0):
+            raise ValueError("Error: Compute threads must be a positive integer.")
+        self.queue_size = queue_size
+        self.compute_threads = compute_threads
+        self.stats = None
+
+    def run(self, source, compute):
+        """
+        Yield compute(item) for every item of source, in source order.
+        """
+        stop_event = threading.Event()
+        read_queue = _StageQueue("read", self.queue_size, stop_event)
+        write_queue = _StageQueue("write", self.queue_size, stop_event)
+        window = threading.Semaphore(self.queue_size) # frames between reading and writing
+        errors = []
+        busy_sec = {"read": 0.0, "compute": 0.0, "write": 0.0}
+        busy_lock = threading.Lock()
+        reorder = {"window": self.queue_size, "max_pending": 0, "wait_sec": 0.0}
+
+        def fail(error):
+            errors.append(error)
+            stop_event.set()
+
+        def read():
+            try:
+                items = iter(source)
+                seq = 0
+                while True:
+                    ## Wait for the writer when the oldest frame in flight holds up the others
+                    start = time.perf_counter()
+                    while not window.acquire(timeout=read_queue.poll_sec):
+                        if stop_event.is_set():
+                            return
+                    reorder["wait_sec"] += time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    item = next(items, _DONE)
+                    busy_sec["read"] += time.perf_counter() - start
+                    if item is _DONE or not read_queue.put((seq, item)):
+                        break
+                    seq += 1
+            except BaseException as error:
+                fail(error)
+            finally:
+                for _ in range(self.compute_threads):
+                    read_queue.put(_DONE)
+
+        def work():
+            try:
+                while True:
+                    entry = read_queue.get()
+                    if entry is _DONE:
+                        break
+                    seq, item = entry
+                    start = time.perf_counter()
+                    result = compute(item)
+                    with busy_lock:
+                        busy_sec["compute"] += time.perf_counter() - start
+                    if not write_queue.put((seq, result)):
+                        break
+            except BaseException as error:
+                fail(error)
+            finally:
+                write_queue.put(_DONE)
+
+        threads = [threading.Thread(target=read, name="meltyfat-read", daemon=True)]
+        threads += [threading.Thread(target=work, name=f"meltyfat-compute-{idx}", daemon=True) for idx in range(self.compute_threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        ## Results may arrive out of order from several compute threads
+        pending = []
+        next_seq = 0
+        finished_workers = 0
+        items = 0
+        try:
+            while finished_workers < self.compute_threads:
+                entry = write_queue.get()
+                if errors:
+                    break
+                if entry is _DONE:
+                    finished_workers += 1
+                    continue
+                heapq.heappush(pending, entry)
+                reorder["max_pending"] = max(reorder["max_pending"], len(pending))
+                while pending and pending[0][0] == next_seq:
+                    result = heapq.heappop(pending)[1]
+                    next_seq += 1
+                    items += 1
+                    start = time.perf_counter()
+                    yield result
+                    busy_sec["write"] += time.perf_counter() - start
+                    window.release()
+        finally:
+            stop_event.set() # also when the caller stops early
+            for thread in threads:
+                thread.join()
+            self.stats = {
+                "seconds": time.perf_counter() - started,
+                "items": items,
+                "compute_threads": self.compute_threads,
+                "queues": {stage_queue.name: stage_queue.get_stats() for stage_queue in (read_queue, write_queue)},
+                "reorder": reorder,
+                "busy_sec": busy_sec
+            }
+            logger.debug(f"Pipeline: {self.stats}")
+        if errors:
+            raise errors[0]
+
+    def get_stats(self):
+        return self.stats
@@ -0,0 +1,70 @@
+import string
+
+class PlateLayout:
+    """
+    Class to describe a well plate: rows x columns and the well pitch (centre to centre) in mm.
+    Well ids run from A1 (first row, first column) in row-major order.
+
+    ------ SBS well plates ------
+    Wells       Rows x Cols     Pitch
+    24          4 x 6           19.3 mm
+    48          6 x 8           13.0 mm
+    96          8 x 12          9.0 mm
+    384         16 x 24         4.5 mm
+    -----------------------------
+    """
+    def __init__(self, rows, cols, pitch_mm, name=None):
+        if not (isinstance(rows, int) and isinstance(cols, int) and rows > 0 and cols > 0):
+            raise ValueError("Error: Rows and columns must be positive integers.")
+        if rows > len(string.ascii_uppercase):
+            raise ValueError("Error: At most 26 rows (A -> Z) are supported.")
+        if not pitch_mm > 0:
+            raise ValueError("Error: Pitch must be greater than zero.")
+        self.rows = rows
+        self.cols = cols
+        self.pitch_mm = pitch_mm
+        self.name = name if name else f"{rows * cols}-well"
+
+    def __repr__(self):
+        return f"PlateLayout(rows={self.rows}, cols={self.cols}, pitch_mm={self.pitch_mm}, name='{self.name}')"
+
+    def __eq__(self, other):
+        return isinstance(other, PlateLayout) and (self.rows, self.cols, self.pitch_mm) == (other.rows, other.cols, other.pitch_mm)
+
+    @property
+    def n_wells(self):
+        return self.rows * self.cols
+
+    @property
+    def row_names(self):
+        return list(string.ascii_uppercase[:self.rows]) # 'A -> H' for 96 wells
+
+    def well_ids(self, zero_pad=False):
+        """
+        Well ids in row-major order: [A1, A2, ..., H12] or [A01, A02, ..., H12] with zero_pad.
+        """
+        col_width = 2 if zero_pad else 0
+        return [f"{row}{col:0{col_width}d}"
+            for row in self.row_names
+            for col in range(1, self.cols + 1)
+            ]
+
+## Standard plates
+PLATE_LAYOUTS = {
+    24: PlateLayout(4, 6, 19.3),
+    48: PlateLayout(6, 8, 13.0),
+    96: PlateLayout(8, 12, 9.0),
+    384: PlateLayout(16, 24, 4.5),
+}
+
+def get_plate_layout(layout=None):
+    """
+    Get a PlateLayout from a layout, a number of wells (24, 48, 96, 384) or None (96 wells).
+    """
+    if layout is None:
+        return PLATE_LAYOUTS[96]
+    if isinstance(layout, PlateLayout):
+        return layout
+    if layout in PLATE_LAYOUTS:
+        return PLATE_LAYOUTS[layout]
+    raise ValueError(f"Error: Unsupported plate layout. Use a PlateLayout or one of {sorted(PLATE_LAYOUTS)} wells.")
@@ -0,0 +1,229 @@
+import io
+import json
+import gzip
+import hashlib
+import logging
+import argparse
+import threading
+import numpy as np
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .resultstore import WellResultStore # SQLite results
+
+logger = logging.getLogger(__name__)
+
+class _ResultRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of WellResultServer, every request reads the database with its own connection.
+    """
+    server_version = "meltyfat"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            with WellResultStore(self.server.db_path, read_only=True) as store:
+                if parts == ["runs"]:
+                    self.send_runs(store)
+                elif len(parts) == 3 and parts[0] == "runs" and parts[2] in ("frames", "pyramid"):
+                    run_id = int(parts[1])
+                    version = store.get_run_version(run_id)
+                    if version is None:
+                        self.send_error(404, "Run not found")
+                        return
+                    ## The run version changes with every write, unchanged data -> 304
+                    etag = '"' + hashlib.sha1(f"{self.path}|{version[0]}".encode()).hexdigest()[:20] + '"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.end_headers()
+                        return
+                    if parts[2] == "frames":
+                        self.send_frames(store, run_id, params, etag)
+                    else:
+                        self.send_pyramid(store, run_id, params, etag)
+                else:
+                    self.send_error(404, "Unknown endpoint")
+        except ValueError as error:
+            self.send_error(400, str(error))
+
+    def send_runs(self, store):
+        runs = store.get_runs()
+        self.send_json({"runs": runs.replace({np.nan: None}).to_dict(orient="records")})
+
+    def send_frames(self, store, run_id, params, etag):
+        """
+        /runs/<run_id>/frames?cursor=-1&since=<tst>&limit=1000&format=json|npz
+        """
+        delta = store.get_frames_since(
+            run_id,
+            cursor=int(params.get("cursor", -1)),
+            since_tst=params.get("since"),
+            limit=int(params.get("limit", self.server.default_limit))
+            )
+        headers = {"ETag": etag, "X-Meltyfat-Cursor": str(delta["cursor"]), "X-Meltyfat-More": str(delta["more"]).lower()}
+        if params.get("format", "json") == "npz":
+            self.send_npz({
+                "frame_idx": delta["frame_idx"],
+                "tst": np.array(delta["tst"], dtype="U19"),
+                "well_ids": np.array(delta["well_ids"], dtype="U4"),
+                "mean": delta["mean"].astype(np.float32),
+                "sd": delta["sd"].astype(np.float32)
+                }, headers)
+        else:
+            self.send_json({
+                **delta,
+                "frame_idx": delta["frame_idx"].tolist(),
+                "mean": self.to_json_matrix(delta["mean"]),
+                "sd": self.to_json_matrix(delta["sd"])
+                }, headers)
+
+    def send_pyramid(self, store, run_id, params, etag):
+        """
+        /runs/<run_id>/pyramid?well=A1&bucket_sec=60&start=<tst>&end=<tst>&max_points=2000&format=json|npz
+        """
+        if "well" not in params:
+            raise ValueError("Error: Missing well parameter.")
+        bucket_sec = int(params["bucket_sec"]) if "bucket_sec" in params else None
+        pyramid_df = store.get_well_pyramid(run_id, params["well"], bucket_sec=bucket_sec, start_tst=params.get("start"),
+            end_tst=params.get("end"), max_points=int(params.get("max_points", 2000)))
+        headers = {"ETag": etag}
+        columns = {
+            "bucket_start": pyramid_df["bucket_start"].to_numpy(dtype="U19"),
+            "count": pyramid_df["count"].to_numpy(dtype=np.int64),
+            **{value: pyramid_df[value].to_numpy(dtype=np.float64) for value in ("min", "mean", "max")}
+        }
+        if params.get("format", "json") == "npz":
+            self.send_npz({**columns, **{value: columns[value].astype(np.float32) for value in ("min", "mean", "max")}}, headers)
+        else:
+            self.send_json({
+                "run_id": run_id,
+                "well_id": params["well"],
+                "bucket_start": columns["bucket_start"].tolist(),
+                "count": columns["count"].tolist(),
+                **{value: self.to_json_matrix(columns[value]) for value in ("min", "mean", "max")}
+                }, headers)
+
+    @staticmethod
+    def to_json_matrix(values):
+        """
+        NaN -> null, JSON has no NaN.
+        """
+        return np.where(np.isnan(values), None, values).tolist()
+
+    def send_json(self, payload, headers=None):
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        self.send_body(body, "application/json", headers)
+
+    def send_npz(self, arrays, headers=None):
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        self.send_body(buffer.getvalue(), "application/octet-stream", headers)
+
+    def send_body(self, body, content_type, headers=None):
+        compress = "gzip" in self.headers.get("Accept-Encoding", "") and len(body) > 1024
+        if compress:
+            body = gzip.compress(body, compresslevel=5)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache") # revalidate with the ETag
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+class WellResultServer:
+    """
+    Class to serve a WellResultStore database over HTTP on the local machine, so a dashboard
+    can poll new rows while WellTempExtractor is still writing them.
+
+    Endpoints (GET):
+        /runs                           -> runs as JSON
+        /runs/<run_id>/frames           -> frames after ?cursor=<frame_idx> or ?since=<tst>, columnar
+                                           (well_ids, frame_idx, tst, mean[frame][well], sd[frame][well]),
+                                           the next cursor is in the body and the X-Meltyfat-Cursor header
+        /runs/<run_id>/pyramid?well=A1  -> WellTimePyramid buckets of a well (bucket_sec, start, end, max_points)
+    ?format=npz returns numpy.load() readable arrays instead of JSON. Responses carry an ETag of the
+    run version (If-None-Match -> 304 Not Modified) and are gzip compressed when accepted.
+    Rows become visible when the store flushes, use a small WellResultStore batch_size for live views.
+
+    Usage:
+        server = WellResultServer("results.sqlite", port=8050)
+        server.start() # background thread
+        ...
+        server.stop()
+    """
+    def __init__(self, db_path, host="127.0.0.1", port=8050, default_limit=1000):
+        self.db_path = db_path
+        self.host = host
+        self.port = port
+        self.default_limit = default_limit # frames per response
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def create_httpd(self):
+        httpd = ThreadingHTTPServer((self.host, self.port), _ResultRequestHandler)
+        httpd.daemon_threads = True
+        httpd.db_path = self.db_path
+        httpd.default_limit = self.default_limit
+        self.port = httpd.server_address[1] # port = 0 -> any free port
+        return httpd
+
+    def start(self):
+        """
+        Serve in a background thread.
+        """
+        if self.httpd is not None:
+            raise ValueError("Error: Server is already running.")
+        self.httpd = self.create_httpd()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="meltyfat-result-server", daemon=True)
+        self.thread.start()
+        logger.info(f"Success: Serving {self.db_path} on {self.url}")
+        return self.url
+
+    def serve_forever(self):
+        """
+        Serve in the calling thread until interrupted.
+        """
+        self.httpd = self.create_httpd()
+        logger.info(f"Success: Serving {self.db_path} on {self.url}")
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.httpd.server_close()
+            self.httpd = None
+
+    def stop(self):
+        if self.httpd is None:
+            return
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+        self.httpd = None
+        self.thread = None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve meltyfat results (WellResultStore) on the local machine.")
+    parser.add_argument("db_path", help="WellResultStore SQLite database")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s: %(message)s")
+    WellResultServer(args.db_path, host=args.host, port=args.port).serve_forever()
+
+if __name__ == "__main__":
+    main()
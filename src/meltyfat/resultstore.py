@@ -0,0 +1,348 @@
+import os
+import sqlite3
+import logging
+import pathlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from .metrics import StageMetrics # Stage timers
+from .timepyramid import WellTimePyramid # Downsampled summaries
+
+logger = logging.getLogger(__name__)
+
+class WellResultStore:
+    """
+    Class to store extracted well temperatures in a local SQLite database, so a dashboard can
+    query one well over time or all wells at a time without re-reading the extracted CSVs.
+
+    Rows are kept in long format and appended in batched transactions:
+        runs        (run_id, run_name, created, source, layout, detect_window, version, last_frame_idx)
+        well_temps  (run_id, well_id, frame_idx, tst, mean, sd)
+        well_pyramid (run_id, bucket_sec, well_id, bucket_start, count, min, mean, max) -> WellTimePyramid
+
+    Indexes:
+        (run_id, well_id, frame_idx) -> one well over time (primary key)
+        (run_id, tst)                -> all wells at time t
+        (run_id, frame_idx)          -> frames added since a cursor (get_frames_since())
+        (run_id, bucket_sec, well_id, bucket_start) -> one well at one resolution (primary key)
+
+    Usage:
+        with WellResultStore("results.sqlite") as store:
+            extractor.set_result_store(store, run_name="melt_01")
+            extractor.run_TempExtract()
+            store.get_well_series(extractor.run_id, "A1")
+
+    read_only = True opens an existing database for queries only, e.g. from another
+    thread or process while an extraction is still writing (WellResultServer).
+    """
+    def __init__(self, db_path, batch_size=10000, metrics=None, read_only=False):
+        if not (isinstance(batch_size, int) and batch_size > 0):
+            raise ValueError("Error: Batch size must be a positive integer.")
+        self.metrics = metrics if metrics is not None else StageMetrics() # Stage timers
+        self.db_path = db_path
+        self.batch_size = batch_size # rows per transaction
+        self.pending_rows = [] # rows waiting for the next transaction
+        self.pending_pyramid_rows = []
+        self.read_only = read_only
+
+        if read_only:
+            if not os.path.exists(db_path):
+                raise FileExistsError("Error: Invalid result database path.")
+            self.connection = sqlite3.connect(f"{pathlib.Path(db_path).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.connection = sqlite3.connect(db_path, check_same_thread=False) # extraction may run in another thread
+            self.connection.execute("PRAGMA journal_mode=WAL") # readers do not block the writer
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.create_tables()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def create_tables(self):
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id INTEGER PRIMARY KEY,
+                    run_name TEXT NOT NULL,
+                    created TEXT NOT NULL,
+                    source TEXT,
+                    layout TEXT,
+                    detect_window INTEGER,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    last_frame_idx INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS well_temps (
+                    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+                    well_id TEXT NOT NULL,
+                    frame_idx INTEGER NOT NULL,
+                    tst TEXT NOT NULL,
+                    mean REAL,
+                    sd REAL,
+                    PRIMARY KEY (run_id, well_id, frame_idx)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_well_temps_tst ON well_temps (run_id, tst);
+                CREATE INDEX IF NOT EXISTS idx_well_temps_frame ON well_temps (run_id, frame_idx);
+                CREATE TABLE IF NOT EXISTS well_pyramid (
+                    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+                    bucket_sec INTEGER NOT NULL,
+                    well_id TEXT NOT NULL,
+                    bucket_start TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    min REAL,
+                    mean REAL,
+                    max REAL,
+                    PRIMARY KEY (run_id, bucket_sec, well_id, bucket_start)
+                ) WITHOUT ROWID;
+                """)
+
+    def create_run(self, run_name=None, source=None, layout=None, detect_window=None):
+        """
+        Register a new extraction run.
+        return
+            run_id
+        """
+        created = datetime.now().isoformat(timespec="seconds")
+        if not run_name:
+            run_name = datetime.now().strftime("%Y%m%d_%H%M%S") # YYYYMMDD_HHMMSS
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (run_name, created, source, layout, detect_window) VALUES (?, ?, ?, ?, ?)",
+                (run_name, created, source, None if layout is None else str(layout), detect_window)
+                )
+        return cursor.lastrowid
+
+    @staticmethod
+    def format_tst(date_str, time_str):
+        """
+        Sortable timestamp text: 2024-08-18 15:07:59
+        """
+        return f"{date_str} {time_str}"
+
+    def append_frame(self, run_id, frame_idx, date_str, time_str, well_ids, means, sds=None):
+        """
+        Queue the wells of one frame, written once batch_size rows are queued.
+        A frame is never split across transactions, readers see whole frames only.
+        """
+        tst = self.format_tst(date_str, time_str)
+        if sds is None:
+            sds = [None] * len(well_ids)
+        for well_id, mean, sd in zip(well_ids, means, sds):
+            self.pending_rows.append((run_id, well_id, frame_idx, tst, self.to_sql_float(mean), self.to_sql_float(sd)))
+        if len(self.pending_rows) >= self.batch_size:
+            self.flush()
+
+    def append_buckets(self, run_id, well_ids, buckets):
+        """
+        Queue completed WellTimePyramid buckets.
+        """
+        for bucket in buckets:
+            for well_idx, well_id in enumerate(well_ids):
+                self.pending_pyramid_rows.append((
+                    run_id, bucket["bucket_sec"], well_id, bucket["bucket_start"], int(bucket["count"][well_idx]),
+                    self.to_sql_float(bucket["min"][well_idx]), self.to_sql_float(bucket["mean"][well_idx]), self.to_sql_float(bucket["max"][well_idx])
+                    ))
+        if len(self.pending_pyramid_rows) >= self.batch_size:
+            self.flush()
+
+    @staticmethod
+    def to_sql_float(value):
+        """
+        NaN is stored as NULL
+        """
+        if value is None or value != value:
+            return None
+        return float(value)
+
+    def flush(self):
+        """
+        Write the queued rows in one transaction.
+        """
+        if not (self.pending_rows or self.pending_pyramid_rows):
+            return
+        ## Last frame of every run in this batch, the run version changes with every write
+        last_frame_idxs = {}
+        for run_id, well_id, frame_idx, *values in self.pending_rows:
+            last_frame_idxs[run_id] = max(last_frame_idxs.get(run_id, frame_idx), frame_idx)
+        run_ids = {row[0] for row in self.pending_pyramid_rows} | set(last_frame_idxs)
+
+        with self.metrics.stage("store_flush", db=self.db_path) as record:
+            with self.connection:
+                self.connection.executemany(
+                    "UPDATE runs SET version = version + 1, last_frame_idx = MAX(COALESCE(last_frame_idx, -1), COALESCE(?, -1)) WHERE run_id = ?",
+                    [(last_frame_idxs.get(run_id), run_id) for run_id in run_ids]
+                    )
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO well_temps (run_id, well_id, frame_idx, tst, mean, sd) VALUES (?, ?, ?, ?, ?, ?)",
+                    self.pending_rows
+                    )
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO well_pyramid (run_id, bucket_sec, well_id, bucket_start, count, min, mean, max) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    self.pending_pyramid_rows
+                    )
+            record["rows"] = len(self.pending_rows) + len(self.pending_pyramid_rows)
+        self.pending_rows = []
+        self.pending_pyramid_rows = []
+
+    def close(self):
+        if self.connection is None:
+            return
+        if not self.read_only:
+            self.flush()
+        self.connection.close()
+        self.connection = None
+
+    ### Queries
+    def get_runs(self):
+        return pd.read_sql_query("SELECT * FROM runs ORDER BY run_id", self.connection)
+
+    def get_run_id(self, run_name):
+        """
+        Latest run with the given name, None when not found.
+        """
+        row = self.connection.execute("SELECT MAX(run_id) FROM runs WHERE run_name = ?", (run_name,)).fetchone()
+        return row[0]
+
+    def get_run_version(self, run_id):
+        """
+        (version, last_frame_idx) of a run, version increases with every write. None when not found.
+        """
+        return self.connection.execute("SELECT version, last_frame_idx FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+
+    def get_frames_since(self, run_id, cursor=-1, since_tst=None, limit=1000):
+        """
+        Frames added after a cursor (a frame_idx, -1 -> from the start) or after since_tst, in columnar form:
+            {
+            "run_id": 1, "cursor": 41, "more": False, # cursor of the last frame returned, pass it to the next call
+            "well_ids": ["A1", ..., "H12"],
+            "frame_idx": array (frames,), "tst": ["2024-05-10 12:45:46", ...],
+            "mean": array (frames, wells), "sd": array (frames, wells) # NaN where a value is missing
+            }
+        """
+        if not (isinstance(limit, int) and limit > 0):
+            raise ValueError("Error: Limit must be a positive integer.")
+        query = "SELECT DISTINCT frame_idx, tst FROM well_temps WHERE run_id = ? AND frame_idx > ?"
+        params = [run_id, cursor]
+        if since_tst is not None:
+            query += " AND tst > ?"
+            params.append(since_tst)
+        query += " ORDER BY frame_idx LIMIT ?"
+        params.append(limit + 1) # one more to know if there is more
+        frames = self.connection.execute(query, params).fetchall()
+        more = len(frames) > limit
+        frames = frames[:limit]
+
+        frame_idxs = np.array([frame[0] for frame in frames], dtype=np.int64)
+        well_ids = []
+        means = np.empty((len(frames), 0))
+        sds = np.empty((len(frames), 0))
+        if frames:
+            rows = self.connection.execute(
+                "SELECT frame_idx, well_id, mean, sd FROM well_temps WHERE run_id = ? AND frame_idx BETWEEN ? AND ?",
+                (run_id, int(frame_idxs[0]), int(frame_idxs[-1]))
+                ).fetchall()
+            well_ids = sorted({row[1] for row in rows}, key=lambda well_id: (well_id[0], int(well_id[1:]))) # A1
+            well_positions = {well_id: position for position, well_id in enumerate(well_ids)}
+            row_positions = np.searchsorted(frame_idxs, [row[0] for row in rows])
+            col_positions = np.array([well_positions[row[1]] for row in rows], dtype=np.int64)
+            means = np.full((len(frames), len(well_ids)), np.nan)
+            sds = np.full((len(frames), len(well_ids)), np.nan)
+            means[row_positions, col_positions] = np.array([row[2] for row in rows], dtype=np.float64) # NULL -> NaN
+            sds[row_positions, col_positions] = np.array([row[3] for row in rows], dtype=np.float64)
+
+        return {
+            "run_id": run_id,
+            "cursor": int(frame_idxs[-1]) if frames else cursor,
+            "more": more,
+            "well_ids": well_ids,
+            "frame_idx": frame_idxs,
+            "tst": [frame[1] for frame in frames],
+            "mean": means,
+            "sd": sds
+        }
+
+    def get_well_series(self, run_id, well_id, start_tst=None, end_tst=None):
+        """
+        One well over time: DataFrame of frame_idx, tst, mean, sd.
+        start_tst / end_tst -> "YYYY-MM-DD HH:MM:SS", inclusive
+        """
+        query = "SELECT frame_idx, tst, mean, sd FROM well_temps WHERE run_id = ? AND well_id = ?"
+        params = [run_id, well_id]
+        if start_tst is not None:
+            query += " AND tst >= ?"
+            params.append(start_tst)
+        if end_tst is not None:
+            query += " AND tst <= ?"
+            params.append(end_tst)
+        query += " ORDER BY frame_idx"
+        return pd.read_sql_query(query, self.connection, params=params)
+
+    def get_bucket_secs(self, run_id):
+        """
+        Pyramid levels stored for a run, e.g. [1, 10, 60, 600]
+        """
+        rows = self.connection.execute("SELECT DISTINCT bucket_sec FROM well_pyramid WHERE run_id = ? ORDER BY bucket_sec", (run_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def get_well_pyramid(self, run_id, well_id, bucket_sec=None, start_tst=None, end_tst=None, max_points=2000):
+        """
+        One well over time at one resolution: DataFrame of bucket_start, count, min, mean, max.
+        bucket_sec = None -> finest stored level with at most max_points buckets between start_tst and end_tst
+        """
+        if bucket_sec is None:
+            bucket_secs = self.get_bucket_secs(run_id)
+            if not bucket_secs:
+                raise ValueError("Error: No time pyramid stored for this run.")
+            if start_tst is None or end_tst is None:
+                first_tst, last_tst = self.connection.execute(
+                    "SELECT MIN(bucket_start), MAX(bucket_start) FROM well_pyramid WHERE run_id = ? AND bucket_sec = ? AND well_id = ?",
+                    (run_id, min(bucket_secs), well_id)
+                    ).fetchone()
+                if first_tst is None:
+                    return pd.DataFrame(columns=["bucket_start", "count", "min", "mean", "max"])
+                start_tst, end_tst = start_tst or first_tst, end_tst or last_tst
+            bucket_sec = WellTimePyramid.choose_bucket_sec(bucket_secs, start_tst, end_tst, max_points=max_points)
+
+        query = "SELECT bucket_start, count, min, mean, max FROM well_pyramid WHERE run_id = ? AND bucket_sec = ? AND well_id = ?"
+        params = [run_id, bucket_sec, well_id]
+        if start_tst is not None:
+            query += " AND bucket_start >= ?"
+            params.append(WellTimePyramid.floor_tst(start_tst, bucket_sec)) # bucket containing start_tst
+        if end_tst is not None:
+            query += " AND bucket_start <= ?"
+            params.append(end_tst)
+        query += " ORDER BY bucket_start"
+        return pd.read_sql_query(query, self.connection, params=params)
+
+    def get_wells_at(self, run_id, tst):
+        """
+        All wells at time t: DataFrame of well_id, frame_idx, mean, sd.
+        Rows are from the first frame at or after tst.
+        """
+        row = self.connection.execute("SELECT MIN(tst) FROM well_temps WHERE run_id = ? AND tst >= ?", (run_id, tst)).fetchone()
+        if row[0] is None:
+            return pd.DataFrame(columns=["well_id", "frame_idx", "mean", "sd"])
+        first_frame = self.connection.execute("SELECT MIN(frame_idx) FROM well_temps WHERE run_id = ? AND tst = ?", (run_id, row[0])).fetchone()[0]
+        return pd.read_sql_query(
+            "SELECT well_id, frame_idx, mean, sd FROM well_temps WHERE run_id = ? AND tst = ? AND frame_idx = ?",
+            self.connection, params=[run_id, row[0], first_frame]
+            )
+
+    def get_extractedDF(self, run_id, value="mean"):
+        """
+        A run in the wide format of WellTempExtractor.get_extractedDF(): Date, Time, A1, ..., H12
+        """
+        if value not in ("mean", "sd"):
+            raise ValueError("Error: Value must be 'mean' or 'sd'.")
+        long_df = pd.read_sql_query(f"SELECT well_id, frame_idx, tst, {value} FROM well_temps WHERE run_id = ?", self.connection, params=[run_id])
+        if long_df.empty:
+            return long_df
+        well_ids = sorted(long_df["well_id"].unique(), key=lambda well_id: (well_id[0], int(well_id[1:]))) # A1
+        wide_df = long_df.pivot(index=["frame_idx", "tst"], columns="well_id", values=value)[well_ids].reset_index()
+        wide_df.insert(0, "Date", wide_df["tst"].str[:10])
+        wide_df.insert(1, "Time", wide_df["tst"].str[11:])
+        wide_df.columns.name = None
+        return wide_df.drop(columns=["frame_idx", "tst"])
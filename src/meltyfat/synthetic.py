@@ -0,0 +1,149 @@
+import os
+import cv2
+import numpy as np
+from datetime import datetime, timedelta
+
+from .datamanager import HikDataManager # Compressed output
+from .platelayout import get_plate_layout # 24 / 48 / 96 / 384 well plates
+
+class SyntheticHikData:
+    """
+    Class to generate synthetic HIKMICRO Pocket 2 data with known well positions,
+    for benchmarks and for checking results against a known answer.
+
+    Usage:
+        Create object -> write_plate_image() / write_vdo_csv() / get_detected_wells()
+
+    ------ HIKMICRO Pocket 2 ------
+    Description             W x H
+    Image Dimensions        640x480
+    Sensor Dimensions       256x192
+    -------------------------------
+
+    layout -> PlateLayout or number of wells (24, 48, 96, 384), overrides n_rows / n_cols
+              and scales the pitch and radius from the 96 well plate (9.0 mm -> 40 px)
+    """
+    def __init__(self, n_rows=8, n_cols=12, well_pitch_px=40, well_radius_px=13, seed=0, layout=None):
+        ## Default Parameters
+        self.image_width, self.image_height = 640, 480
+        self.sensor_width, self.sensor_height = 256, 192
+        self.start_tst = datetime(2024, 5, 10, 12, 45, 46, 205000)
+        self.plate_temp = 25.0 # Celsius at t = 0
+        self.heating_rate = 0.05 # Celsius per second
+        self.noise_sd = 0.2
+
+        ## Plate
+        if layout is not None:
+            layout = get_plate_layout(layout)
+            n_rows, n_cols = layout.rows, layout.cols
+            well_pitch_px = int(round(layout.pitch_mm * 40 / 9.0))
+            well_radius_px = int(round(well_pitch_px * 13 / 40))
+        self.n_rows = n_rows
+        self.n_cols = n_cols
+        self.well_pitch_px = well_pitch_px
+        self.well_radius_px = well_radius_px
+        if (n_cols - 1) * well_pitch_px + 2 * well_radius_px >= self.image_width or (n_rows - 1) * well_pitch_px + 2 * well_radius_px >= self.image_height:
+            raise ValueError("Error: Plate does not fit into the reference image.")
+        self.rng = np.random.default_rng(seed)
+
+        ## Per well temperature offsets, a gradient across the columns
+        self.well_offsets = np.repeat(np.arange(n_cols, dtype=np.float64)[None, :] * 0.5, n_rows, axis=0).ravel()
+        self.well_offsets += self.rng.normal(0, 0.1, self.well_offsets.shape)
+
+        self.well_centers = self.create_well_centers()
+        self.well_labels = self.create_well_labels()
+
+    def create_well_centers(self):
+        """
+        Image coordinates (x, y) of every well in row-major order (A1, A2, ..., H12), centred in the image.
+        """
+        origin_x = (self.image_width - (self.n_cols - 1) * self.well_pitch_px) // 2
+        origin_y = (self.image_height - (self.n_rows - 1) * self.well_pitch_px) // 2
+        return [(origin_x + col * self.well_pitch_px, origin_y + row * self.well_pitch_px)
+            for row in range(self.n_rows)
+            for col in range(self.n_cols)
+            ]
+
+    def create_well_labels(self):
+        """
+        Sensor sized label map, -1 for the plate and the well number inside each well.
+        """
+        x_scale = self.sensor_width / self.image_width
+        y_scale = self.sensor_height / self.image_height
+        sensor_radius = self.well_radius_px * x_scale
+        grid_y, grid_x = np.mgrid[0:self.sensor_height, 0:self.sensor_width]
+
+        well_labels = np.full((self.sensor_height, self.sensor_width), -1, dtype=np.int64)
+        for well_idx, (center_x, center_y) in enumerate(self.well_centers):
+            inside = (grid_x - int(center_x * x_scale)) ** 2 + (grid_y - int(center_y * y_scale)) ** 2 <= sensor_radius ** 2
+            well_labels[inside] = well_idx
+        return well_labels
+
+    def get_detected_wells(self):
+        """
+        Known wells in the WellDetector output format.
+        """
+        return [{
+            "well_center": (int(center_x), int(center_y)),
+            "well_radius": int(self.well_radius_px),
+            "confidence": None
+            } for center_x, center_y in self.well_centers]
+
+    def get_well_temps(self, t_sec):
+        """
+        Noise free temperature of every well at t_sec.
+        """
+        return self.plate_temp + self.heating_rate * t_sec + self.well_offsets
+
+    def create_frame(self, t_sec):
+        """
+        One (192, 256) radiometric frame at t_sec, rounded to 0.1 Celsius like the camera.
+        """
+        plate = self.plate_temp + self.heating_rate * t_sec - 1.0 # plate is colder than the wells
+        frame = np.where(self.well_labels >= 0, self.get_well_temps(t_sec)[self.well_labels], plate)
+        frame = frame + self.rng.normal(0, self.noise_sd, frame.shape)
+        return np.round(frame, 1)
+
+    def write_plate_image(self, image_path):
+        """
+        Write a 640x480 reference photo: bright wells on a dark plate.
+        """
+        image = np.full((self.image_height, self.image_width, 3), 40, dtype=np.uint8)
+        for center_x, center_y in self.well_centers:
+            cv2.circle(image, (center_x, center_y), self.well_radius_px, (220, 220, 220), -1)
+        if not cv2.imwrite(image_path, image):
+            raise ValueError("Error: Could not write image.")
+        return image_path
+
+    def write_vdo_csv(self, vdo_csv, duration_sec=60, fps=8.0, compression=None, frames_per_chunk=100):
+        """
+        Write a HIKMICRO VDO CSV of duration_sec at fps frames per second.
+        compression -> None, "gzip" or "zstd" (see HikDataManager.compress_vdo_csv())
+
+        - - - - - XLS STRUCTURE - - - - -
+        ROW            DATA
+        [0] Temperature Unit :, Celsius Degree
+        [1]
+        [2] Image
+        [3]
+        [4] time:2024/05/10 12:45:46.205
+        [5] 23.8, 24, ... , 24.7, 25,
+        - - - - - - - - - - - - - - - - -
+        """
+        if not (duration_sec > 0 and fps > 0):
+            raise ValueError("Error: Duration and fps must be greater than zero.")
+        n_frames = int(duration_sec * fps)
+
+        with open(vdo_csv, mode="w", encoding="utf-8-sig", newline="") as file:
+            file.write("Temperature Unit :,Celsius Degree\n\nImage\n\n")
+            for frame_idx in range(n_frames):
+                t_sec = frame_idx / fps
+                tst = self.start_tst + timedelta(seconds=t_sec)
+                file.write(f"time:{tst.strftime('%Y/%m/%d %H:%M:%S')}.{tst.microsecond // 1000:03d},\n")
+                np.savetxt(file, self.create_frame(t_sec), fmt="%.1f", delimiter=",", newline=",\n")
+
+        if compression is not None:
+            compressed_csv = HikDataManager.compress_vdo_csv(vdo_csv, compression=compression, frames_per_chunk=frames_per_chunk)
+            os.remove(vdo_csv)
+            return compressed_csv
+        return vdo_csv
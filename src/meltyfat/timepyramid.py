@@ -0,0 +1,122 @@
+import numpy as np
+from datetime import datetime, timedelta
+
+class WellTimePyramid:
+    """
+    Class to build per-well min / mean / max summaries of a recording at several bucket widths
+    while the frames stream in, so a viewer can plot days of data at the resolution of its zoom level.
+
+    Buckets are aligned to multiples of their width (a 60 s bucket starts on a full minute).
+    update() returns the buckets completed by a frame, finish() the ones still open:
+        [{"bucket_sec": 10, "bucket_start": "2024-05-10 12:45:40", "count": array, "min": array, "mean": array, "max": array}, ...]
+    Arrays follow the order of well_ids and NaN temperatures are not counted.
+
+    Usage:
+        pyramid = WellTimePyramid(well_ids, bucket_secs=(1, 10, 60, 600))
+        for a_frame in frames:
+            completed_buckets = pyramid.update(tst, well_temps)
+        completed_buckets = pyramid.finish()
+    """
+    default_bucket_secs = (1, 10, 60, 600)
+    epoch = datetime(1970, 1, 1)
+
+    def __init__(self, well_ids, bucket_secs=default_bucket_secs):
+        bucket_secs = tuple(sorted(set(bucket_secs)))
+        if not bucket_secs or not all(isinstance(bucket_sec, int) and bucket_sec > 0 for bucket_sec in bucket_secs):
+            raise ValueError("Error: Bucket widths must be positive integers (seconds).")
+        self.well_ids = list(well_ids)
+        self.bucket_secs = bucket_secs
+
+        ## Open bucket of every level
+        n_levels, n_wells = len(bucket_secs), len(self.well_ids)
+        self.bucket_idx = np.full(n_levels, -1, dtype=np.int64) # bucket number since epoch, -1 -> empty
+        self.count = np.zeros((n_levels, n_wells), dtype=np.int64)
+        self.sum = np.zeros((n_levels, n_wells), dtype=np.float64)
+        self.min = np.full((n_levels, n_wells), np.inf)
+        self.max = np.full((n_levels, n_wells), -np.inf)
+
+    @staticmethod
+    def to_seconds(tst):
+        """
+        Seconds since 1970-01-01 from a datetime or "YYYY-MM-DD HH:MM:SS" text.
+        """
+        if isinstance(tst, str):
+            tst = datetime.fromisoformat(tst)
+        return (tst - WellTimePyramid.epoch).total_seconds()
+
+    @staticmethod
+    def format_seconds(seconds):
+        return (WellTimePyramid.epoch + timedelta(seconds=int(seconds))).strftime("%Y-%m-%d %H:%M:%S")
+
+    def close_level(self, level):
+        """
+        Summary of the open bucket of a level, then reset it.
+        """
+        count = self.count[level].copy()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.sum[level] / count
+        empty = count == 0
+        summary = {
+            "bucket_sec": self.bucket_secs[level],
+            "bucket_start": self.format_seconds(self.bucket_idx[level] * self.bucket_secs[level]),
+            "count": count,
+            "min": np.where(empty, np.nan, self.min[level]),
+            "mean": np.where(empty, np.nan, mean),
+            "max": np.where(empty, np.nan, self.max[level])
+        }
+        self.bucket_idx[level] = -1
+        self.count[level] = 0
+        self.sum[level] = 0.0
+        self.min[level] = np.inf
+        self.max[level] = -np.inf
+        return summary
+
+    def update(self, tst, well_temps):
+        """
+        Add the well temperatures of one frame at tst (datetime or "YYYY-MM-DD HH:MM:SS").
+        return
+            list of completed buckets, finest level first
+        """
+        well_temps = np.asarray(well_temps, dtype=np.float64)
+        if well_temps.shape != (len(self.well_ids),):
+            raise ValueError("Error: Well temperatures must have one value per well id.")
+        seconds = self.to_seconds(tst)
+
+        completed_buckets = []
+        frame_bucket_idx = np.floor(seconds / np.array(self.bucket_secs)).astype(np.int64)
+        for level in np.flatnonzero((self.bucket_idx >= 0) & (self.bucket_idx != frame_bucket_idx)):
+            completed_buckets.append(self.close_level(level))
+        self.bucket_idx = frame_bucket_idx
+
+        ## Every level accumulates the frame, NaN wells are skipped
+        valid = ~np.isnan(well_temps)
+        self.count += valid
+        self.sum += np.where(valid, well_temps, 0.0)
+        self.min = np.minimum(self.min, np.where(valid, well_temps, np.inf))
+        self.max = np.maximum(self.max, np.where(valid, well_temps, -np.inf))
+        return completed_buckets
+
+    def finish(self):
+        """
+        Close the open buckets at the end of the recording.
+        """
+        return [self.close_level(level) for level in np.flatnonzero(self.bucket_idx >= 0)]
+
+    @staticmethod
+    def floor_tst(tst, bucket_sec):
+        """
+        Start of the bucket containing tst: "YYYY-MM-DD HH:MM:SS"
+        """
+        return WellTimePyramid.format_seconds(WellTimePyramid.to_seconds(tst) // bucket_sec * bucket_sec)
+
+    @staticmethod
+    def choose_bucket_sec(bucket_secs, start_tst, end_tst, max_points=2000):
+        """
+        Finest bucket width that shows start_tst -> end_tst in at most max_points buckets,
+        the widest one when none does.
+        """
+        span_sec = WellTimePyramid.to_seconds(end_tst) - WellTimePyramid.to_seconds(start_tst)
+        for bucket_sec in sorted(bucket_secs):
+            if span_sec / bucket_sec <= max_points:
+                return bucket_sec
+        return max(bucket_secs)
@@ -1,13 +1,20 @@
 import cv2
 import os
+import logging
 import numpy as np
-import string
+
+from .metrics import StageMetrics # Stage timers
+from .platelayout import get_plate_layout # 24 / 48 / 96 / 384 well plates
+
+logger = logging.getLogger(__name__)
 
 class WellAnalyzer:
     """
     Class to analyze and get thermal values from pandas dataframe.
     """
-    def __init__(self, reference_image_path=None, detected_wells_dict=None):
+    def __init__(self, reference_image_path=None, detected_wells_dict=None, metrics=None, layout=None):
+        self.metrics = metrics if metrics is not None else StageMetrics() # Stage timers
+        self.layout = get_plate_layout(layout) # PlateLayout, default 96 wells
         self.reference_image_path = reference_image_path
         self.image = None
         self.detected_wells_dict = detected_wells_dict
@@ -22,16 +29,18 @@ class WellAnalyzer:
     def load_image(self, reference_image_path):
         if not os.path.exists(reference_image_path):
             raise FileNotFoundError("Error: Image file not found")
-        self.image = cv2.imread(reference_image_path)
+        with self.metrics.stage("load_image", file=reference_image_path) as record:
+            self.image = cv2.imread(reference_image_path)
+            record["bytes"] = os.path.getsize(reference_image_path)
         if self.image is None:
             raise ValueError("Error: Could not load image")
-        print("Success: Image loaded")
+        logger.info("Success: Image loaded")
     
     def set_image(self, image):
         if image is None:
             raise ValuseError("Error: No image provided.")
         self.image = image
-        print("Success: Image set")
+        logger.info("Success: Image set")
     
     def set_detected_dict(self, detected_wells_dict):
         self.check_detected_dict(detected_wells_dict)
@@ -52,40 +61,45 @@ class WellAnalyzer:
     ### Functions to interact with the well
     def map_well_ids(self, invert_image=False):
         """
-        This function map and assign unique ids for each well in 96-well plate format.
+        This function map and assign unique ids for each well following the plate layout (default 96-well).
         There is an option to invert the image. This means that from mapping A01, A02, ..., A12, 
         it will map the first row as H12, H11, H10, ..., H02, H01 instead.
+
+        Wells are sorted by x, cut into columns of layout.rows wells and each column is sorted by y.
         """
-        row_names = list(string.ascii_uppercase[:8]) # 'A -> H'
+        n_rows, n_cols = self.layout.rows, self.layout.cols
+        row_names = self.layout.row_names # 'A -> H'
 
         if invert_image:
             row_names = row_names[::-1] # Invert to 'H -> A'
-        sorted_by_coordinates = sorted(self.detected_wells_dict, key=lambda k: k["well_center"]) # Sorted by coordinates
-        for well_column_idx in range(12):  # From column '1 -> 12'
-
-            ## Column start and end
-            ## Ex: col 1 -> start 0, end 8 -> [0, ..., 7]
-            ## Ex: col 2 -> start 8, end 16 -> [8, ..., 11]
-            start_idx = 8 * well_column_idx 
-            end_idx = 8 * (well_column_idx + 1)
-            sorted_by_row = sorted(sorted_by_coordinates[start_idx:end_idx], key=lambda k: k["well_center"][1])  # Sort wells by row
-            
-            for well_row_idx, current_well in enumerate(sorted_by_row):  # Loop 8 rows
-                if invert_image:
-                    well_id = row_names[well_row_idx] + f"{12 - well_column_idx:02d}" # Well id from H12 to A1
-                    well_column = 12 - well_column_idx
-                else:
-                    well_id = row_names[well_row_idx] + f"{well_column_idx + 1:02d}" # Well id from A1 to H12
-                    well_column = well_column_idx + 1
-                    
-                self.mapped_wells.append({
-                    "well_id": well_id,
-                    "well_row": row_names[well_row_idx],
-                    "well_column": well_column,
-                    "well_center": current_well["well_center"],
-                    "well_radius": current_well["well_radius"],
-                    "confidence": current_well["confidence"]
-                }) 
+        row_names = np.array(row_names)
+
+        ## Sort by coordinates (x, then y), at most one plate of wells
+        centers = np.array([a_well["well_center"] for a_well in self.detected_wells_dict], dtype=np.float64).reshape(-1, 2)
+        sorted_by_coordinates = np.lexsort((centers[:, 1], centers[:, 0]))[:n_rows * n_cols]
+
+        ## Column start and end
+        ## Ex: col 1 -> [0, ..., 7], col 2 -> [8, ..., 15]
+        well_column_idx = np.arange(len(sorted_by_coordinates)) // n_rows
+        sorted_by_row = sorted_by_coordinates[np.lexsort((centers[sorted_by_coordinates, 1], well_column_idx))] # Sort wells by row within each column
+        well_row_idx = np.arange(len(sorted_by_row)) % n_rows
+
+        if invert_image:
+            well_columns = n_cols - well_column_idx # Well id from H12 to A1
+        else:
+            well_columns = well_column_idx + 1 # Well id from A1 to H12
+        well_rows = row_names[well_row_idx]
+
+        for well_idx, well_row, well_column in zip(sorted_by_row.tolist(), well_rows.tolist(), well_columns.tolist()):
+            current_well = self.detected_wells_dict[well_idx]
+            self.mapped_wells.append({
+                "well_id": f"{well_row}{well_column:02d}",
+                "well_row": well_row,
+                "well_column": well_column,
+                "well_center": current_well["well_center"],
+                "well_radius": current_well["well_radius"],
+                "confidence": current_well["confidence"]
+            }) 
         return self.mapped_wells
     
     def map_sensor_coordinate(self, sensor_temp_df, x_coor, y_coor):
@@ -97,7 +111,12 @@ class WellAnalyzer:
         Image Dimensions        640x480
         Sensor Dimensions       256x192
         -------------------------------
+        Without a reference image the coordinates are already in sensor space
+        (e.g. from WellDetector.detect_Thermal()) and are returned as they are.
         """
+        if self.image is None:
+            return int(x_coor), int(y_coor)
+
         ## Get dimension details
         img_height, img_width, color_channels = self.image.shape # Reference Image
         sensor_height, sensor_width = sensor_temp_df.shape # Data frame
@@ -148,17 +167,115 @@ class WellAnalyzer:
         return avg_well_temp, sd_well_temp
     
     @staticmethod
-    def create_well_ids():
+    def get_sensor_temps(sensor_temp, sensor_xs, sensor_ys, detect_window=0, precision=2):
         """
-        Generate well ids list from [A1, A2, ..., H11, H12]
+        Vectorized get_sensor_temp() for all wells of a frame at once, same results.
+        sensor_temp -> (192, 256) array or dataframe
+        sensor_xs, sensor_ys -> sensor coordinates of every well
+        return
+            (avg_well_temps, sd_well_temps) arrays, NaN where every window row is an outlier
         """
-        rows = list(string.ascii_uppercase[:8])
-        cols = list(range(1, 13))
-        wellplate_ids = [f"{row}{col}" 
-            for row in rows
-            for col in cols
-            ]
-        return wellplate_ids
+        sensor_temp = np.asarray(sensor_temp, dtype=np.float64)
+        sensor_xs = np.asarray(sensor_xs, dtype=np.int64)
+        sensor_ys = np.asarray(sensor_ys, dtype=np.int64)
+        sensor_height, sensor_width = sensor_temp.shape
+        detect_window_limit = 5
+        detect_window = min(max(detect_window, 0), detect_window_limit) # set boundary
+
+        if np.any((sensor_xs < 0) | (sensor_ys < 0) | (sensor_xs >= sensor_width) | (sensor_ys >= sensor_height)):
+            raise ValueError("Error: Provided coordinates are out of bounds.")
+
+        ## Windows of every well: (wells, rows, cols), pixels outside the sensor are padding
+        offsets = np.arange(-detect_window, detect_window + 1)
+        window_ys = sensor_ys[:, None] + offsets
+        window_xs = sensor_xs[:, None] + offsets
+        valid_ys = (window_ys >= 0) & (window_ys < sensor_height)
+        valid_xs = (window_xs >= 0) & (window_xs < sensor_width)
+        sensor_windows = sensor_temp[np.clip(window_ys, 0, sensor_height - 1)[:, :, None], np.clip(window_xs, 0, sensor_width - 1)[:, None, :]]
+        padding = ~(valid_ys[:, :, None] & valid_xs[:, None, :])
+        if padding.any():
+            sensor_windows = np.where(padding, np.nan, sensor_windows)
+
+        ## Remove Outliers base on IQR of each window column, a row with any outlier is dropped
+        Q1, Q3 = WellAnalyzer.column_quantiles(sensor_windows, [0.25, 0.75])
+        IQR = Q3 - Q1
+        lower_bound = (Q1 - (1.5 * IQR))[:, None, :]
+        upper_bound = (Q3 + (1.5 * IQR))[:, None, :]
+        inside = (sensor_windows >= lower_bound) & (sensor_windows <= upper_bound)
+        keep = inside & np.all(inside | padding, axis=2, keepdims=True)
 
+        ## Kept pixels of each well moved to the front in row-major order, like stack()
+        n_wells = len(sensor_windows)
+        keep = keep.reshape(n_wells, -1)
+        counts = keep.sum(axis=1)
+        order = np.argsort(~keep, axis=1, kind="stable")
+        kept_values = np.take_along_axis(sensor_windows.reshape(n_wells, -1), order, axis=1)
+        kept_values = np.where(np.arange(kept_values.shape[1]) < counts[:, None], kept_values, 0.0)
 
-    
\ No newline at end of file
+        ## Mean and sample standard deviation of the kept pixels, summed in the order pandas does
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg_well_temps = WellAnalyzer.pairwise_sum(kept_values, counts) / counts
+            squared_diff = np.where(np.arange(kept_values.shape[1]) < counts[:, None], (avg_well_temps[:, None] - kept_values) ** 2, 0.0)
+            sd_well_temps = np.sqrt(WellAnalyzer.pairwise_sum(squared_diff, counts) / (counts - 1))
+        avg_well_temps[counts == 0] = np.nan
+        sd_well_temps[counts < 2] = np.nan
+
+        return np.round(avg_well_temps, precision), np.round(sd_well_temps, precision)
+
+    @staticmethod
+    def column_quantiles(sensor_windows, quantiles):
+        """
+        Linear quantiles of every window column (axis 1), ignoring NaN,
+        with the same arithmetic as np.quantile / DataFrame.quantile.
+        """
+        sorted_windows = np.sort(sensor_windows, axis=1) # NaN last
+        n_valid = np.sum(~np.isnan(sensor_windows), axis=1, keepdims=True)
+        last_index = np.maximum(n_valid - 1, 0)
+        results = []
+        for quantile in quantiles:
+            virtual_index = (n_valid - 1) * quantile
+            previous_index = np.clip(np.floor(virtual_index), 0, last_index).astype(np.int64)
+            next_index = np.minimum(previous_index + 1, last_index)
+            gamma = virtual_index - previous_index
+            previous_value = np.take_along_axis(sorted_windows, previous_index, axis=1)[:, 0, :]
+            next_value = np.take_along_axis(sorted_windows, next_index, axis=1)[:, 0, :]
+            gamma = gamma[:, 0, :]
+
+            ## np.quantile's lerp: from below for gamma < 0.5, from above otherwise
+            diff = next_value - previous_value
+            result = np.where(gamma >= 0.5, next_value - diff * (1 - gamma), previous_value + diff * gamma)
+            result[n_valid[:, 0, :] == 0] = np.nan
+            results.append(result)
+        return results
+
+    @staticmethod
+    def pairwise_sum(values, counts):
+        """
+        Row sums of values[:, :counts] with the summation order of numpy's sum() on a 1D array
+        of up to 128 values (8 interleaved partial sums), so vectorized results match the
+        per-well pandas calculation bit for bit. Values after counts must be zero.
+        """
+        n_rows, length = values.shape
+        padded_length = max(8, -(-length // 8) * 8)
+        values = np.pad(values, ((0, 0), (0, padded_length - length)))
+        blocked = (counts // 8) * 8
+
+        ## 8 partial sums over the blocked part
+        partial = values[:, :8].copy()
+        for start in range(8, padded_length, 8):
+            partial += np.where((start < blocked)[:, None], values[:, start:start + 8], 0.0)
+        result = ((partial[:, 0] + partial[:, 1]) + (partial[:, 2] + partial[:, 3])) + ((partial[:, 4] + partial[:, 5]) + (partial[:, 6] + partial[:, 7]))
+        result = np.where(counts >= 8, result, 0.0)
+
+        ## The rest one by one
+        for offset in range(8):
+            position = blocked + offset
+            result += np.where(position < counts, values[np.arange(n_rows), np.minimum(position, padded_length - 1)], 0.0)
+        return result
+
+    @staticmethod
+    def create_well_ids(layout=None):
+        """
+        Generate well ids list from [A1, A2, ..., H11, H12] (or the given plate layout)
+        """
+        return get_plate_layout(layout).well_ids()
@@ -1,31 +1,41 @@
 import torch
 import os
+import logging
 import numpy as np
 import cv2
 from ultralytics import YOLO
 import matplotlib.pyplot as plt
 
+from .metrics import StageMetrics # Stage timers
+from .platelayout import get_plate_layout # 24 / 48 / 96 / 384 well plates
+
+logger = logging.getLogger(__name__)
+
 class WellDetector:
     ## Class Variable
     current_dir = os.path.dirname(os.path.abspath(__file__)) # Current directory
     default_model_rel_path = os.path.join(current_dir, "models", "small_lr0_early_stp.pt")
 
-    def __init__(self, reference_img_path=None):
+    def __init__(self, reference_img_path=None, metrics=None, layout=None):
+        self.metrics = metrics if metrics is not None else StageMetrics() # Stage timers
+        self.layout = get_plate_layout(layout) # PlateLayout, default 96 wells
         self.device = "cuda" if torch.cuda.is_available() else "cpu" # Check device
-        print(f"Device: {self.device}")
+        logger.info(f"Device: {self.device}")
         self.image = None
         self.reference_img_path = reference_img_path
         if reference_img_path:
             try:
                 self.load_image(reference_img_path=reference_img_path)
             except FileNotFoundError:
-                print("Error: File not found")
+                logger.error("Error: File not found")
         self.detected_method = None # Signature
+        self.coordinate_space = "image" # "image" (reference photo) or "sensor" (thermal frame)
         self.well_coordinates = []
     
     def reset_coordinates(self):
         self.well_coordinates = []
         self.detected_method = None
+        self.coordinate_space = "image"
     
     def load_image(self, reference_img_path):
         """
@@ -34,46 +44,59 @@ class WellDetector:
         if not os.path.exists(reference_img_path):
             raise FileNotFoundError("Error: Image file not found")
 
-        self.image = cv2.imread(reference_img_path)
+        with self.metrics.stage("load_image", file=reference_img_path) as record:
+            self.image = cv2.imread(reference_img_path)
+            record["bytes"] = os.path.getsize(reference_img_path)
         if self.image is None:
             raise ValueError("Error: Could not load image")
-        print("Success: Image loaded")
+        logger.info("Success: Image loaded")
     
     def set_image(self, image):
         if image is None:
             raise ValuseError("Error: No image provided.")
         self.image = image
-        print("Success: Image set")
+        logger.info("Success: Image set")
     
     ## Detection Functions
-    def detect_HoughCircles(self, dp=1, minDist=10, param1=200, param2=10, minRadius=12, maxRadius=14):
+    def detect_HoughCircles(self, dp=1, minDist=10, param1=200, param2=10, minRadius=None, maxRadius=None, display=True):
+        """
+        minRadius / maxRadius = None -> 12 and 14 for a 96 well plate, scaled with the well pitch of the layout
+        """
+        pitch_scale = self.layout.pitch_mm / 9.0 # 96 well plate pitch
+        if minRadius is None:
+            minRadius = max(int(round(12 * pitch_scale)), 1)
+        if maxRadius is None:
+            maxRadius = max(int(round(14 * pitch_scale)), minRadius + 1)
         if self.image is None:
             raise ValueError("Error: No set image. Please load image first.")
         self.reset_coordinates() # Reset coordinates
         self.detected_method = "Hough_Circle_Transform"
 
         ## Change to gray scale for easy detection
-        gray_img = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
-        gray_img = cv2.GaussianBlur(gray_img, (3,3), 0) # add blur
-
-        detected_circles = cv2.HoughCircles(
-            gray_img, # img for detection
-            cv2.HOUGH_GRADIENT, # detection method
-            dp=dp, # inverse raito of resolution
-            minDist=minDist,
-            param1=param1,
-            param2=param2,
-            minRadius=minRadius,
-            maxRadius=maxRadius
-        )
+        with self.metrics.stage("detect_HoughCircles", device="cpu") as record:
+            gray_img = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+            gray_img = cv2.GaussianBlur(gray_img, (3,3), 0) # add blur
+
+            detected_circles = cv2.HoughCircles(
+                gray_img, # img for detection
+                cv2.HOUGH_GRADIENT, # detection method
+                dp=dp, # inverse raito of resolution
+                minDist=minDist,
+                param1=param1,
+                param2=param2,
+                minRadius=minRadius,
+                maxRadius=maxRadius
+            )
+            record["frames"] = 1
+            record["detected"] = 0 if detected_circles is None else detected_circles.shape[1]
 
         ## If detected
         if detected_circles is not None:
             # print("Detected")
             detected_circles = np.uint(np.around(detected_circles))
-            for i in detected_circles[0, :96]: # 96 Well Plate Max circles is 96
-                circle_center = (i[0], i[1])
-                circle_radius = i[2]
+            for i in detected_circles[0, :self.layout.n_wells]: # Max circles is the number of wells of the plate
+                circle_center = (int(i[0]), int(i[1]))
+                circle_radius = int(i[2])
                 self.well_coordinates.append({
                     "well_center": circle_center,
                     "well_radius": circle_radius,
@@ -81,20 +104,114 @@ class WellDetector:
                 })
                 
             ## Display Detection Result
-            self.display_detected_wells()
+            if display:
+                self.display_detected_wells()
             return self.well_coordinates
         else:
-            print("Error: No circle wells were detected.")
+            logger.error("Error: No circle wells were detected.")
             return None
             
-    def detect_YOLOv8(self, model_path=default_model_rel_path, conf_threshold=0.25):
+    @staticmethod
+    def get_thermal_mean(frames):
+        """
+        Temporal mean of one or more radiometric frames.
+        frames: a 2D array / dataframe, a list of them, or a list of frame dicts from HikExcelExtractor
+        """
+        if isinstance(frames, dict):
+            frames = [frames]
+        if isinstance(frames, list):
+            frames = [a_frame["data"] if isinstance(a_frame, dict) else a_frame for a_frame in frames]
+            frames = np.array(frames, dtype=np.float64)
+        else:
+            frames = np.asarray(frames, dtype=np.float64)
+        if frames.ndim == 2:
+            return frames
+        if frames.ndim != 3 or len(frames) == 0:
+            raise ValueError("Error: Frames must be 2D sensor arrays.")
+        return np.nanmean(frames, axis=0)
+
+    def detect_Thermal(self, frames, minRadius=None, maxRadius=None, threshold_sd=4.0, max_wells=None, display=True):
+        """
+        Detect wells directly on radiometric frames (e.g. HikExcelExtractor.get_sampled_data()),
+        no reference photo required. Radii are in sensor pixels and the returned coordinates
+        are in sensor space (coordinate_space = "sensor"), so they need no image-to-sensor rescaling.
+
+        Wells are blobs warmer (or colder) than the plate: a morphological top-hat removes
+        the plate, pixels above threshold_sd times the sensor noise are grouped into
+        connected components and components of well size are kept.
+        minRadius / maxRadius = None -> 2 and 8 for a 96 well plate, scaled with the well pitch of the layout
+        max_wells = None -> number of wells of the plate layout
+        """
+        pitch_scale = self.layout.pitch_mm / 9.0 # 96 well plate pitch
+        if minRadius is None:
+            minRadius = max(int(round(2 * pitch_scale)), 1)
+        if maxRadius is None:
+            maxRadius = max(int(round(8 * pitch_scale)), minRadius + 1)
+        if max_wells is None:
+            max_wells = self.layout.n_wells
+        self.reset_coordinates() # Reset coordinates
+        self.detected_method = "Thermal_TopHat"
+        self.coordinate_space = "sensor"
+
+        with self.metrics.stage("detect_Thermal", device="cpu") as record:
+            thermal_mean = self.get_thermal_mean(frames)
+            thermal_mean = np.where(np.isnan(thermal_mean), np.nanmedian(thermal_mean), thermal_mean).astype(np.float32)
+
+            ## Sensor noise from the pixel-to-pixel differences
+            high_freq = thermal_mean - cv2.medianBlur(thermal_mean, 3)
+            noise_sd = max(1.4826 * float(np.median(np.abs(high_freq - np.median(high_freq)))), 1e-6)
+
+            ## Remove the plate, hot or cold wells whichever stands out more from the plate
+            smoothed = cv2.GaussianBlur(thermal_mean, (0,0), min(pitch_scale, 1.0)) # narrow gaps between small wells must not be blurred
+            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * maxRadius + 1, 2 * maxRadius + 1))
+            hot_wells = cv2.morphologyEx(smoothed, cv2.MORPH_TOPHAT, kernel)
+            cold_wells = cv2.morphologyEx(smoothed, cv2.MORPH_BLACKHAT, kernel)
+            low, median, high = np.percentile(thermal_mean, [1, 50, 99]) # the plate covers most of the sensor
+            well_response = hot_wells if high - median >= median - low else cold_wells
+
+            well_mask = (well_response > np.median(well_response) + threshold_sd * noise_sd).astype(np.uint8)
+            n_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(well_mask, connectivity=4)
+
+            ## Keep components of well size, largest first
+            areas = stats[1:, cv2.CC_STAT_AREA]
+            keep = np.flatnonzero((areas >= np.pi * minRadius ** 2) & (areas <= np.pi * maxRadius ** 2)) + 1
+            keep = keep[np.argsort(-stats[keep, cv2.CC_STAT_AREA], kind="stable")][:max_wells]
+            record["frames"] = 1
+            record["detected"] = len(keep)
+
+        ## Colour map of the sensor for display
+        low, high = np.percentile(thermal_mean, [1, 99])
+        gray_img = np.clip((thermal_mean - low) / max(high - low, 1e-6) * 255, 0, 255).astype(np.uint8)
+        self.image = cv2.applyColorMap(gray_img, cv2.COLORMAP_INFERNO)
+
+        if len(keep) == 0:
+            logger.error("Error: No wells were detected on the thermal frames.")
+            return None
+
+        for label in sorted(keep):
+            center_x, center_y = centroids[label]
+            self.well_coordinates.append({
+                "well_center": (int(round(center_x)), int(round(center_y))),
+                "well_radius": int(round(np.sqrt(stats[label, cv2.CC_STAT_AREA] / np.pi))),
+                "confidence": None
+            })
+
+        ## Display Detection Result
+        if display:
+            self.display_detected_wells()
+        return self.well_coordinates
+
+    def detect_YOLOv8(self, model_path=default_model_rel_path, conf_threshold=0.25, display=True):
         if self.image is None:
             raise ValueError("Error: No set image. Please load image first.")
         self.reset_coordinates() # Reset coordinates
         self.detected_method = "YOLOv8_Custom_Model"
 
-        model = YOLO(model_path) # load model
-        results = model(self.image, conf=conf_threshold) # run detection
+        with self.metrics.stage("load_YOLOv8", device=self.device):
+            model = YOLO(model_path) # load model
+        with self.metrics.stage("detect_YOLOv8", device=self.device) as record:
+            results = model(self.image, conf=conf_threshold) # run detection
+            record["frames"] = 1
 
         for result in results:
             for box in result.boxes:
@@ -112,13 +229,14 @@ class WellDetector:
                 })
 
         ## Display Detection Results
-        self.display_detected_wells()
+        if display:
+            self.display_detected_wells()
         return self.well_coordinates
     
     ## Display Detected Wells
     def display_detected_wells(self):
         if not self.well_coordinates:
-            print("Error: No detected wells. Please run detection methods first.")
+            logger.error("Error: No detected wells. Please run detection methods first.")
             return None
         
         img = self.image.copy()
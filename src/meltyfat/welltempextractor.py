@@ -1,28 +1,85 @@
 import os
+import math
+import logging
 import torch
 import string
 import re
 import csv
 import cv2
 import shutil
-from itertools import islice
+from itertools import islice, chain
+from contextlib import nullcontext
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 from ultralytics import YOLO
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
 
 ## Class files
 from .csvextractor import HikExcelExtractor # Get CSVs or List of dicts from VDO
 from .welldetector import WellDetector # Detect and get arrays
-from .wellanalyzer import WellAnalyzer # 96 well plate functions
+from .wellanalyzer import WellAnalyzer # Well plate functions
+from .platelayout import get_plate_layout # 24 / 48 / 96 / 384 well plates
 from .datamanager import HikDataManager # Manages HIK sensor data
+from .metrics import StageMetrics # Stage timers
+from .drifttracker import PlateDriftTracker # Plate movement between frames
+from .resultstore import WellResultStore # SQLite results
+from .timepyramid import WellTimePyramid # Downsampled summaries
+from .checkpoint import ExtractionCheckpoint # Resumable jobs
+from .pipeline import FramePipeline # Threaded read -> compute -> write
+
+logger = logging.getLogger(__name__)
+
+## Parallel extraction, state of each worker process
+_worker_state = {}
+
+def _init_extract_worker(vdo_csv, roi_spans, quality_checks, sensor_xs, sensor_ys, detect_window, shm_name, results_shape):
+    """
+    Worker initializer: own reader of the VDO CSV and a view of the shared result array.
+    """
+    results_shm = shared_memory.SharedMemory(name=shm_name)
+    vdo_reader = HikExcelExtractor(vdo_csv)
+    vdo_reader.set_roi_spans(roi_spans)
+    vdo_reader.quality_checks = quality_checks
+    _worker_state.update({
+        "vdo_reader": vdo_reader,
+        "sensor_xs": sensor_xs,
+        "sensor_ys": sensor_ys,
+        "detect_window": detect_window,
+        "results_shm": results_shm, # keep the mapping open
+        "results": np.ndarray(results_shape, dtype=np.float64, buffer=results_shm.buf)
+    })
+
+def _extract_frame_chunk(frames):
+    """
+    Worker task: parse a contiguous range of frames (its own byte range of the file) and
+    write the well means / sds at each frame position of the shared result array.
+    return
+        written positions and the quality screening of the chunk
+    """
+    results = _worker_state["results"]
+    vdo_reader = _worker_state["vdo_reader"]
+    vdo_reader.flagged_frames = {}
+    vdo_reader.dropped_frames = set()
+    positions = []
+    for a_frame, data in vdo_reader.iter_frame_arrays(frames):
+        avg_well_temps, sd_well_temps = WellAnalyzer.get_sensor_temps(data, _worker_state["sensor_xs"], _worker_state["sensor_ys"], detect_window=_worker_state["detect_window"], precision=2)
+        results[0, a_frame["position"]] = avg_well_temps
+        results[1, a_frame["position"]] = sd_well_temps
+        positions.append(a_frame["position"])
+    return positions, vdo_reader.flagged_frames, vdo_reader.dropped_frames
 
 class WellTempExtractor:
-    def __init__(self, ref_image_path, detected_wells, frame_dataORpath, output_path, detect_window=3, image_invert_status=False, output_filename=None):
+    def __init__(self, ref_image_path, detected_wells, frame_dataORpath, output_path, detect_window=3, image_invert_status=False, output_filename=None, metrics=None, layout=None):
         """
         Normally image is inverted, thus image_invert_status = True
+        ref_image_path = None -> detected_wells are in sensor coordinates (WellDetector.detect_Thermal())
+        layout -> PlateLayout or number of wells (24, 48, 96, 384), default 96
         """
+        self.metrics = metrics if metrics is not None else StageMetrics() # Stage timers
+        self.layout = get_plate_layout(layout) # PlateLayout
         self.ref_image_path = None # clearest image
         self.image_invert_status = False # bool
         self.detected_wells = None # detected wells list
@@ -34,8 +91,18 @@ class WellTempExtractor:
         ## Class Process
         self.labelled_wells = None # Required
         self.frames_data_list = [] # Required
+        self.vdo_extractor = None # HikExcelExtractor, frames are read from the VDO CSV while extracting
+        self.well_index_table = None # sensor coordinates of every well, built on the first frame
+        self.drift_tracker = None # PlateDriftTracker, see set_drift_tracking()
+        self.result_store = None # WellResultStore, see set_result_store()
+        self.run_id = None # run of this extraction in the result store
+        self.pyramid_bucket_secs = None # WellTimePyramid bucket widths stored with the results
+        self.checkpoint = None # ExtractionCheckpoint, see set_checkpoint()
+        self.pipeline_stats = None # FramePipeline queue and stall stats of the last threaded run
+        self.frame_shifts = {} # drift shift of computed frames until they are written
         ## Extraction results
         self.extracted_well_data = []
+        self.drift_log = [] # per frame plate shift when drift tracking is on
 
         ## Setters
         self.set_ref_image_path(ref_image_path)
@@ -47,7 +114,9 @@ class WellTempExtractor:
         self.set_output_path(output_path)
     
     def set_ref_image_path(self, a_path):
-        if HikDataManager.check_path_exist(a_path):
+        if a_path is None: # Wells detected on the thermal frames
+            self.ref_image_path = None
+        elif HikDataManager.check_path_exist(a_path):
             self.ref_image_path = a_path
         else:
             raise FileExistsError("Error: Invalid reference image path.")
@@ -67,7 +136,7 @@ class WellTempExtractor:
         """
         if WellDetector.check_detect_dict_list(detected_wells_list):
             self.detected_wells = detected_wells_list
-            wellplate = WellAnalyzer(detected_wells_dict=self.detected_wells)
+            wellplate = WellAnalyzer(detected_wells_dict=self.detected_wells, metrics=self.metrics, layout=self.layout)
             self.labelled_wells = wellplate.map_well_ids(invert_image=self.image_invert_status)
 
         else:
@@ -82,14 +151,18 @@ class WellTempExtractor:
 
     def set_frame_data(self, frame_dataORpath):
         """
-        This function provides userflexibility in providing either a list of dicts or a path to frames csv.
+        This function provides userflexibility in providing either a list of dicts or a path to frames csv,
+        or a HikExcelExtractor whose sampled frames are read from the VDO CSV during run_TempExtract().
         """
         if isinstance(frame_dataORpath, list):
             self.set_frameList(frame_dataORpath)
         elif isinstance(frame_dataORpath, str): # Path
             self.set_frameFromCSVs(folder_path=frame_dataORpath)
+        elif isinstance(frame_dataORpath, HikExcelExtractor):
+            self.set_frameExtractor(frame_dataORpath)
         else:
-            raise ValueError("Error: Provided frame must be a list of dicts or a folder of extracted frames.")
+            raise ValueError("Error: Provided frame must be a list of dicts, a folder of extracted frames or a HikExcelExtractor.")
+        self.frame_dataORpath = frame_dataORpath
     
     def set_frameList(self, extracted_frames_list):
         """
@@ -102,6 +175,17 @@ class WellTempExtractor:
         else:
             raise ValueError("Error: Provided frames list is in unsupported format.")
         
+    def set_frameExtractor(self, vdo_extractor):
+        """
+        Read the sampled frames of a HikExcelExtractor (mapped on demand) while extracting,
+        the frames are never held in memory as lists.
+        """
+        if not vdo_extractor.sampled_frames:
+            vdo_extractor.map_csv()
+        if not vdo_extractor.sampled_frames:
+            raise ValueError("Error: Provided VDO CSV has no frames.")
+        self.vdo_extractor = vdo_extractor
+
     def set_frameFromCSVs(self, folder_path=None):
         """
         Get sensor data from CSV either single file or multiple files.
@@ -110,28 +194,31 @@ class WellTempExtractor:
         ## list all the CSV from the provided directory
         csv_frame_list = HikDataManager.get_CSVfromPath(folder_path)
 
-        ## Run through all the files
-        for a_frame in csv_frame_list:
-
-            ## Extract Meta Data from filename
-            sensor_fname = os.path.splitext(os.path.basename(a_frame))[0]
-            creation_date, creation_time = sensor_fname.split("_")[0], sensor_fname.split("_")[1]
-            formatted_date = f"{creation_date[:4]}-{creation_date[4:6]}-{creation_date[6:]}"
-            formatted_time = f"{creation_time[:2]}:{creation_time[2:4]}:{creation_time[4:]}"
-            # print(formatted_date, formatted_time)
-
-            ## Get sensor data
-            sensor_frame_df = HikDataManager.get_sensor_csv(a_frame, skip_rows=1)
-
-            ## Format as dict
-            frame_dict = {
-                    "date": formatted_date, # 2024-08-18
-                    "time": formatted_time, # 15:07:59
-                    "data": sensor_frame_df.values.tolist()
-                }
+        with self.metrics.stage("load_frame_csvs", folder=folder_path) as record:
+            ## Run through all the files
+            for a_frame in csv_frame_list:
+
+                ## Extract Meta Data from filename
+                sensor_fname = os.path.splitext(os.path.basename(a_frame))[0]
+                creation_date, creation_time = sensor_fname.split("_")[0], sensor_fname.split("_")[1]
+                formatted_date = f"{creation_date[:4]}-{creation_date[4:6]}-{creation_date[6:]}"
+                formatted_time = f"{creation_time[:2]}:{creation_time[2:4]}:{creation_time[4:]}"
+                # print(formatted_date, formatted_time)
+
+                ## Get sensor data
+                sensor_frame_df = HikDataManager.get_sensor_csv(a_frame, skip_rows=1)
+
+                ## Format as dict
+                frame_dict = {
+                        "date": formatted_date, # 2024-08-18
+                        "time": formatted_time, # 15:07:59
+                        "data": sensor_frame_df.values.tolist()
+                    }
             
-            ## Append
-            self.frames_data_list.append(frame_dict)
+                ## Append
+                self.frames_data_list.append(frame_dict)
+            record["frames"] = len(csv_frame_list)
+            record["bytes"] = sum(os.path.getsize(a_frame) for a_frame in csv_frame_list)
     
     def set_output_path(self, a_path):
         if HikDataManager.check_path_exist(a_path):
@@ -146,6 +233,48 @@ class WellTempExtractor:
             current_tst = datetime.now().strftime("%Y%m%d_%H%M%S")
             self.output_filename = f"{current_tst}_extracted.csv" # YYYYMMDD_HHMMSS_extracted
 
+    def set_drift_tracking(self, enabled=True, update_every=10, downsample=2, min_response=0.05, max_shift=8):
+        """
+        Follow a slowly moving plate: every update_every frames the plate shift is estimated
+        by phase correlation against the first frame and applied to all well coordinates.
+        """
+        if enabled:
+            self.drift_tracker = PlateDriftTracker(downsample=downsample, update_every=update_every, min_response=min_response, max_shift=max_shift)
+        else:
+            self.drift_tracker = None
+
+    def set_result_store(self, result_store, run_name=None, bucket_secs=WellTimePyramid.default_bucket_secs, reuse_run=False):
+        """
+        Append every extracted frame (mean and sd of each well) to a WellResultStore while run_TempExtract() runs,
+        together with min / mean / max summaries per bucket_secs (see WellTimePyramid), None -> no summaries.
+        reuse_run -> write into the latest run called run_name instead of a new run, e.g. when resuming a checkpoint
+        """
+        if result_store is None:
+            self.result_store = None
+            self.run_id = None
+            self.pyramid_bucket_secs = None
+            return
+        if not isinstance(result_store, WellResultStore):
+            raise ValueError("Error: Result store must be a WellResultStore.")
+        self.result_store = result_store
+        self.pyramid_bucket_secs = tuple(bucket_secs) if bucket_secs else None
+        if self.vdo_extractor is not None:
+            source = self.vdo_extractor.vdo_csv
+        else:
+            source = self.frame_dataORpath if isinstance(self.frame_dataORpath, str) else None
+        run_name = run_name or os.path.splitext(self.output_filename)[0]
+        self.run_id = result_store.get_run_id(run_name) if reuse_run else None
+        if self.run_id is None:
+            self.run_id = result_store.create_run(run_name=run_name, source=source, layout=self.layout.name, detect_window=self.detect_window)
+
+    def set_checkpoint(self, checkpoint):
+        """
+        Save extracted rows to an ExtractionCheckpoint, run_TempExtract() then continues after the last saved frame.
+        """
+        if checkpoint is not None and not isinstance(checkpoint, ExtractionCheckpoint):
+            raise ValueError("Error: Checkpoint must be an ExtractionCheckpoint.")
+        self.checkpoint = checkpoint
+
     def get_ref_img_path(self):
         return self.ref_image_path
 
@@ -170,61 +299,343 @@ class WellTempExtractor:
     def get_frame_data_list(self):
         return self.frames_data_list
 
+    def get_drift_log(self):
+        return self.drift_log
+
+    def get_layout(self):
+        return self.layout
+
+    def get_run_id(self):
+        return self.run_id
+
+    def get_pipeline_stats(self):
+        return self.pipeline_stats
+
+    def create_well_index_table(self, wellplate, sensor_temp_df):
+        """
+        Map every labelled well into sensor coordinates once, instead of once per frame.
+        {"well_id": ["A1", ...], "sensor_x": array, "sensor_y": array}
+        """
+        well_ids = []
+        sensor_xs = []
+        sensor_ys = []
+        for a_well in self.labelled_wells:
+            ## Format name from A01 to A1
+            well_ids.append(f"{a_well['well_id'][0]}{int(a_well['well_id'][1:])}")
+            well_coordinate = a_well["well_center"]
+            sensor_x, sensor_y = wellplate.map_sensor_coordinate(sensor_temp_df, well_coordinate[0], well_coordinate[1])
+            sensor_xs.append(sensor_x)
+            sensor_ys.append(sensor_y)
+        return {"well_id": well_ids, "sensor_x": np.array(sensor_xs), "sensor_y": np.array(sensor_ys)}
+
     ### Extraction and export functions
-    def run_TempExtract(self):
+    def get_vdo_frames(self):
+        """
+        Sampled frames of the VDO CSV in reading order (see HikExcelExtractor.iter_frame_arrays()).
+        """
+        return sorted(self.vdo_extractor.sampled_frames, key=lambda a_frame: a_frame["index"])
+
+    def get_first_frame_data(self):
+        if self.vdo_extractor is not None:
+            return next((data for _, data in self.vdo_extractor.iter_frame_arrays(self.get_vdo_frames())), None) # first frame passing the quality checks
+        if self.frames_data_list:
+            return self.frames_data_list[0]["data"]
+        return None
+
+    def iter_frame_data(self, start_frame=0):
+        """
+        Yield (frame_idx, date, time, data) of every frame from start_frame, from the frames list or the VDO CSV.
+        Frames dropped by the HikExcelExtractor quality checks leave their frame_idx out.
+        """
+        if self.vdo_extractor is not None:
+            ## The same frame may be sampled more than once, the position tells the copies apart
+            frames = [{"position": frame_idx, **a_frame} for frame_idx, a_frame in enumerate(self.get_vdo_frames()[start_frame:], start_frame)]
+            for a_frame, data in self.vdo_extractor.iter_frame_arrays(frames):
+                yield (a_frame["position"], *self.vdo_extractor.format_frame_dt(a_frame), data)
+            return
+        for frame_idx, a_frame in enumerate(islice(self.frames_data_list, start_frame, None), start_frame):
+            yield frame_idx, a_frame["date"], a_frame["time"], a_frame["data"] # data as a list
+
+    def count_frames(self):
+        if self.vdo_extractor is not None:
+            return len(self.vdo_extractor.sampled_frames)
+        return len(self.frames_data_list)
+
+    def get_frame_offsets(self):
+        """
+        Byte offset of every frame (by frame_idx) in the VDO CSV, None for other sources.
+        """
+        if self.vdo_extractor is None:
+            return None
+        return [a_frame.get("offset") for a_frame in self.get_vdo_frames()]
+
+    def create_job_key(self):
+        """
+        Everything extracted rows depend on, to check a checkpoint belongs to this job.
+        """
+        if self.vdo_extractor is not None:
+            source = {
+                "file": ExtractionCheckpoint.fingerprint_file(self.vdo_extractor.vdo_csv),
+                "frames": [a_frame["index"] for a_frame in self.get_vdo_frames()],
+                "roi": None if self.vdo_extractor.roi_spans is None else sorted(self.vdo_extractor.roi_spans.items()),
+                "quality": self.vdo_extractor.quality_checks
+            }
+        else:
+            source = {"frames": [(a_frame["date"], a_frame["time"]) for a_frame in self.frames_data_list]}
+        return ExtractionCheckpoint.create_job_key({
+            "source": source,
+            "well_id": self.well_index_table["well_id"],
+            "sensor_x": self.well_index_table["sensor_x"].tolist(),
+            "sensor_y": self.well_index_table["sensor_y"].tolist(),
+            "detect_window": self.detect_window,
+            "drift": None if self.drift_tracker is None else [self.drift_tracker.downsample, self.drift_tracker.update_every, self.drift_tracker.min_response, self.drift_tracker.max_shift]
+        })
+
+    def resume_drift_tracking(self, start_frame=0, drift_shift=None):
+        """
+        Same reference frame and shift as the uninterrupted run when resuming at start_frame.
+        drift_shift -> plate shift at start_frame
+        """
+        if self.drift_tracker is not None and start_frame > 0:
+            self.drift_tracker.set_reference(np.asarray(self.get_first_frame_data(), dtype=np.float64))
+            self.drift_tracker.shift = tuple(drift_shift) if drift_shift is not None else (0.0, 0.0)
+
+    def compute_frame_result(self, wellplate, engine, frame_idx, date_detected, time_detected, data_detected):
+        """
+        Well statistics of one frame: (frame_idx, date, time, avg_well_temps, sd_well_temps) in the order of well_index_table.
+        """
+        if engine == "legacy":
+            data_detected = pd.DataFrame(data_detected) # Convert into dataframe
+        else:
+            data_detected = np.asarray(data_detected, dtype=np.float64)
+
+        ## Well coordinates in sensor space
+        if self.well_index_table is None:
+            self.well_index_table = self.create_well_index_table(wellplate, data_detected)
+        sensor_xs = self.well_index_table["sensor_x"]
+        sensor_ys = self.well_index_table["sensor_y"]
+        if self.drift_tracker is not None:
+            shift = self.drift_tracker.update(frame_idx, np.asarray(data_detected))
+            sensor_xs, sensor_ys = PlateDriftTracker.shift_coordinates(sensor_xs, sensor_ys, shift, data_detected.shape)
+            self.drift_log.append({"Date": date_detected, "Time": time_detected, "dx": shift[0], "dy": shift[1]})
+            self.frame_shifts[frame_idx] = shift
+
+        if engine == "legacy":
+            avg_well_temps = []
+            sd_well_temps = []
+            for sensor_x, sensor_y in zip(sensor_xs, sensor_ys):
+                avg_well_temp, sd_well_temp = WellAnalyzer.get_sensor_temp(data_detected, int(sensor_x), int(sensor_y), detect_window=self.detect_window, precision=2)
+                avg_well_temps.append(avg_well_temp)
+                sd_well_temps.append(sd_well_temp)
+        else:
+            avg_well_temps, sd_well_temps = WellAnalyzer.get_sensor_temps(data_detected, sensor_xs, sensor_ys, detect_window=self.detect_window, precision=2)
+            avg_well_temps = avg_well_temps.tolist()
+            sd_well_temps = sd_well_temps.tolist()
+        return frame_idx, date_detected, time_detected, avg_well_temps, sd_well_temps
+
+    def iter_frame_results(self, wellplate, engine, start_frame=0, drift_shift=None):
+        """
+        Yield (frame_idx, date, time, avg_well_temps, sd_well_temps) of every frame from start_frame, in the order of well_index_table.
+        drift_shift -> plate shift at start_frame when resuming with drift tracking
+        """
+        self.resume_drift_tracking(start_frame, drift_shift)
+        for frame_idx, date_detected, time_detected, data_detected in self.iter_frame_data(start_frame):
+            yield self.compute_frame_result(wellplate, engine, frame_idx, date_detected, time_detected, data_detected)
+
+    def iter_pipelined_results(self, wellplate, engine, threads, start_frame=0, drift_shift=None, queue_size=16):
+        """
+        Same results as iter_frame_results() with reading, well statistics and the caller's writing overlapped:
+        a reader thread parses frames, threads compute threads run the statistics, bounded queues in between.
+        Queue depths and stall times are kept in pipeline_stats.
+        """
+        if self.drift_tracker is not None and threads > 1:
+            raise ValueError("Error: Drift tracking follows the frames one by one, use threads=1.")
+        if self.well_index_table is None: # before the compute threads share it
+            first_data = self.get_first_frame_data()
+            if first_data is None:
+                return
+            self.well_index_table = self.create_well_index_table(wellplate, np.asarray(first_data))
+        self.resume_drift_tracking(start_frame, drift_shift)
+
+        pipeline = FramePipeline(queue_size=queue_size, compute_threads=threads)
+        try:
+            yield from pipeline.run(self.iter_frame_data(start_frame), lambda a_frame: self.compute_frame_result(wellplate, engine, *a_frame))
+        finally:
+            self.pipeline_stats = pipeline.get_stats()
+
+    def iter_parallel_results(self, wellplate, workers, start_frame=0, chunk_frames=None):
+        """
+        Same results as iter_frame_results(engine="vectorized") from a process pool.
+        The sampled frames are cut into contiguous chunks, each worker parses the byte range of its chunk
+        and writes the well statistics into a shared memory array at the position of each frame.
+        Chunks are yielded in frame order as they complete, so the output does not depend on scheduling.
+        """
+        if self.vdo_extractor is None:
+            raise ValueError("Error: Parallel extraction reads the VDO CSV, provide a HikExcelExtractor as frame data.")
+        if self.drift_tracker is not None:
+            raise ValueError("Error: Drift tracking follows the frames one by one, use workers=1.")
+        vdo_extractor = self.vdo_extractor
+        frames = self.get_vdo_frames()[start_frame:]
+
+        ## Well coordinates from the first frame
+        if self.well_index_table is None:
+            self.well_index_table = self.create_well_index_table(wellplate, self.get_first_frame_data())
+        n_frames, n_wells = len(frames), len(self.well_index_table["well_id"])
+        if n_frames == 0:
+            return
+        chunk_frames = chunk_frames or max(1, math.ceil(n_frames / (workers * 4))) # a few chunks per worker for load balance
+
+        results_shape = (2, n_frames, n_wells) # mean, sd
+        results_shm = shared_memory.SharedMemory(create=True, size=max(8 * 2 * n_frames * n_wells, 1))
+        try:
+            results = np.ndarray(results_shape, dtype=np.float64, buffer=results_shm.buf)
+            initargs = (vdo_extractor.vdo_csv, vdo_extractor.roi_spans, vdo_extractor.quality_checks,
+                self.well_index_table["sensor_x"], self.well_index_table["sensor_y"], self.detect_window, results_shm.name, results_shape)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_extract_worker, initargs=initargs) as executor:
+                chunks = []
+                for start in range(0, n_frames, chunk_frames):
+                    ## Only what the reader needs: line index, byte offset, frame count and the result position
+                    chunk = [{"position": position, **{key: frames[position][key] for key in ("index", "offset", "frame") if key in frames[position]}}
+                        for position in range(start, min(start + chunk_frames, n_frames))]
+                    chunks.append(executor.submit(_extract_frame_chunk, chunk))
+
+                for future in chunks:
+                    positions, flagged_frames, dropped_frames = future.result()
+                    vdo_extractor.flagged_frames.update(flagged_frames)
+                    vdo_extractor.dropped_frames.update(dropped_frames)
+                    for position in positions: # dropped frames were not written
+                        date_detected, time_detected = vdo_extractor.format_frame_dt(frames[position])
+                        yield start_frame + position, date_detected, time_detected, results[0, position].tolist(), results[1, position].tolist()
+        finally:
+            results = None # release the view before closing the mapping
+            results_shm.close()
+            results_shm.unlink()
+
+    def run_TempExtract(self, engine="vectorized", workers=1, threads=0, queue_size=16):
         """
         This function run temperature extractor as a full program.
         Start: Provide image, a folder of sensor frame
         Finish: Extract a CSV file
+        engine -> "vectorized": all wells of a frame at once (WellAnalyzer.get_sensor_temps())
+                  "legacy": one well at a time (WellAnalyzer.get_sensor_temp()), same results
+        workers -> processes for the vectorized engine when the frames come from a HikExcelExtractor,
+                   None -> all cores. Results are identical to workers = 1.
+        threads -> > 0: read frames, compute wells and write results concurrently with this many
+                   compute threads and queues of queue_size frames (get_pipeline_stats()), same results.
+        With a checkpoint (set_checkpoint()) saved rows are restored and extraction continues after them.
         """
+        if engine not in ("vectorized", "legacy"):
+            raise ValueError("Error: Engine must be 'vectorized' or 'legacy'.")
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if not (isinstance(workers, int) and workers >= 1):
+            raise ValueError("Error: Workers must be a positive integer.")
+        if workers > 1 and engine != "vectorized":
+            raise ValueError("Error: Parallel extraction uses the vectorized engine.")
+        if not (isinstance(threads, int) and threads >= 0):
+            raise ValueError("Error: Threads must be a non-negative integer.")
+        if workers > 1 and threads > 0:
+            raise ValueError("Error: Use either worker processes or pipeline threads.")
+
         ## Initialize sensor
-        wellplate = WellAnalyzer(reference_image_path=self.ref_image_path)
+        wellplate = WellAnalyzer(reference_image_path=self.ref_image_path, metrics=self.metrics, layout=self.layout)
 
         ## Create Headers and contatiners for data
         # header_row = ["Date", " Time"] + WellAnalyzer.create_well_ids()
         # detected_data_rows = []
 
-        ## run through the data
-        for a_frame in self.frames_data_list:
-            date_detected = a_frame["date"]
-            time_detected = a_frame["time"]
-            data_detected = a_frame["data"] # as a list
-            data_df = pd.DataFrame(data_detected) # Convert into dataframe
-            
-            frame_detected_wells = dict() # for this frame
-
-            for a_well in self.labelled_wells:
-                
-                ## Format name from A01 to A1
-                # well_id = a_well["well_id"]
-                well_row = a_well["well_id"][0]
-                well_col = int(a_well["well_id"][1:])
-                well_id = f"{well_row}{well_col}"
-
-                well_coordinate = a_well["well_center"]
-                sensor_x, sensor_y = wellplate.map_sensor_coordinate(data_df, well_coordinate[0], well_coordinate[1])
-                avg_well_temp, sd_well_temp = WellAnalyzer.get_sensor_temp(data_df, sensor_x, sensor_y, detect_window=self.detect_window, precision=2)
-                frame_detected_wells[well_id] = avg_well_temp
-            
-            # sorted_wells = dict(sorted(frame_detected_wells.items(), key=lambda item: (item[0], int(item[0][1:])))) # A01
-            sorted_wells = dict(sorted(frame_detected_wells.items(), key=lambda item: (item[0][0], int(item[0][1:])))) # A1
+        ## Wells follow the plate out of a ROI set around the undrifted wells, widen it for the run
+        roi_context = nullcontext()
+        if self.drift_tracker is not None and self.vdo_extractor is not None and self.vdo_extractor.roi_spans is not None:
+            roi_context = self.vdo_extractor.use_roi_spans(self.vdo_extractor.widen_roi_spans(math.ceil(self.drift_tracker.max_shift)))
+
+        with roi_context, self.metrics.stage("run_TempExtract", wells=len(self.labelled_wells), detect_window=self.detect_window, engine=engine, workers=workers, threads=threads) as record:
+            ## Resume: rows of the checkpoint first, then the remaining frames
+            start_frame = 0
+            drift_shift = None
+            restored_results = []
+            if self.checkpoint is not None:
+                if self.well_index_table is None:
+                    first_data = self.get_first_frame_data()
+                    if first_data is not None:
+                        self.well_index_table = self.create_well_index_table(wellplate, np.asarray(first_data))
+                if self.well_index_table is not None:
+                    restored_rows = self.checkpoint.load_rows(self.create_job_key())
+                    start_frame = restored_rows[-1]["frame_idx"] + 1 if restored_rows else 0 # dropped frames have no row
+                    for row in restored_rows:
+                        restored_results.append((row["frame_idx"], row["date"], row["time"], row["mean"], row["sd"]))
+                        if row["shift"] is not None:
+                            drift_shift = row["shift"]
+                            self.drift_log.append({"Date": row["date"], "Time": row["time"], "dx": drift_shift[0], "dy": drift_shift[1]})
+
+            if workers > 1:
+                frame_results = self.iter_parallel_results(wellplate, workers, start_frame=start_frame)
+            elif threads > 0:
+                frame_results = self.iter_pipelined_results(wellplate, engine, threads, start_frame=start_frame, drift_shift=drift_shift, queue_size=queue_size)
+            else:
+                frame_results = self.iter_frame_results(wellplate, engine, start_frame=start_frame, drift_shift=drift_shift)
+
+            completed = False
+            try:
+                frame_offsets = self.get_frame_offsets() if self.checkpoint is not None else None # once, not per row
+                self.emit_frame_results(chain(restored_results, frame_results), start_frame, frame_offsets=frame_offsets)
+                completed = True
+            finally:
+                if self.checkpoint is not None and self.checkpoint.get_state() is not None:
+                    self.checkpoint.close(complete=completed) # rows extracted so far are kept on errors
+            record["frames"] = self.count_frames()
+            record["resumed_frames"] = start_frame
+            if self.vdo_extractor is not None and self.vdo_extractor.quality_checks["mode"] is not None:
+                record["flagged_frames"] = len(self.vdo_extractor.flagged_frames)
+                record["dropped_frames"] = len(self.vdo_extractor.dropped_frames)
+            if threads > 0:
+                record["pipeline"] = self.pipeline_stats
+
+    def emit_frame_results(self, frame_results, start_frame=0, frame_offsets=None):
+        """
+        Collect (frame_idx, date, time, avg_well_temps, sd_well_temps) rows into extracted_well_data,
+        the result store and the checkpoint (frames from start_frame).
+        frame_offsets -> byte offset of every frame_idx saved with the checkpoint rows (get_frame_offsets())
+        """
+        well_order = None # column order A1, A2, ..., H12
+        time_pyramid = None
+        for frame_idx, date_detected, time_detected, avg_well_temps, sd_well_temps in frame_results:
+            shift = self.frame_shifts.pop(frame_idx, None) # computed frames may run ahead of this one
+            if self.checkpoint is not None and frame_idx >= start_frame:
+                self.checkpoint.append_row(frame_idx, date_detected, time_detected, avg_well_temps, sd_well_temps, shift=None if shift is None else list(shift), offset=None if frame_offsets is None else frame_offsets[frame_idx])
+            if well_order is None:
+                well_ids = self.well_index_table["well_id"]
+                well_order = sorted(range(len(well_ids)), key=lambda idx: (well_ids[idx][0], int(well_ids[idx][1:]))) # A1
+
+            sorted_wells = {self.well_index_table["well_id"][idx]: avg_well_temps[idx] for idx in well_order}
+            if self.result_store is not None:
+                self.result_store.append_frame(self.run_id, frame_idx, date_detected, time_detected, self.well_index_table["well_id"], avg_well_temps, sd_well_temps)
+                if self.pyramid_bucket_secs:
+                    if time_pyramid is None:
+                        time_pyramid = WellTimePyramid(self.well_index_table["well_id"], bucket_secs=self.pyramid_bucket_secs)
+                    completed_buckets = time_pyramid.update(WellResultStore.format_tst(date_detected, time_detected), avg_well_temps)
+                    self.result_store.append_buckets(self.run_id, time_pyramid.well_ids, completed_buckets)
             row_data = {
                 "Date": date_detected,
                 "Time":time_detected,
                 **sorted_wells
             }
             self.extracted_well_data.append(row_data)
+        if self.result_store is not None:
+            if time_pyramid is not None:
+                self.result_store.append_buckets(self.run_id, time_pyramid.well_ids, time_pyramid.finish())
+            self.result_store.flush()
     
     def get_extractedDF(self):
         if not self.extracted_well_data:
-            print("Error: No data available to export. Please run_TempExtract().")
+            logger.error("Error: No data available to export. Please run_TempExtract().")
             return None
         extracted_df = pd.DataFrame(self.extracted_well_data)
         return extracted_df
 
     def get_extractedCSV(self):
         if not self.extracted_well_data:
-            print("Error: No data available to export. Please run_TempExtract().")
+            logger.error("Error: No data available to export. Please run_TempExtract().")
             return None
         ## Create output filename
         output_file_path = os.path.join(self.output_path, self.output_filename)
@@ -234,9 +645,29 @@ class WellTempExtractor:
             os.remove(output_file_path)
         
         ## Exported
-        extracted_df = pd.DataFrame(self.extracted_well_data)
-        extracted_df.to_csv(output_file_path, index=False)
+        with self.metrics.stage("get_extractedCSV", file=output_file_path) as record:
+            extracted_df = pd.DataFrame(self.extracted_well_data)
+            extracted_df.to_csv(output_file_path, index=False)
+            record["frames"] = len(extracted_df)
+            record["bytes"] = os.path.getsize(output_file_path)
 
-        print(f"Success: Exported to {output_file_path}")
+        logger.info(f"Success: Exported to {output_file_path}")
+
+    def get_extractedCompact(self, decimals=2, block_frames=4096, compression="zlib"):
+        """
+        Export to a compact file next to the CSV (<output_filename>.mfz, see HikDataManager.write_compact()),
+        read it back with HikDataManager.read_compact().
+        """
+        if not self.extracted_well_data:
+            logger.error("Error: No data available to export. Please run_TempExtract().")
+            return None
+        output_file_path = os.path.join(self.output_path, os.path.splitext(self.output_filename)[0] + HikDataManager.compact_suffix)
 
+        with self.metrics.stage("get_extractedCompact", file=output_file_path, compression=compression) as record:
+            extracted_df = pd.DataFrame(self.extracted_well_data)
+            HikDataManager.write_compact(output_file_path, extracted_df, decimals=decimals, block_frames=block_frames, compression=compression)
+            record["frames"] = len(extracted_df)
+            record["bytes"] = os.path.getsize(output_file_path)
 
+        logger.info(f"Success: Exported to {output_file_path}")
+        return output_file_path